@@ -1,3 +1,94 @@
 from django.contrib import admin
 
-# Register your models here.
+from common.admin import KeysetAdminMixin
+from .models import OTPDelivery, User, UserDeletion, UserProfile
+
+
+@admin.register(User)
+class UserAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    """
+    Admin of the users, also the target of the user autocomplete widgets.
+
+    The search matches prefixes of the unique phone number and email, which
+    their indexes answer.
+    """
+
+    list_display = [
+        "id",
+        "phone_number",
+        "email",
+        "first_name",
+        "last_name",
+        "is_active",
+        "is_staff",
+        "created_at",
+    ]
+    list_filter = ["is_active", "is_staff"]
+    search_fields = ["^phone_number", "^email"]
+    exclude = ["otp"]
+    readonly_fields = ["last_login", "date_joined"]
+    autocomplete_fields = ["groups"]
+    filter_horizontal = ["user_permissions"]
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    list_display = ["id", "user", "address", "updated_at"]
+    list_select_related = ["user"]
+    autocomplete_fields = ["user"]
+
+
+@admin.register(UserDeletion)
+class UserDeletionAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    """
+    Read-only progress of the background user deletions.
+    """
+
+    # the user row is gone once the deletion is done, show its id only
+    list_display = [
+        "id",
+        "user_id",
+        "step",
+        "deleted_rows",
+        "attempts",
+        "finished_at",
+        "updated_at",
+    ]
+    list_filter = [("finished_at", admin.EmptyFieldListFilter)]
+    fields = ["user_id", "step", "deleted_rows", "attempts", "finished_at"]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OTPDelivery)
+class OTPDeliveryAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    """
+    Read-only log of the OTPs sent by SMS, without the OTPs.
+    """
+
+    list_display = [
+        "id",
+        "user",
+        "phone_number",
+        "status",
+        "attempts",
+        "error",
+        "sent_at",
+        "created_at",
+    ]
+    list_filter = ["status"]
+    list_select_related = ["user"]
+    search_fields = ["^phone_number"]
+    fields = ["user", "phone_number", "status", "attempts", "error", "sent_at"]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,178 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from chat.archive import purge_archived_messages
+from chat.models import Message, RecurringMessage, SyncTombstone
+from chat.sharding import message_shards
+from chat.sync import record_message_tombstones
+from common.cache import MAILBOX_VERSION, PROFILE_VERSION, bump_version
+from .models import User, UserDeletion
+
+MESSAGES_STEP = "messages"
+ARCHIVE_STEP = "archive"
+# archive segments hold up to a month of messages, they are purged in
+# smaller batches than rows
+ARCHIVE_SEGMENTS_PER_BATCH = 10
+DONE_STEP = "done"
+
+
+def request_user_deletion(user):
+    """
+    Deactivate a user at once and record the pending deletion of their data.
+
+    The user can no longer log in or authenticate, the rows are deleted
+    afterwards by the `accounts.tasks.delete_user_data` task.
+
+    Returns:
+        UserDeletion: The new or already pending deletion.
+    """
+    User.objects.filter(pk=user.pk).update(is_active=False, updated_at=timezone.now())
+    bump_version(PROFILE_VERSION, [user.pk])
+    deletion, _ = UserDeletion.objects.get_or_create(user_id=user.pk)
+    return deletion
+
+
+def user_relations():
+    """
+    Return (step, model, attname) for every relation referencing a user.
+
+    Every relation to the user is covered, reverse foreign keys and both sides
+    of many-to-many relations, except the messages, which live on the shards
+    and are deleted by `delete_messages_batch`, and the deletion record. The
+    user's archive segments are left to `purge_archived_messages`, which
+    also purges the peers' segments, and are normally gone by then. The
+    user's sync tombstones go last, deleting the other rows records some.
+    """
+    relations = []
+    for relation in User._meta.related_objects:
+        model = relation.related_model
+        if model in (Message, UserDeletion):
+            continue
+        if relation.many_to_many:
+            field = relation.field
+            model = field.remote_field.through
+            attname = model._meta.get_field(field.m2m_reverse_field_name()).attname
+        else:
+            attname = relation.field.attname
+        relations.append((f"{model._meta.label_lower}.{attname}", model, attname))
+    for field in User._meta.many_to_many:
+        model = field.remote_field.through
+        attname = model._meta.get_field(field.m2m_field_name()).attname
+        relations.append((f"{model._meta.label_lower}.{attname}", model, attname))
+    relations.sort(key=lambda relation: relation[1] is SyncTombstone)
+    return relations
+
+
+def delete_messages_batch(user_id, batch_size):
+    """
+    Delete up to `batch_size` messages sent or received by a user.
+
+    The cascade of Message is not run, it would read the shard's relations
+    from the wrong database. Its effects are applied by hand: recurring
+    messages built on the deleted messages are deleted, replies written by
+    other users are kept without their parent, and the peers' clients get
+    tombstones and fresh mailbox versions.
+
+    Returns:
+        int: Number of deleted messages, 0 when none are left.
+    """
+    for alias in message_shards():
+        messages = list(
+            Message.objects.using(alias)
+            .filter(Q(sender_id=user_id) | Q(receiver_id=user_id))
+            .values_list("id", "sender_id", "receiver_id")[:batch_size]
+        )
+        if not messages:
+            continue
+        ids = [message_id for message_id, _, _ in messages]
+        peer_ids = {
+            peer_id
+            for _, sender_id, receiver_id in messages
+            for peer_id in (sender_id, receiver_id)
+        } - {user_id}
+        with transaction.atomic(using=alias), transaction.atomic():
+            RecurringMessage.objects.filter(message_id__in=ids).delete()
+            record_message_tombstones(messages, exclude_user_id=user_id)
+            Message.objects.using(alias).filter(parent_id__in=ids).exclude(
+                id__in=ids
+            ).update(parent=None)
+            Message.objects.using(alias).filter(id__in=ids)._raw_delete(alias)
+        bump_version(MAILBOX_VERSION, peer_ids)
+        return len(ids)
+    return 0
+
+
+def delete_related_batch(model, attname, user_id, batch_size):
+    """
+    Delete up to `batch_size` rows of `model` whose `attname` is the user
+    """
+    pks = list(
+        model._base_manager.filter(**{attname: user_id}).values_list("pk", flat=True)[
+            :batch_size
+        ]
+    )
+    if pks:
+        model._base_manager.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def deletion_steps(user_id, batch_size):
+    """
+    Return (step, batch) pairs, `batch()` deleting one batch of the step
+    """
+    steps = [
+        (MESSAGES_STEP, lambda: delete_messages_batch(user_id, batch_size)),
+        (
+            ARCHIVE_STEP,
+            lambda: purge_archived_messages(user_id, ARCHIVE_SEGMENTS_PER_BATCH),
+        ),
+    ]
+    for step, model, attname in user_relations():
+        steps.append(
+            (
+                step,
+                lambda model=model, attname=attname: delete_related_batch(
+                    model, attname, user_id, batch_size
+                ),
+            )
+        )
+    return steps
+
+
+def delete_user_data(deletion, batch_size=500, max_batches=None):
+    """
+    Delete the rows of a user in batches, then the user.
+
+    Every batch commits on its own and only selects rows still referencing
+    the user, so an interrupted deletion is resumed by running it again.
+    The progress is stored on `deletion` after each batch.
+
+    Args:
+        deletion (UserDeletion): The deletion to run.
+        batch_size (int): Number of rows deleted per batch.
+        max_batches (int): Stop after this many batches, None to finish.
+
+    Returns:
+        bool: Whether the deletion is finished.
+    """
+    batches = 0
+    for step, batch in deletion_steps(deletion.user_id, batch_size):
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                return False
+            deleted = batch()
+            batches += 1
+            if not deleted:
+                break
+            UserDeletion.objects.filter(pk=deletion.pk).update(
+                step=step,
+                deleted_rows=F("deleted_rows") + deleted,
+                updated_at=timezone.now(),
+            )
+
+    User.objects.filter(pk=deletion.user_id).delete()
+    UserDeletion.objects.filter(pk=deletion.pk).update(
+        step=DONE_STEP, finished_at=timezone.now(), updated_at=timezone.now()
+    )
+    return True
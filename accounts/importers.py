@@ -0,0 +1,245 @@
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DataError, IntegrityError, connections, transaction
+from django.db.models import Q
+
+from .models import User, UserProfile
+
+IMPORT_FORMATS = ("csv", "ndjson")
+REQUIRED_FIELDS = ("first_name", "last_name", "email", "phone_number")
+
+
+def iter_lines(stream):
+    """
+    Yield the lines of a binary or text stream, decoded one by one so an
+    undecodable line is yielded as its UnicodeDecodeError
+    """
+    if not isinstance(stream.read(0), bytes):
+        yield from stream
+        return
+
+    for number, line in enumerate(stream):
+        try:
+            yield line.decode("utf-8-sig" if number == 0 else "utf-8")
+        except UnicodeDecodeError as exc:
+            yield exc
+
+
+def iter_rows(stream, file_format):
+    """
+    Yield (row number, row) pairs from a binary or text CSV/NDJSON stream.
+
+    A row that cannot be read is yielded as `{"__error__": reason}`, the
+    following rows are still read.
+    """
+    if file_format == "csv":
+        decode_errors = []
+
+        def decoded_lines():
+            for line in iter_lines(stream):
+                if isinstance(line, UnicodeDecodeError):
+                    decode_errors.append(line)
+                    # keep the columns of the line for the rows after it
+                    line = line.object.decode("utf-8", "replace")
+                yield line
+
+        for number, row in enumerate(csv.DictReader(decoded_lines()), start=1):
+            if decode_errors:
+                yield number, {"__error__": f"Invalid UTF-8: {decode_errors[0]}"}
+                decode_errors.clear()
+            else:
+                yield number, row
+        return
+
+    for number, line in enumerate(iter_lines(stream), start=1):
+        if isinstance(line, UnicodeDecodeError):
+            yield number, {"__error__": f"Invalid UTF-8: {line}"}
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, {"__error__": f"Invalid JSON: {exc}"}
+            continue
+        if isinstance(row, dict):
+            yield number, row
+        else:
+            yield number, {"__error__": "Each line must be a JSON object."}
+
+
+def iter_batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def clean_row(row):
+    """
+    Validate an imported row and return its cleaned values
+    """
+    if "__error__" in row:
+        raise ValidationError(row["__error__"])
+
+    data = {field: str(row.get(field) or "").strip() for field in REQUIRED_FIELDS}
+    data["address"] = str(row.get("address") or "").strip() or None
+    errors = [f"{field} is required." for field in REQUIRED_FIELDS if not data[field]]
+    if errors:
+        raise ValidationError(errors)
+
+    validate_email(data["email"])
+    for field in REQUIRED_FIELDS:
+        # the model's validators, max_length included
+        User._meta.get_field(field).run_validators(data[field])
+    return data
+
+
+def create_users(rows):
+    """
+    Insert cleaned rows with one bulk insert for users and one for profiles
+    """
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [
+                User(
+                    first_name=row["first_name"],
+                    last_name=row["last_name"],
+                    email=row["email"],
+                    phone_number=row["phone_number"],
+                )
+                for _, row in rows
+            ]
+        )
+        user_ids = dict(
+            User.objects.filter(
+                phone_number__in=[row["phone_number"] for _, row in rows]
+            ).values_list("phone_number", "id")
+        )
+        UserProfile.objects.bulk_create(
+            [
+                UserProfile(
+                    user_id=user_ids[row["phone_number"]], address=row["address"]
+                )
+                for _, row in rows
+            ]
+        )
+
+
+def import_batch(batch):
+    """
+    Import a batch of (row number, row) pairs.
+
+    Rows are validated and deduplicated on phone_number and email, against the
+    batch itself and against existing users with a single lookup, then created
+    in bulk. If the bulk insert still conflicts with a concurrent import, or
+    the database rejects a value, the batch is retried row by row so only the
+    failing rows are reported.
+
+    Returns:
+        dict: Number of created users and the errors of the rejected rows.
+    """
+    errors = []
+    valid = []
+    phone_numbers = set()
+    emails = set()
+    for number, row in batch:
+        try:
+            data = clean_row(row)
+        except ValidationError as exc:
+            errors.append({"row": number, "errors": exc.messages})
+            continue
+        if data["phone_number"] in phone_numbers or data["email"] in emails:
+            errors.append({"row": number, "errors": ["Duplicate row in file."]})
+            continue
+        phone_numbers.add(data["phone_number"])
+        emails.add(data["email"])
+        valid.append((number, data))
+
+    existing = User.objects.filter(
+        Q(phone_number__in=phone_numbers) | Q(email__in=emails)
+    ).values_list("phone_number", "email")
+    existing_phone_numbers = {phone_number for phone_number, _ in existing}
+    existing_emails = {email for _, email in existing}
+
+    rows = []
+    for number, data in valid:
+        if (
+            data["phone_number"] in existing_phone_numbers
+            or data["email"] in existing_emails
+        ):
+            errors.append({"row": number, "errors": ["User already exists."]})
+        else:
+            rows.append((number, data))
+
+    created = 0
+    if rows:
+        try:
+            create_users(rows)
+            created = len(rows)
+        except (IntegrityError, DataError):
+            for number, data in rows:
+                try:
+                    create_users([(number, data)])
+                    created += 1
+                except IntegrityError:
+                    errors.append(
+                        {"row": number, "errors": ["User already exists."]}
+                    )
+                except DataError as exc:
+                    errors.append({"row": number, "errors": [f"Invalid data: {exc}"]})
+
+    return {"created": created, "errors": errors}
+
+
+def close_connections():
+    # forked workers must not share the parent's database sockets
+    connections.close_all()
+
+
+def import_users(rows, batch_size=1000, workers=1):
+    """
+    Import users from an iterable of (row number, row) pairs.
+
+    Args:
+        rows: Iterable of (row number, row) pairs, e.g. from `iter_rows`.
+        batch_size (int): Number of rows deduplicated and inserted together.
+        workers (int): Number of worker processes, 1 imports in-process.
+
+    Returns:
+        dict: Number of processed rows, created users and per-row errors.
+    """
+    report = {"processed": 0, "created": 0, "errors": []}
+
+    def collect(batch, result):
+        report["processed"] += len(batch)
+        report["created"] += result["created"]
+        report["errors"].extend(result["errors"])
+
+    if workers <= 1:
+        for batch in iter_batches(rows, batch_size):
+            collect(batch, import_batch(batch))
+    else:
+        close_connections()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=close_connections
+        ) as pool:
+            pending = []
+            for batch in iter_batches(rows, batch_size):
+                pending.append((batch, pool.submit(import_batch, batch)))
+                # bound the number of batches held in memory
+                if len(pending) >= workers * 2:
+                    batch, future = pending.pop(0)
+                    collect(batch, future.result())
+            for batch, future in pending:
+                collect(batch, future.result())
+
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
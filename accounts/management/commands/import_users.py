@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importers import IMPORT_FORMATS, import_users, iter_rows
+
+
+class Command(BaseCommand):
+    """
+    Bulk import users and their profiles from a CSV or NDJSON file.
+
+    Rows need first_name, last_name, email and phone_number, address is
+    optional. Invalid or duplicate rows are reported and skipped.
+    """
+
+    help = "Bulk import users from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=IMPORT_FORMATS,
+            help="File format (default: guessed from the file extension).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--report", help="Write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or (
+            "csv" if options["path"].endswith(".csv") else "ndjson"
+        )
+        try:
+            stream = open(options["path"], "rb")
+        except OSError as exc:
+            raise CommandError(exc)
+
+        with stream:
+            report = import_users(
+                iter_rows(stream, file_format),
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+
+        if options["report"]:
+            with open(options["report"], "w") as report_file:
+                json.dump(report, report_file, indent=2)
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {' '.join(error['errors'])}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {report['processed']} rows, created {report['created']} "
+                f"users, rejected {len(report['errors'])} rows."
+            )
+        )
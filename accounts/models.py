@@ -40,3 +40,66 @@ class UserProfile(Base):
 
     def __str__(self):
         return f"{self.user.first_name} - Profile"
+
+
+class UserDeletion(Base):
+    """
+    Progress of the background deletion of a user's data.
+
+    The user is deactivated when the deletion is requested, its rows are then
+    deleted in batches by the `accounts.tasks.delete_user_data` task. `step`
+    names the relation being deleted, "done" once the user row is gone.
+    """
+
+    # kept after the user row is deleted, as a record of the deletion
+    user = models.OneToOneField(
+        "User",
+        on_delete=models.DO_NOTHING,
+        related_name="deletion",
+        db_constraint=False,
+    )
+    step = models.CharField(max_length=100, blank=True, default="")
+    deleted_rows = models.PositiveBigIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["finished_at", "updated_at"])]
+
+    def __str__(self):
+        return f"Deletion of user {self.user_id} - {self.step or 'pending'}"
+
+
+class OTPDelivery(Base):
+    """
+    An OTP to be sent to a user by SMS.
+
+    The login view writes a pending row, the `accounts.tasks.deliver_otps`
+    task sends the pending rows in batches through the SMS gateway. The OTP
+    itself is read from the user when it is sent, so only the latest one
+    reaches the phone.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    user = models.ForeignKey(
+        "User", on_delete=models.CASCADE, related_name="otp_deliveries"
+    )
+    phone_number = models.CharField(max_length=17)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True, default="")
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"OTP to {self.phone_number} - {self.status}"
@@ -0,0 +1,140 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OTPDelivery
+from .sms import SMSGatewayError, SMSMessage, get_sms_gateway
+
+OTP_DELIVERY_SCHEDULED = "otp-delivery:scheduled"
+
+
+def otp_message(otp):
+    return f"Your login code is {otp}."
+
+
+def schedule_otp_delivery():
+    """
+    Enqueue the `deliver_otps` task with a countdown of
+    settings.OTP_DELIVERY_DELAY_MS, unless it is already waiting to run
+    """
+    from .tasks import deliver_otps
+
+    delay = settings.OTP_DELIVERY_DELAY_MS / 1000
+    # expires in case the task is lost, so a later login enqueues it again
+    if cache.add(OTP_DELIVERY_SCHEDULED, True, timeout=max(int(delay) * 10, 60)):
+        transaction.on_commit(lambda: deliver_otps.apply_async(countdown=delay))
+
+
+def request_otp_delivery(user):
+    """
+    Queue the SMS with the current OTP of a user.
+
+    The OTPs queued within settings.OTP_DELIVERY_DELAY_MS of each other are
+    sent in one batch.
+
+    Returns:
+        OTPDelivery: The pending delivery.
+    """
+    delivery = OTPDelivery.objects.create(user=user, phone_number=user.phone_number)
+    schedule_otp_delivery()
+    return delivery
+
+
+def expire_otp_deliveries():
+    """
+    Mark the pending deliveries older than settings.OTP_DELIVERY_EXPIRY_SECONDS
+    as failed, the user has to log in again for another OTP
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.OTP_DELIVERY_EXPIRY_SECONDS)
+    return OTPDelivery.objects.filter(
+        status=OTPDelivery.PENDING, created_at__lt=cutoff
+    ).update(status=OTPDelivery.FAILED, error="Expired.", updated_at=timezone.now())
+
+
+def deliver_pending_otps(max_batches=None):
+    """
+    Send the pending OTP deliveries in batches through the SMS gateway.
+
+    Deliveries of the same user in a batch are sent as one SMS with the
+    user's current OTP, the earlier OTPs are no longer valid.
+
+    Args:
+        max_batches (int): Batches sent before returning, all by default.
+
+    Returns:
+        int: Number of deliveries sent.
+
+    Raises:
+        SMSGatewayError: The gateway is unavailable or did not answer a result
+                         per message. The attempt is counted on
+                         the batch, which is marked failed after
+                         settings.OTP_DELIVERY_MAX_ATTEMPTS attempts.
+    """
+    gateway = get_sms_gateway()
+    expire_otp_deliveries()
+    sent = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        deliveries = list(
+            OTPDelivery.objects.filter(status=OTPDelivery.PENDING)
+            .select_related("user")
+            .order_by("id")[: gateway.max_batch_size]
+        )
+        if not deliveries:
+            break
+        batches += 1
+
+        by_user = {}
+        for delivery in deliveries:
+            by_user.setdefault(delivery.user_id, []).append(delivery)
+        groups = list(by_user.values())
+        messages = [
+            SMSMessage(group[-1].phone_number, otp_message(group[-1].user.otp))
+            for group in groups
+        ]
+
+        try:
+            results = gateway.send_messages(messages)
+            if len(results) != len(messages):
+                raise SMSGatewayError(
+                    f"The gateway answered {len(results)} results for "
+                    f"{len(messages)} messages."
+                )
+        except SMSGatewayError:
+            ids = [delivery.id for delivery in deliveries]
+            now = timezone.now()
+            OTPDelivery.objects.filter(pk__in=ids).update(
+                attempts=F("attempts") + 1, updated_at=now
+            )
+            OTPDelivery.objects.filter(
+                pk__in=ids, attempts__gte=settings.OTP_DELIVERY_MAX_ATTEMPTS
+            ).update(
+                status=OTPDelivery.FAILED, error="Gateway unavailable.", updated_at=now
+            )
+            raise
+
+        now = timezone.now()
+        sent_ids = []
+        for group, error in zip(groups, results):
+            ids = [delivery.id for delivery in group]
+            if error:
+                OTPDelivery.objects.filter(pk__in=ids).update(
+                    status=OTPDelivery.FAILED,
+                    attempts=F("attempts") + 1,
+                    error=str(error)[:255],
+                    updated_at=now,
+                )
+            else:
+                sent_ids.extend(ids)
+        OTPDelivery.objects.filter(pk__in=sent_ids).update(
+            status=OTPDelivery.SENT,
+            attempts=F("attempts") + 1,
+            sent_at=now,
+            updated_at=now,
+        )
+        sent += len(sent_ids)
+    return sent
@@ -2,15 +2,18 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from common.helper import save_user_img
+from common.serializers import SparseFieldsetMixin
+from .importers import IMPORT_FORMATS
 from .models import User, UserProfile
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for the User model.
 
     This serializer handles the serialization and deserialization of User objects,
     including creation and updating of user profiles.
+    GET requests can limit the fields with `?fields=`, see SparseFieldsetMixin.
 
     Attributes:
         profile: A SerializerMethodField representing the user's profile information.
@@ -138,3 +141,16 @@ class OtpVerifySerializer(serializers.Serializer):
         if "otp" not in data and not data["otp"]:
             raise ValidationError({"phone_number": "Please Enter an OTP."})
         return data
+
+
+class UserImportSerializer(serializers.Serializer):
+    """
+    Serializer for bulk user imports.
+
+    Attributes:
+        file: FileField representing the uploaded CSV or NDJSON file.
+        format: ChoiceField representing the file format.
+    """
+
+    file = serializers.FileField(write_only=True)
+    format = serializers.ChoiceField(choices=IMPORT_FORMATS, default="csv")
@@ -0,0 +1,44 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from common.cache import PROFILE_VERSION, bump_version
+from .models import User, UserProfile
+
+# Fields written by the login flow, they are not part of the user's profile.
+LOGIN_FIELDS = {"otp", "last_login"}
+
+
+@receiver(post_save, sender=User)
+def user_profile_update(sender, instance, update_fields, **kwargs):
+    """
+    Signal receiver function triggered after saving a User object.
+
+    This function bumps the user's profile version, so cached user details are
+    invalidated. Saves limited to login bookkeeping fields are ignored.
+
+    Args:
+        sender: The model class that sends the signal (User in this case).
+        instance: The User instance that was saved.
+        update_fields: The fields passed to `save`, if any.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    if update_fields and set(update_fields) <= LOGIN_FIELDS:
+        return
+    bump_version(PROFILE_VERSION, [instance.id])
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_update(sender, instance, **kwargs):
+    """
+    Signal receiver function triggered after saving a UserProfile object.
+
+    This function bumps the profile version of the profile's user.
+
+    Args:
+        sender: The model class that sends the signal (UserProfile in this case).
+        instance: The UserProfile instance that was saved.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    bump_version(PROFILE_VERSION, [instance.user_id])
@@ -0,0 +1,133 @@
+import json
+import logging
+from collections import namedtuple
+from urllib import error, request as urllib_request
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SMSMessage = namedtuple("SMSMessage", ["phone_number", "body"])
+
+# messages sent through LocMemSMSGateway, for tests and benchmarks
+outbox = []
+
+_gateway = None
+
+
+class SMSGatewayError(Exception):
+    """
+    Temporary failure of a gateway, none of the messages were sent
+    """
+
+
+class BaseSMSGateway:
+    """
+    Adapter of an SMS gateway, selected with settings.OTP_SMS_GATEWAY.
+
+    Attributes:
+        max_batch_size: Number of messages the gateway accepts in one call.
+    """
+
+    max_batch_size = 1
+
+    def send_messages(self, messages):
+        """
+        Send up to `max_batch_size` messages in one call.
+
+        Args:
+            messages (list): SMSMessage tuples.
+
+        Returns:
+            list: Per message, None if it was accepted or the reason it was
+                  rejected, which is not retried.
+
+        Raises:
+            SMSGatewayError: The batch can be sent again later.
+        """
+        raise NotImplementedError
+
+
+class ConsoleSMSGateway(BaseSMSGateway):
+    """
+    Gateway logging the messages instead of sending them, for development
+    """
+
+    max_batch_size = 100
+
+    def send_messages(self, messages):
+        for message in messages:
+            logger.info("SMS to %s: %s", message.phone_number, message.body)
+        return [None] * len(messages)
+
+
+class LocMemSMSGateway(BaseSMSGateway):
+    """
+    Gateway appending the messages to `accounts.sms.outbox`, for tests
+    """
+
+    max_batch_size = 100
+
+    def send_messages(self, messages):
+        outbox.extend(messages)
+        return [None] * len(messages)
+
+
+class HTTPSMSGateway(BaseSMSGateway):
+    """
+    Gateway with a JSON bulk submit endpoint.
+
+    The messages are POSTed to settings.SMS_GATEWAY_URL as
+    `{"messages": [{"to": ..., "body": ...}]}` with the bearer token
+    settings.SMS_GATEWAY_TOKEN. The gateway answers
+    `{"results": [{"error": null}, ...]}` in the order of the messages.
+    Subclass it to adapt another provider's payload.
+    """
+
+    def __init__(self):
+        self.url = settings.SMS_GATEWAY_URL
+        self.token = settings.SMS_GATEWAY_TOKEN
+        self.timeout = settings.SMS_GATEWAY_TIMEOUT
+        self.max_batch_size = settings.SMS_GATEWAY_BATCH_SIZE
+
+    def build_payload(self, messages):
+        return {
+            "messages": [
+                {"to": message.phone_number, "body": message.body}
+                for message in messages
+            ]
+        }
+
+    def parse_results(self, data, messages):
+        return [result.get("error") for result in data["results"]]
+
+    def send_messages(self, messages):
+        http_request = urllib_request.Request(
+            self.url,
+            data=json.dumps(self.build_payload(messages)).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.token}",
+            },
+            method="POST",
+        )
+        try:
+            with urllib_request.urlopen(http_request, timeout=self.timeout) as response:
+                return self.parse_results(json.load(response), messages)
+        except error.HTTPError as exc:
+            if exc.code == 429 or exc.code >= 500:
+                raise SMSGatewayError(f"The gateway answered {exc.code}.") from exc
+            return [f"Rejected by the gateway ({exc.code})."] * len(messages)
+        except (OSError, ValueError, KeyError) as exc:
+            raise SMSGatewayError(str(exc)) from exc
+
+
+def get_sms_gateway():
+    """
+    Return the gateway of this process, configured from settings
+    """
+    global _gateway
+    if _gateway is None:
+        _gateway = import_string(settings.OTP_SMS_GATEWAY)()
+    return _gateway
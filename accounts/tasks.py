@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from accounts import deletion as user_deletion
+from accounts.models import OTPDelivery, UserDeletion
+from accounts.otp import (
+    OTP_DELIVERY_SCHEDULED,
+    deliver_pending_otps,
+    schedule_otp_delivery,
+)
+from accounts.sms import SMSGatewayError
+
+USER_DELETION_LOCK = "user-deletion:{}"
+OTP_DELIVERY_LOCK = "otp-delivery:lock"
+OTP_DELIVERY_BATCHES_PER_TASK = 10
+
+
+@shared_task(
+    name="accounts.tasks.delete_user_data",
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def delete_user_data(user_id):
+    """
+    Celery task for deleting the data of a deactivated user.
+
+    This task deletes up to settings.USER_DELETION_BATCHES_PER_TASK batches
+    of settings.USER_DELETION_BATCH_SIZE rows, then enqueues itself again
+    until the user is deleted, so a large history never holds a worker for
+    long. A cache lock keeps two tasks from deleting the same user at once.
+
+    Args:
+        user_id (int): ID of the user being deleted.
+
+    Returns:
+        bool: True if the deletion is finished.
+    """
+    deletion = UserDeletion.objects.filter(
+        user_id=user_id, finished_at__isnull=True
+    ).first()
+    if deletion is None:
+        return True
+
+    lock = USER_DELETION_LOCK.format(user_id)
+    if not cache.add(lock, True, timeout=settings.USER_DELETION_STALL_MINUTES * 60):
+        return False
+    try:
+        UserDeletion.objects.filter(pk=deletion.pk).update(attempts=F("attempts") + 1)
+        finished = user_deletion.delete_user_data(
+            deletion,
+            batch_size=settings.USER_DELETION_BATCH_SIZE,
+            max_batches=settings.USER_DELETION_BATCHES_PER_TASK,
+        )
+    finally:
+        cache.delete(lock)
+
+    if not finished:
+        delete_user_data.delay(user_id)
+    return finished
+
+
+@shared_task(name="accounts.tasks.resume_user_deletions")
+def resume_user_deletions(minutes=None):
+    """
+    Celery task for resuming interrupted user deletions.
+
+    This task enqueues `delete_user_data` again for the unfinished deletions
+    without progress for `minutes` (settings.USER_DELETION_STALL_MINUTES by
+    default), e.g. after a worker was killed or the retries were exhausted.
+
+    Args:
+        minutes (int): Time without progress after which a deletion is resumed.
+
+    Returns:
+        int: Number of resumed deletions.
+    """
+    if minutes is None:
+        minutes = settings.USER_DELETION_STALL_MINUTES
+    user_ids = list(
+        UserDeletion.objects.filter(
+            finished_at__isnull=True,
+            updated_at__lt=timezone.now() - timedelta(minutes=minutes),
+        ).values_list("user_id", flat=True)
+    )
+    for user_id in user_ids:
+        delete_user_data.delay(user_id)
+    return len(user_ids)
+
+
+@shared_task(
+    name="accounts.tasks.deliver_otps",
+    autoretry_for=(DatabaseError, SMSGatewayError),
+    retry_backoff=True,
+    retry_backoff_max=60,
+    max_retries=settings.OTP_DELIVERY_MAX_ATTEMPTS,
+)
+def deliver_otps():
+    """
+    Celery task for sending the pending OTPs by SMS.
+
+    This task sends up to OTP_DELIVERY_BATCHES_PER_TASK batches of the
+    gateway's bulk size, including the OTPs queued while it runs, then
+    enqueues itself again if OTPs are left. A cache lock keeps a single task
+    sending, the lock holder picks up what a task skipped because of it.
+
+    Returns:
+        int: Number of OTPs sent.
+    """
+    cache.delete(OTP_DELIVERY_SCHEDULED)
+    timeout = settings.SMS_GATEWAY_TIMEOUT * (OTP_DELIVERY_BATCHES_PER_TASK + 1)
+    if not cache.add(OTP_DELIVERY_LOCK, True, timeout=timeout):
+        return 0
+    try:
+        sent = deliver_pending_otps(max_batches=OTP_DELIVERY_BATCHES_PER_TASK)
+    finally:
+        cache.delete(OTP_DELIVERY_LOCK)
+
+    # OTPs queued as the lock was released, or beyond the batches of this task
+    if OTPDelivery.objects.filter(status=OTPDelivery.PENDING).exists():
+        schedule_otp_delivery()
+    return sent
@@ -1,3 +1,86 @@
+import io
+import json
+from unittest import mock
+
+from django.db import DataError
 from django.test import TestCase
 
-# Create your tests here.
+from accounts import importers
+from accounts.importers import import_users, iter_rows
+from accounts.models import User
+
+
+def user_line(number, **fields):
+    row = {
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "email": f"user{number}@example.com",
+        "phone_number": f"+1900000{number:04d}",
+        **fields,
+    }
+    return (json.dumps(row) + "\n").encode()
+
+
+class ImportUsersTests(TestCase):
+    """
+    Rows that cannot be read or stored are reported one by one, the rest of
+    the file is still imported.
+    """
+
+    def import_file(self, content, file_format="ndjson"):
+        return import_users(iter_rows(io.BytesIO(content), file_format))
+
+    def assertRowErrors(self, report, expected):
+        self.assertEqual(
+            {error["row"]: error["errors"][0] for error in report["errors"]},
+            expected,
+        )
+
+    def test_ndjson_lines_that_are_not_objects_are_row_errors(self):
+        content = user_line(1) + b'[1, 2]\n"x"\n5\n' + user_line(2)
+
+        report = self.import_file(content)
+
+        self.assertEqual(report["created"], 2)
+        message = "Each line must be a JSON object."
+        self.assertRowErrors(report, {2: message, 3: message, 4: message})
+
+    def test_invalid_json_is_a_row_error(self):
+        report = self.import_file(user_line(1) + b'{"first_name": \n' + user_line(2))
+
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(len(report["errors"]), 1)
+        self.assertTrue(report["errors"][0]["errors"][0].startswith("Invalid JSON"))
+
+    def test_undecodable_lines_are_row_errors(self):
+        ndjson = self.import_file(user_line(1) + b"\xff\xfe\n" + user_line(2))
+        csv = self.import_file(
+            b"first_name,last_name,email,phone_number\n"
+            b"Ada,Lovelace,user3@example.com,+19000000003\n"
+            b"Ad\xe9,Lovelace,user4@example.com,+19000000004\n"
+            b"Ada,Lovelace,user5@example.com,+19000000005\n",
+            "csv",
+        )
+
+        self.assertEqual((ndjson["created"], csv["created"]), (2, 2))
+        self.assertEqual([error["row"] for error in ndjson["errors"]], [2])
+        self.assertEqual([error["row"] for error in csv["errors"]], [2])
+        for report in (ndjson, csv):
+            error = report["errors"][0]["errors"][0]
+            self.assertTrue(error.startswith("Invalid UTF-8"))
+        self.assertFalse(User.objects.filter(email="user4@example.com").exists())
+
+    def test_values_rejected_by_the_database_are_row_errors(self):
+        create_users = importers.create_users
+
+        def reject_second_row(rows):
+            if any(number == 2 for number, _ in rows):
+                raise DataError("value too long")
+            return create_users(rows)
+
+        with mock.patch.object(importers, "create_users", reject_second_row):
+            report = self.import_file(user_line(1) + user_line(2) + user_line(3))
+
+        self.assertEqual(report["created"], 2)
+        self.assertRowErrors(report, {2: "Invalid data: value too long"})
+        self.assertEqual(User.objects.count(), 2)
@@ -1,6 +1,7 @@
 from django.urls import path
 from accounts.views import (
     UserCreateAPIView,
+    UserImportView,
     UserRetrieveView,
     OTPLoginView,
     OTPVerificationView,
@@ -10,6 +11,7 @@ app_name = "accounts"
 
 urlpatterns = [
     path("create_user", UserCreateAPIView.as_view(), name="user_create_api"),
+    path("import_users", UserImportView.as_view(), name="user_import_api"),
     path("manage_user/<int:pk>", UserRetrieveView.as_view(), name="user_update_api"),
     path("login/", OTPLoginView.as_view(), name="user_login_api"),
     path("otp_verify/<token>/", OTPVerificationView.as_view(), name="otp_verify_api"),
@@ -7,14 +7,32 @@ from django.utils.encoding import smart_bytes
 from django.utils.encoding import smart_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from rest_framework import status
-from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView
-from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.generics import CreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 
+from common.cache import PROFILE_VERSION
+from common.throttling import (
+    GlobalTokenBucketThrottle,
+    PhoneNumberTokenBucketThrottle,
+    ThrottleFirstMixin,
+)
+from common.views import VersionedCacheMixin
+from .deletion import request_user_deletion
+from .importers import import_users, iter_rows
 from .models import User
-from .serializers import UserSerializer, LoginSerializer, OtpVerifySerializer
+from .otp import request_otp_delivery
+from .tasks import delete_user_data
+from .serializers import (
+    UserSerializer,
+    LoginSerializer,
+    OtpVerifySerializer,
+    UserImportSerializer,
+)
 
 
 class UserCreateAPIView(CreateAPIView):
@@ -35,27 +53,99 @@ class UserCreateAPIView(CreateAPIView):
     permission_classes = [AllowAny]
 
 
-class UserRetrieveView(RetrieveUpdateAPIView):
+class UserImportView(APIView):
     """
-    API view for retrieving and updating user accounts.
+    API view for bulk importing users from a CSV or NDJSON upload.
+
+    The upload is read as a stream, rows are deduplicated on phone_number and
+    email and created in batches. Invalid rows are reported per row without
+    aborting the import.
+
+    Attributes:
+        serializer_class: The serializer class used for validating the upload.
+        permission_classes: Only admin users may import users.
+    """
+
+    serializer_class = UserImportSerializer
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        """
+        POST method to import the users of the uploaded file.
+
+        Parameters:
+            request: The HTTP request object containing the file and its format.
+
+        Returns:
+            Response: Number of processed rows, created users and per-row errors.
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        upload = serializer.validated_data["file"]
+        report = import_users(
+            iter_rows(upload.open("rb"), serializer.validated_data["format"])
+        )
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class UserRetrieveView(VersionedCacheMixin, RetrieveUpdateDestroyAPIView):
+    """
+    API view for retrieving, updating and deleting user accounts.
 
     This view allows users to retrieve and update their account details.
     It uses the UserSerializer for serializing and deserializing user data.
+    A deleted user is deactivated at once, their data is deleted in the
+    background by the `accounts.tasks.delete_user_data` task.
 
     Attributes:
         queryset: A queryset representing all User objects.
         lookup_field: The field used to retrieve individual user instances (default is 'pk').
         serializer_class: The serializer class used for serializing and deserializing user data.
         permission_classes: A list of permission classes allowing unrestricted access to retrieve and update user accounts.
+        version_scope: The per-user profile version answering conditional GET requests.
     """
 
+    version_scope = PROFILE_VERSION
     queryset = User.objects.all()
     lookup_field = "pk"
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
 
+    def get_version_owner(self):
+        return self.kwargs[self.lookup_field]
 
-class OTPLoginView(APIView):
+    def destroy(self, request, *args, **kwargs):
+        """
+        DELETE method to deactivate a user and schedule the deletion of their data.
+
+        Parameters:
+            request: The HTTP request object of the user or a staff member.
+
+        Returns:
+            Response: HTTP 202 response with the progress of the deletion.
+        """
+        user = self.get_object()
+        if not request.user.is_authenticated or (
+            request.user.pk != user.pk and not request.user.is_staff
+        ):
+            raise PermissionDenied("Only the user or staff can delete a user.")
+
+        deletion = request_user_deletion(user)
+        delete_user_data.delay(user.pk)
+        return Response(
+            {
+                "user": user.pk,
+                "step": deletion.step,
+                "deleted_rows": deletion.deleted_rows,
+                "finished_at": deletion.finished_at,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class OTPLoginView(ThrottleFirstMixin, APIView):
     """
     API view for handling OTP-based user authentication.
 
@@ -63,10 +153,13 @@ class OTPLoginView(APIView):
 
     Attributes:
         serializer_class: The serializer class used for validating phone numbers during OTP generation.
+        throttle_classes: Per phone number and global token buckets checked before any database work.
     """
 
     serializer_class = LoginSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [PhoneNumberTokenBucketThrottle, GlobalTokenBucketThrottle]
+    token_bucket_scopes = {"phone": "otp_phone", "global": "otp_global"}
 
     def post(self, request):
         """
@@ -78,11 +171,16 @@ class OTPLoginView(APIView):
         Returns:
             Response: HTTP response indicating whether OTP generation and sending were successful.
         """
+        if not isinstance(request.data, dict):
+            return Response(
+                {"detail": "Invalid data. Expected a dictionary."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         phone_number = request.data.get("phone_number")
 
         # Check if the phone number exists in the database
         try:
-            user = User.objects.get(phone_number=phone_number)
+            user = User.objects.get(phone_number=phone_number, is_active=True)
         except User.DoesNotExist:
             return Response(
                 {"detail": "Phone number not registered"},
@@ -94,7 +192,10 @@ class OTPLoginView(APIView):
 
         # Store the OTP associated with the user in the database
         user.otp = otp
-        user.save()
+        user.save(update_fields=["otp"])
+
+        # Sent by SMS in the background, the gateway is not waited for
+        request_otp_delivery(user)
 
         token = urlsafe_base64_encode(
             smart_bytes({"user_id": user.id, "phone_number": user.phone_number})
@@ -107,8 +208,7 @@ class OTPLoginView(APIView):
             {
                 "detail": "OTP sent successfully",
                 "otp_verify_link": otp_verify_link,
-                "otp": otp,
-                "message": "You can use this otp for verify",
+                "message": "Enter the OTP sent to your phone number",
             },
             status=status.HTTP_200_OK,
         )
@@ -138,12 +238,21 @@ class OTPVerificationView(APIView):
         Returns:
             Response: HTTP response indicating whether OTP verification was successful.
         """
+        if not isinstance(request.data, dict):
+            return Response(
+                {"detail": "Invalid data. Expected a dictionary."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         otp = request.data.get("otp")
 
         # Check if the phone number exists in the database
         try:
             user_info = ast.literal_eval(smart_str(urlsafe_base64_decode(token)))
-            user = User.objects.filter(phone_number=user_info["phone_number"]).first()
+            user = User.objects.filter(
+                phone_number=user_info["phone_number"], is_active=True
+            ).first()
+            if user is None:
+                raise User.DoesNotExist
         except User.DoesNotExist:
             return Response(
                 {"detail": "Phone number not registered"},
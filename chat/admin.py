@@ -1,3 +1,188 @@
 from django.contrib import admin
+from django_celery_beat.admin import PeriodicTaskAdmin
+from django_celery_beat.models import PeriodicTask
 
-# Register your models here.
+from common.admin import KeysetAdminMixin, bounded_count
+from .models import (
+    Attachment,
+    AttachmentBlob,
+    ConversationReadState,
+    Event,
+    Message,
+    MessageArchiveSegment,
+    MessageSetting,
+    RecurringMessage,
+    SyncTombstone,
+)
+from .sharding import attach_users, find_message, message_shards
+
+
+class ReadOnlyAdminMixin:
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Message)
+class MessageAdmin(ReadOnlyAdminMixin, KeysetAdminMixin, admin.ModelAdmin):
+    """
+    Read-only admin of the messages of every shard.
+
+    Each page reads the newest rows below the cursor from every shard and
+    keeps the newest of them, the users are attached from the default
+    database. Messages are changed through the API, which keeps the mailbox
+    versions, unread counts and tombstones in step.
+    """
+
+    list_display = ["id", "sender", "receiver", "content", "parent_id", "created_at"]
+    list_filter = ["is_recurring"]
+    fields = [
+        "id",
+        "sender",
+        "receiver",
+        "content",
+        "parent_id",
+        "scheduled_time",
+        "is_recurring",
+        "created_at",
+        "updated_at",
+    ]
+    readonly_fields = fields
+    # users cannot be joined on a shard, attach_users fetches them
+    list_select_related = []
+    actions = None
+
+    def get_keyset_page(self, queryset, limit):
+        messages = []
+        for alias in message_shards():
+            messages.extend(queryset.using(alias)[:limit])
+        messages.sort(key=lambda message: message.id, reverse=True)
+        return attach_users(messages[:limit])
+
+    def get_result_count(self, queryset):
+        return sum(bounded_count(queryset.using(alias)) for alias in message_shards())
+
+    def get_object(self, request, object_id, from_field=None):
+        if not str(object_id).isdigit():
+            return None
+        message = find_message(int(object_id))
+        return attach_users([message])[0] if message is not None else None
+
+
+@admin.register(Attachment)
+class AttachmentAdmin(ReadOnlyAdminMixin, KeysetAdminMixin, admin.ModelAdmin):
+    list_display = [
+        "id",
+        "name",
+        "user",
+        "content_type",
+        "size",
+        "status",
+        "received_chunks",
+        "created_at",
+    ]
+    list_filter = ["status"]
+    list_select_related = ["user"]
+
+
+@admin.register(AttachmentBlob)
+class AttachmentBlobAdmin(ReadOnlyAdminMixin, KeysetAdminMixin, admin.ModelAdmin):
+    list_display = ["id", "sha256", "size", "created_at"]
+    search_fields = ["=sha256"]
+
+
+@admin.register(Event)
+class EventAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    list_display = [
+        "id",
+        "title",
+        "organize_by",
+        "schedule_on",
+        "is_complete",
+        "scheduling_status",
+    ]
+    list_filter = ["is_complete", "scheduling_status"]
+    list_select_related = ["organize_by"]
+    autocomplete_fields = ["organize_by"]
+    readonly_fields = ["scheduling_status"]
+
+
+@admin.register(MessageSetting)
+class MessageSettingAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    list_display = [
+        "id",
+        "is_active",
+        "is_auto_sending_on",
+        "is_recurring_on",
+        "updated_at",
+    ]
+    list_filter = ["is_active"]
+    autocomplete_fields = ["receptions"]
+
+
+@admin.register(RecurringMessage)
+class RecurringMessageAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    # the message lives on a shard, enter its id
+    list_display = [
+        "id",
+        "message_id",
+        "schedule",
+        "start_date",
+        "end_date",
+        "scheduling_status",
+    ]
+    list_filter = ["schedule", "scheduling_status"]
+    raw_id_fields = ["message"]
+    readonly_fields = ["scheduling_status"]
+
+
+@admin.register(ConversationReadState)
+class ConversationReadStateAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    list_display = ["id", "user", "peer", "last_read_message_id", "unread_count"]
+    list_select_related = ["user", "peer"]
+    autocomplete_fields = ["user", "peer"]
+
+
+@admin.register(MessageArchiveSegment)
+class MessageArchiveSegmentAdmin(
+    ReadOnlyAdminMixin, KeysetAdminMixin, admin.ModelAdmin
+):
+    list_display = [
+        "id",
+        "user",
+        "month",
+        "first_message_id",
+        "last_message_id",
+        "message_count",
+    ]
+    list_select_related = ["user"]
+    # the compressed messages are read through the message history API
+    exclude = ["data"]
+
+
+@admin.register(SyncTombstone)
+class SyncTombstoneAdmin(ReadOnlyAdminMixin, KeysetAdminMixin, admin.ModelAdmin):
+    # the user may be deleted already, show its id only
+    list_display = ["id", "collection", "object_id", "user_id", "created_at"]
+
+
+admin.site.unregister(PeriodicTask)
+
+
+@admin.register(PeriodicTask)
+class ScalablePeriodicTaskAdmin(KeysetAdminMixin, PeriodicTaskAdmin):
+    """
+    PeriodicTaskAdmin for the one periodic task per scheduled run of every
+    event and recurring message.
+
+    The date hierarchy and the filters on task, start_time and last_run_at
+    read distinct values of the whole table, they are left out.
+    """
+
+    list_filter = ["enabled", "one_off"]
+    list_select_related = ["interval", "crontab", "solar", "clocked"]
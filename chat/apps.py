@@ -6,4 +6,8 @@ class ChatConfig(AppConfig):
     name = 'chat'
 
     def ready(self):
+        import chat.checks
         import chat.signals
+        from common.query_cache import install_translation_cache
+
+        install_translation_cache()
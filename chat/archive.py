@@ -0,0 +1,305 @@
+import json
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from accounts.models import User
+from common.cache import MAILBOX_VERSION, bump_version
+from .attachments import attachment_summary
+from .models import Attachment, Message, MessageArchiveSegment, RecurringMessage
+from .sharding import message_shards
+
+ARCHIVED_FIELDS = (
+    "id",
+    "sender_id",
+    "receiver_id",
+    "content",
+    "parent_id",
+    "scheduled_time",
+    "is_recurring",
+    "attachment_id",
+    "created_at",
+)
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = settings.MESSAGE_ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def pinned_message_ids(cutoff):
+    """
+    Return ids of old messages that must stay in the hot collection.
+
+    Replies and recurring messages reference their message with a cascading
+    foreign key, deleting a referenced message would delete them as well.
+    Messages referenced by recent replies, by recurring messages, or by
+    another pinned message are pinned.
+    """
+    pinned = set()
+    for alias in message_shards():
+        pinned.update(
+            Message.objects.using(alias)
+            .filter(created_at__gte=cutoff, parent_id__isnull=False)
+            .values_list("parent_id", flat=True)
+            .distinct()
+        )
+    pinned.update(
+        RecurringMessage.objects.filter(message_id__isnull=False)
+        .values_list("message_id", flat=True)
+        .distinct()
+    )
+
+    # a pinned reply keeps the messages it replies to, up to the first one
+    referenced = pinned
+    while referenced:
+        parents = set()
+        for alias in message_shards():
+            parents.update(
+                Message.objects.using(alias)
+                .filter(id__in=referenced, parent_id__isnull=False)
+                .values_list("parent_id", flat=True)
+            )
+        referenced = parents - pinned
+        pinned |= referenced
+    return pinned
+
+
+def archived_row(row):
+    """
+    Return a JSON serialisable copy of a message row
+    """
+    datetime_field = serializers.DateTimeField()
+    return {
+        **row,
+        "scheduled_time": row["scheduled_time"]
+        and datetime_field.to_representation(row["scheduled_time"]),
+        "created_at": datetime_field.to_representation(row["created_at"]),
+    }
+
+
+def build_segments(rows):
+    """
+    Group archived message rows into per-user, per-month segments
+    """
+    groups = defaultdict(list)
+    for row in rows:
+        month = row["created_at"].date().replace(day=1)
+        for user_id in {row["sender_id"], row["receiver_id"]}:
+            groups[(user_id, month)].append(archived_row(row))
+
+    return [
+        MessageArchiveSegment(user_id=user_id, month=month, **segment_fields(messages))
+        for (user_id, month), messages in groups.items()
+    ]
+
+
+def segment_fields(messages):
+    """
+    Return the compressed data and id range of a segment holding `messages`
+    """
+    payload = json.dumps(messages)
+    return {
+        "first_message_id": min(message["id"] for message in messages),
+        "last_message_id": max(message["id"] for message in messages),
+        "message_count": len(messages),
+        "data": zlib.compress(payload.encode(), 6),
+    }
+
+
+def archive_messages(days=None, batch_size=1000, max_batches=None):
+    """
+    Move messages older than `days` from the hot collection into segments.
+
+    Args:
+        days (int): Age in days after which messages are archived, defaults to
+                    settings.MESSAGE_ARCHIVE_AFTER_DAYS.
+        batch_size (int): Number of messages archived per transaction.
+        max_batches (int): Optional limit of batches processed in this run.
+
+    Returns:
+        int: Number of archived messages.
+    """
+    cutoff = archive_cutoff(days)
+    pinned = pinned_message_ids(cutoff)
+    archived = 0
+    user_ids = set()
+    batches = 0
+
+    for alias in message_shards():
+        last_id = 0
+        while max_batches is None or batches < max_batches:
+            rows = list(
+                Message.objects.using(alias)
+                .filter(created_at__lt=cutoff, id__gt=last_id)
+                .order_by("id")
+                .values(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            rows = [row for row in rows if row["id"] not in pinned]
+            batches += 1
+            if not rows:
+                continue
+
+            # segments are committed before the shard's delete, a failure
+            # leaves a message in both places rather than in neither
+            with transaction.atomic(using=alias), transaction.atomic():
+                MessageArchiveSegment.objects.bulk_create(build_segments(rows))
+                # referenced messages are pinned, nothing is left to cascade to
+                # and related collections may live on another database
+                Message.objects.using(alias).filter(
+                    id__in=[row["id"] for row in rows]
+                )._raw_delete(alias)
+            archived += len(rows)
+            user_ids.update(row["sender_id"] for row in rows)
+            user_ids.update(row["receiver_id"] for row in rows)
+
+    bump_version(MAILBOX_VERSION, user_ids)
+
+    return archived
+
+
+def unpack_segment(segment):
+    return json.loads(zlib.decompress(bytes(segment.data)))
+
+
+def purge_archived_messages(user_id, batch_size=10):
+    """
+    Remove the archived messages of a user from their peers' segments.
+
+    An archived message is stored in the segments of its sender and of its
+    receiver. Up to `batch_size` of the user's own segments are read to find
+    the peers' segments of the same months, which are rewritten without the
+    user's messages, or deleted once empty. The user's segments are deleted
+    in the same transaction, so a purge is resumed by running it again.
+
+    Returns:
+        int: Number of deleted or rewritten segments, 0 when none are left.
+    """
+    segments = list(
+        MessageArchiveSegment.objects.filter(user_id=user_id).order_by("id")[
+            :batch_size
+        ]
+    )
+    if not segments:
+        return 0
+
+    peer_months = set()
+    for segment in segments:
+        for message in unpack_segment(segment):
+            for peer_id in {message["sender_id"], message["receiver_id"]} - {user_id}:
+                peer_months.add((peer_id, segment.month))
+
+    changed = len(segments)
+    with transaction.atomic():
+        for peer_id, month in sorted(peer_months):
+            for segment in MessageArchiveSegment.objects.filter(
+                user_id=peer_id, month=month
+            ):
+                messages = unpack_segment(segment)
+                kept = [
+                    message
+                    for message in messages
+                    if user_id not in (message["sender_id"], message["receiver_id"])
+                ]
+                if len(kept) == len(messages):
+                    continue
+                changed += 1
+                if not kept:
+                    segment.delete()
+                    continue
+                for name, value in segment_fields(kept).items():
+                    setattr(segment, name, value)
+                segment.save()
+        MessageArchiveSegment.objects.filter(
+            pk__in=[segment.pk for segment in segments]
+        ).delete()
+
+    bump_version(MAILBOX_VERSION, {peer_id for peer_id, _ in peer_months})
+    return changed
+
+
+def has_archived_messages(user_id, before=None, after=None):
+    """
+    Return whether a user's archive may hold messages between two ids, from
+    the id ranges of the segments
+    """
+    segments = MessageArchiveSegment.objects.filter(user_id=user_id)
+    if before is not None:
+        segments = segments.filter(first_message_id__lt=before)
+    if after is not None:
+        segments = segments.filter(last_message_id__gt=after)
+    return segments.exists()
+
+
+def read_archived_messages(user_id, before=None, limit=50):
+    """
+    Return up to `limit` archived messages of a user, newest first.
+
+    Segments are visited by descending `last_message_id` and unpacked only
+    until no older segment can contain a message newer than the ones found.
+
+    Args:
+        user_id (int): The user whose sent and received messages are read.
+        before (int): Only return messages with an id lower than this cursor.
+        limit (int): Maximum number of messages returned.
+
+    Returns:
+        list: Archived messages in the MessageSerializer representation.
+    """
+    segments = MessageArchiveSegment.objects.filter(user_id=user_id)
+    if before is not None:
+        segments = segments.filter(first_message_id__lt=before)
+
+    rows = {}
+    for segment in segments.order_by("-last_message_id").iterator():
+        newest_ids = sorted(rows, reverse=True)[:limit]
+        if len(newest_ids) == limit and newest_ids[-1] > segment.last_message_id:
+            break
+        for row in unpack_segment(segment):
+            if before is None or row["id"] < before:
+                rows[row["id"]] = row
+
+    newest_ids = sorted(rows, reverse=True)[:limit]
+    return serialize_archived_messages([rows[message_id] for message_id in newest_ids])
+
+
+def serialize_archived_messages(messages):
+    """
+    Render archived rows like MessageSerializer renders hot messages
+    """
+    user_ids = {message["sender_id"] for message in messages}
+    user_ids.update(message["receiver_id"] for message in messages)
+    names = dict(
+        User.objects.filter(id__in=user_ids).values_list("id", "first_name")
+    )
+    # segments archived before attachments existed have no attachment_id
+    attachment_ids = {message.get("attachment_id") for message in messages} - {None}
+    attachments = (
+        Attachment.objects.in_bulk(attachment_ids) if attachment_ids else {}
+    )
+    return [
+        {
+            "id": message["id"],
+            "sender": message["sender_id"],
+            "sender_name": names.get(message["sender_id"]),
+            "receiver": message["receiver_id"],
+            "receiver_name": names.get(message["receiver_id"]),
+            "content": message["content"],
+            "scheduled_time": message["scheduled_time"],
+            "attachment": attachment_summary(attachments[message["attachment_id"]])
+            if message.get("attachment_id") in attachments
+            else None,
+            "created_at": message["created_at"],
+            "is_archived": True,
+        }
+        for message in messages
+    ]
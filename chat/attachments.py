@@ -0,0 +1,329 @@
+import hashlib
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Attachment, AttachmentBlob, Message
+from .sharding import message_shards
+
+READ_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ChunkOutOfOrder(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Chunks are uploaded in order, resume from received_chunks."
+    default_code = "chunk_out_of_order"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class StreamReader:
+    """
+    File-like object reading at most `size` bytes from a stream.
+
+    `storage.save()` reads it in small chunks, so a chunk of the request body
+    is copied to the storage without being held in memory.
+    """
+
+    def __init__(self, stream, size):
+        self.stream = stream
+        self.size = size
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        remaining = self.size - self.read_bytes
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self.stream.read(size) if size else b""
+        self.read_bytes += len(data)
+        return data
+
+
+class IteratorReader:
+    """
+    File-like object over an iterator of bytes, of `size` bytes in total
+    """
+
+    def __init__(self, iterator, size):
+        self.iterator = iterator
+        self.size = size
+        self.buffer = b""
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self.buffer) < size:
+            data = next(self.iterator, b"")
+            if not data:
+                break
+            self.buffer += data
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def chunk_name(attachment_id, index):
+    return f"attachment_chunks/{attachment_id}-{index:06d}"
+
+
+def blob_name(sha256):
+    return f"attachments/{sha256[:2]}/{sha256}"
+
+
+def save_chunk(attachment, index, stream, length):
+    """
+    Store a chunk of an upload, streamed from the request body.
+
+    Chunks are accepted in order. A chunk sent again after it was stored, e.g.
+    when the response was lost, is acknowledged without being read.
+
+    Args:
+        attachment (Attachment): The upload, owned by the requester.
+        index (int): Position of the chunk, from 0.
+        stream: File-like request body.
+        length (int): Content-Length of the body.
+
+    Returns:
+        Attachment: The upload with its new progress.
+
+    Raises:
+        ChunkOutOfOrder: A previous chunk is missing.
+        ValidationError: The upload is complete or the chunk has the wrong size.
+    """
+    if attachment.status != Attachment.UPLOADING:
+        raise ValidationError({"status": "The upload is already complete."})
+    if index >= attachment.chunk_count:
+        raise ValidationError(
+            {"index": f"The upload has {attachment.chunk_count} chunks."}
+        )
+    if index < attachment.received_chunks:
+        return attachment
+    if index > attachment.received_chunks:
+        raise ChunkOutOfOrder()
+
+    expected = attachment.chunk_length(index)
+    if length != expected:
+        raise ValidationError({"chunk": f"Chunk {index} must be {expected} bytes."})
+
+    name = chunk_name(attachment.id, index)
+    # left behind by an interrupted attempt
+    default_storage.delete(name)
+    reader = StreamReader(stream, expected)
+    saved_name = default_storage.save(name, File(reader, name))
+    if saved_name != name or reader.read_bytes != expected:
+        # a concurrent attempt stored the chunk first, or the body was cut short
+        default_storage.delete(saved_name)
+        if saved_name == name:
+            raise ValidationError({"chunk": f"Chunk {index} is incomplete."})
+    else:
+        Attachment.objects.filter(
+            pk=attachment.pk, status=Attachment.UPLOADING, received_chunks=index
+        ).update(received_chunks=index + 1, updated_at=timezone.now())
+    attachment.refresh_from_db()
+    return attachment
+
+
+def complete_upload(attachment):
+    """
+    Mark an upload with all its chunks as ready to be assembled.
+
+    Returns:
+        bool: Whether the assembly must be started, False if it already was.
+
+    Raises:
+        ValidationError: Chunks are missing.
+    """
+    if attachment.status != Attachment.UPLOADING:
+        return False
+    if attachment.received_chunks < attachment.chunk_count:
+        raise ValidationError(
+            {
+                "received_chunks": f"{attachment.received_chunks} of "
+                f"{attachment.chunk_count} chunks received."
+            }
+        )
+    return bool(
+        Attachment.objects.filter(pk=attachment.pk, status=Attachment.UPLOADING).update(
+            status=Attachment.ASSEMBLING, updated_at=timezone.now()
+        )
+    )
+
+
+def iter_chunks(attachment):
+    for index in range(attachment.chunk_count):
+        with default_storage.open(chunk_name(attachment.id, index), "rb") as chunk:
+            while True:
+                data = chunk.read(READ_SIZE)
+                if not data:
+                    break
+                yield data
+
+
+def delete_chunks(attachment):
+    for index in range(attachment.chunk_count):
+        default_storage.delete(chunk_name(attachment.id, index))
+
+
+def assemble_attachment(attachment_id):
+    """
+    Assemble the chunks of an upload into the blob of their content.
+
+    The chunks are hashed first, an upload whose content is already stored
+    reuses that blob and the chunks are never copied. Otherwise they are
+    streamed into a new blob named after their SHA-256.
+
+    Returns:
+        bool: False if the upload is not waiting for assembly or is corrupt.
+    """
+    attachment = Attachment.objects.filter(
+        pk=attachment_id, status=Attachment.ASSEMBLING
+    ).first()
+    if attachment is None:
+        return False
+
+    digest = hashlib.sha256()
+    size = 0
+    for data in iter_chunks(attachment):
+        digest.update(data)
+        size += len(data)
+    if size != attachment.size:
+        Attachment.objects.filter(pk=attachment.pk).update(
+            status=Attachment.FAILED, updated_at=timezone.now()
+        )
+        delete_chunks(attachment)
+        return False
+
+    sha256 = digest.hexdigest()
+    blob = AttachmentBlob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        name = default_storage.save(
+            blob_name(sha256), File(IteratorReader(iter_chunks(attachment), size))
+        )
+        blob, created = AttachmentBlob.objects.get_or_create(
+            sha256=sha256, defaults={"size": size, "file": name}
+        )
+        if not created:
+            # the same content was assembled concurrently
+            default_storage.delete(name)
+    else:
+        # keeps prune_attachments from deleting it before it is referenced
+        AttachmentBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+
+    Attachment.objects.filter(pk=attachment.pk).update(
+        blob=blob, status=Attachment.READY, updated_at=timezone.now()
+    )
+    delete_chunks(attachment)
+    return True
+
+
+def prune_attachments(hours=None):
+    """
+    Delete uploads without progress for `hours` and unreferenced blobs.
+
+    Args:
+        hours (int): Age of the uploads deleted, settings.ATTACHMENT_UPLOAD_EXPIRY_HOURS
+                     by default. Blobs left without attachments for as long
+                     are deleted as well.
+
+    Returns:
+        int: Number of deleted uploads and blobs.
+    """
+    if hours is None:
+        hours = settings.ATTACHMENT_UPLOAD_EXPIRY_HOURS
+    cutoff = timezone.now() - timedelta(hours=hours)
+
+    # the post_delete receiver deletes their chunks
+    deleted, _ = Attachment.objects.filter(
+        status__in=[Attachment.UPLOADING, Attachment.FAILED], updated_at__lt=cutoff
+    ).delete()
+    for blob in AttachmentBlob.objects.filter(
+        attachments__isnull=True, updated_at__lt=cutoff
+    ):
+        blob.file.delete(save=False)
+        blob.delete()
+        deleted += 1
+    return deleted
+
+
+def can_read_attachment(attachment, user_id):
+    """
+    Return whether a user uploaded the attachment or exchanged a message with it
+    """
+    if attachment.user_id == user_id:
+        return True
+    return any(
+        Message.objects.using(alias)
+        .filter(attachment_id=attachment.id)
+        .filter(Q(sender_id=user_id) | Q(receiver_id=user_id))
+        .exists()
+        for alias in message_shards()
+    )
+
+
+def attachment_summary(attachment):
+    """
+    Return the metadata of an attachment shown with messages, without its content
+    """
+    return {
+        "id": attachment.id,
+        "name": attachment.name,
+        "content_type": attachment.content_type,
+        "size": attachment.size,
+        "url": reverse("chat:attachment-content", args=[attachment.id]),
+    }
+
+
+def parse_range(header, size):
+    """
+    Return the first and last byte of a single `Range: bytes=` header.
+
+    Returns:
+        tuple: (first, last), or None to send the whole file, for a missing,
+               invalid or multi-range header.
+
+    Raises:
+        RangeNotSatisfiable: The range starts after the end of the file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        if int(last) == 0:
+            raise RangeNotSatisfiable()
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if first >= size:
+        raise RangeNotSatisfiable()
+    if last and int(last) < first:
+        return None
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def iter_range(file, first, last):
+    """
+    Yield the bytes `first` to `last` of an open file, then close it
+    """
+    try:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            data = file.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file.close()
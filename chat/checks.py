@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from .ids import MESSAGE_ID_MAX_NODE
+
+MESSAGE_ID_ALLOCATIONS = ("database", "sequence", "time")
+
+
+@register()
+def message_shard_ids_check(app_configs, **kwargs):
+    """
+    Warn when messages are sharded while each shard allocates its own ids
+    """
+    if (
+        len(settings.MESSAGE_SHARDS) < 2
+        or settings.MESSAGE_ID_ALLOCATION != "database"
+    ):
+        return []
+    return [
+        Warning(
+            "Messages are stored on several shards with auto-increment ids.",
+            hint=(
+                "Every shard allocates ids on its own, so two messages on "
+                "different shards can share an id. Set MESSAGE_ID_ALLOCATION "
+                "to allocate message ids globally."
+            ),
+            id="chat.W001",
+        )
+    ]
+
+
+@register()
+def message_id_allocation_check(app_configs, **kwargs):
+    """
+    Check the message id allocation and the write-behind buffer depending on it
+    """
+    errors = []
+    if settings.MESSAGE_ID_ALLOCATION not in MESSAGE_ID_ALLOCATIONS:
+        errors.append(
+            Error(
+                f"Unknown MESSAGE_ID_ALLOCATION {settings.MESSAGE_ID_ALLOCATION!r}.",
+                hint=f"Use one of {', '.join(MESSAGE_ID_ALLOCATIONS)}.",
+                id="chat.E001",
+            )
+        )
+    if settings.MESSAGE_WRITE_BEHIND and settings.MESSAGE_ID_ALLOCATION == "database":
+        errors.append(
+            Error(
+                "MESSAGE_WRITE_BEHIND needs message ids allocated before the insert.",
+                hint="Set MESSAGE_ID_ALLOCATION to 'sequence' or 'time'.",
+                id="chat.E002",
+            )
+        )
+    node = settings.MESSAGE_ID_NODE
+    if node is not None and not 0 <= node <= MESSAGE_ID_MAX_NODE:
+        errors.append(
+            Error(
+                f"MESSAGE_ID_NODE {node} is out of range.",
+                hint=f"Use a node between 0 and {MESSAGE_ID_MAX_NODE}.",
+                id="chat.E003",
+            )
+        )
+    return errors
@@ -0,0 +1,183 @@
+import csv
+import heapq
+import io
+import json
+import zlib
+from itertools import count
+from operator import itemgetter
+
+from django.db.models import Q
+from rest_framework import serializers
+
+from .archive import ARCHIVED_FIELDS, archived_row, unpack_segment
+from .models import Event, Message, MessageArchiveSegment
+from .sharding import message_shards
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EVENT_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "schedule_on",
+    "is_complete",
+    "created_at",
+)
+CSV_COLUMNS = (
+    ("type",) + ARCHIVED_FIELDS + ("title", "description", "schedule_on", "is_complete")
+)
+FLUSH_SIZE = 64 * 1024
+
+
+def iter_archived_messages(user_id):
+    """
+    Yield the archived messages of a user ordered by id.
+
+    Segments are unpacked in order of their first id, a segment only once the
+    merge reaches it, so only the segments whose id ranges overlap, e.g. ones
+    archived from different shards, are held in memory together.
+    """
+    segments = (
+        MessageArchiveSegment.objects.filter(user_id=user_id)
+        .order_by("first_message_id")
+        .iterator(chunk_size=1)
+    )
+    # the counter orders rows archived twice, whose dicts do not compare
+    order = count()
+    heap = []
+    segment = next(segments, None)
+    while heap or segment is not None:
+        while segment is not None and (
+            not heap or segment.first_message_id <= heap[0][0]
+        ):
+            for row in unpack_segment(segment):
+                heapq.heappush(heap, (row["id"], next(order), row))
+            segment = next(segments, None)
+        yield heapq.heappop(heap)[2]
+
+
+def iter_messages(user_id, chunk_size=2000):
+    """
+    Yield every message of a user, archived or hot, oldest first.
+
+    Archive segments are unpacked lazily and hot messages are read with a
+    server-side iterator per shard, all merged by id, so memory use does not
+    depend on history length. A message left both in a segment and on its
+    shard by an interrupted archival is exported once, from the shard.
+    """
+    hot_messages = (
+        archived_row(row)
+        for row in heapq.merge(
+            *(
+                Message.objects.using(alias)
+                .filter(Q(sender_id=user_id) | Q(receiver_id=user_id))
+                .order_by("id")
+                .values(*ARCHIVED_FIELDS)
+                .iterator(chunk_size=chunk_size)
+                for alias in message_shards()
+            ),
+            key=itemgetter("id"),
+        )
+    )
+    previous_id = None
+    # on equal ids the hot message comes first
+    for row in heapq.merge(
+        hot_messages, iter_archived_messages(user_id), key=itemgetter("id")
+    ):
+        if row["id"] != previous_id:
+            previous_id = row["id"]
+            yield {"type": "message", **row}
+
+
+def iter_events(user_id, chunk_size=2000):
+    datetime_field = serializers.DateTimeField()
+    events = (
+        Event.objects.filter(organize_by_id=user_id)
+        .order_by("id")
+        .values(*EVENT_FIELDS)
+    )
+    for row in events.iterator(chunk_size=chunk_size):
+        yield {
+            "type": "event",
+            **row,
+            "schedule_on": row["schedule_on"]
+            and datetime_field.to_representation(row["schedule_on"]),
+            "created_at": datetime_field.to_representation(row["created_at"]),
+        }
+
+
+def iter_records(user_id, include_events=False, chunk_size=2000):
+    yield from iter_messages(user_id, chunk_size)
+    if include_events:
+        yield from iter_events(user_id, chunk_size)
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+
+def iter_csv(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, restval="")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_encoded(lines, compress=False):
+    """
+    Encode exported lines into byte chunks of about FLUSH_SIZE.
+
+    The first line is emitted on its own so the first byte leaves immediately.
+    With `compress` the chunks form a gzip stream, every chunk is sync-flushed
+    so the client can decompress it as soon as it arrives.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def encode(data, final=False):
+        if not compress:
+            return data
+        chunk = compressor.compress(data)
+        return chunk + compressor.flush(
+            zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        )
+
+    buffer = []
+    size = 0
+    first = True
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if first or size >= FLUSH_SIZE:
+            yield encode(b"".join(buffer))
+            buffer = []
+            size = 0
+            first = False
+
+    final = encode(b"".join(buffer), final=True)
+    if final:
+        yield final
+
+
+def export_user_history(
+    user_id, export_format="ndjson", include_events=False, compress=False
+):
+    """
+    Stream a user's full history as encoded byte chunks.
+
+    Args:
+        user_id (int): The user whose messages (and events) are exported.
+        export_format (str): Either "ndjson" or "csv".
+        include_events (bool): Also export the events organised by the user.
+        compress (bool): Produce a gzip stream.
+
+    Returns:
+        generator: Byte chunks of the export.
+    """
+    records = iter_records(user_id, include_events)
+    lines = iter_csv(records) if export_format == "csv" else iter_ndjson(records)
+    return iter_encoded(lines, compress)
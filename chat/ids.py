@@ -0,0 +1,232 @@
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+MESSAGE_ID_SEQUENCE_KEY = "sequence:message-id"
+# ids the persisted high-water mark is raised by at once
+MESSAGE_ID_RESERVATION_BLOCK = 10000
+
+# Time-ordered ids: 41 bits of milliseconds since MESSAGE_ID_EPOCH, 10 bits
+# identifying the generating process and a 12 bit counter per millisecond.
+MESSAGE_ID_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+MESSAGE_ID_NODE_BITS = 10
+MESSAGE_ID_COUNTER_BITS = 12
+MESSAGE_ID_TIME_SHIFT = MESSAGE_ID_NODE_BITS + MESSAGE_ID_COUNTER_BITS
+MESSAGE_ID_MAX_NODE = (1 << MESSAGE_ID_NODE_BITS) - 1
+MESSAGE_ID_MAX_COUNTER = (1 << MESSAGE_ID_COUNTER_BITS) - 1
+
+_epoch_ms = int(MESSAGE_ID_EPOCH.timestamp() * 1000)
+_generator = None
+_generator_lock = threading.Lock()
+# highest persisted ceiling seen by this process
+_reserved_ceiling = 0
+
+
+def database_allocates_ids():
+    return settings.MESSAGE_ID_ALLOCATION == "database"
+
+
+def time_ordered_ids():
+    return settings.MESSAGE_ID_ALLOCATION == "time"
+
+
+def message_id_for_time(value):
+    """
+    Return the lowest time-ordered id generated at a datetime
+    """
+    milliseconds = int(value.timestamp() * 1000) - _epoch_ms
+    return max(milliseconds, 0) << MESSAGE_ID_TIME_SHIFT
+
+
+def message_id_time(message_id):
+    """
+    Return the datetime a time-ordered id was generated at
+    """
+    return MESSAGE_ID_EPOCH + timedelta(
+        milliseconds=message_id >> MESSAGE_ID_TIME_SHIFT
+    )
+
+
+def is_valid_client_message_id(message_id, now=None):
+    """
+    Check that a client generated id is time-ordered and close to the present.
+
+    Ids older than settings.MESSAGE_ID_CLIENT_SKEW_SECONDS are rejected, they
+    would sort far away from the messages sent with them. Ids ahead of the
+    server clock are rejected too: an id from the future becomes the read
+    high-water mark of its receiver, messages arriving after it with lower
+    ids would stay counted as unread.
+    """
+    now = now or datetime.now(dt_timezone.utc)
+    if not 0 < message_id < 1 << 63:
+        return False
+    skew = timedelta(seconds=settings.MESSAGE_ID_CLIENT_SKEW_SECONDS)
+    return now - skew <= message_id_time(message_id) <= now
+
+
+class TimeOrderedIdGenerator:
+    """
+    Generator of 63 bit time-ordered message ids, without any round trip.
+
+    Ids generated by one process are strictly increasing. Ids of different
+    processes are unique as long as their nodes differ, and sort by their
+    millisecond. When the counter of a millisecond is exhausted the generator
+    waits for the next one, when the clock goes backwards it keeps counting
+    from the last millisecond it used.
+
+    Clients may generate ids with the same layout, using random bits for the
+    node and the counter, and resend a message with the same id to retry it.
+
+    Attributes:
+        node: Identifier of the generating process, 0 to MESSAGE_ID_MAX_NODE.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._counter = 0
+
+    def now_ms(self):
+        return int(time.time() * 1000) - _epoch_ms
+
+    def next_id(self):
+        with self._lock:
+            milliseconds = max(self.now_ms(), self._last_ms)
+            if milliseconds == self._last_ms:
+                self._counter = (self._counter + 1) & MESSAGE_ID_MAX_COUNTER
+                if self._counter == 0:
+                    while milliseconds <= self._last_ms:
+                        time.sleep(0.0001)
+                        milliseconds = self.now_ms()
+            else:
+                self._counter = 0
+            self._last_ms = milliseconds
+            return (
+                milliseconds << MESSAGE_ID_TIME_SHIFT
+                | self.node << MESSAGE_ID_COUNTER_BITS
+                | self._counter
+            )
+
+
+def get_id_generator():
+    """
+    Return the id generator of this process.
+
+    The node is settings.MESSAGE_ID_NODE, or a random one when it is None.
+    Random nodes make a collision between processes unlikely but possible,
+    give every process its own node when that matters.
+    """
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            node = settings.MESSAGE_ID_NODE
+            if node is None:
+                node = secrets.randbelow(MESSAGE_ID_MAX_NODE + 1)
+            _generator = TimeOrderedIdGenerator(node)
+        return _generator
+
+
+def current_max_message_id():
+    """
+    Return the highest message id in use, hot or archived, on any shard
+    """
+    Message = apps.get_model("chat", "Message")
+    MessageArchiveSegment = apps.get_model("chat", "MessageArchiveSegment")
+    ids = [
+        Message.objects.using(alias).aggregate(max_id=Max("id"))["max_id"]
+        for alias in settings.MESSAGE_SHARDS
+    ]
+    ids.append(
+        MessageArchiveSegment.objects.aggregate(max_id=Max("last_message_id"))[
+            "max_id"
+        ]
+    )
+    return max([message_id for message_id in ids if message_id is not None] or [0])
+
+
+def reserve_message_ids(last_id):
+    """
+    Raise the persisted high-water mark at least half a block above
+    `last_id`, by MESSAGE_ID_RESERVATION_BLOCK ids at a time.
+
+    Returns:
+        int: The persisted ceiling.
+    """
+    MessageIdReservation = apps.get_model("chat", "MessageIdReservation")
+    threshold = last_id + MESSAGE_ID_RESERVATION_BLOCK // 2
+    ceiling = last_id + MESSAGE_ID_RESERVATION_BLOCK
+    reservation, created = MessageIdReservation.objects.get_or_create(
+        pk=1, defaults={"ceiling": ceiling}
+    )
+    if not created and reservation.ceiling < threshold:
+        MessageIdReservation.objects.filter(pk=1, ceiling__lt=threshold).update(
+            ceiling=ceiling
+        )
+        reservation.refresh_from_db(fields=["ceiling"])
+    return reservation.ceiling
+
+
+def reserved_message_id_ceiling():
+    MessageIdReservation = apps.get_model("chat", "MessageIdReservation")
+    return (
+        MessageIdReservation.objects.filter(pk=1)
+        .values_list("ceiling", flat=True)
+        .first()
+        or 0
+    )
+
+
+def allocate_message_ids(count):
+    """
+    Reserve `count` consecutive message ids from the shared sequence.
+
+    The sequence lives in the cache, a single atomic INCRBY reserves a whole
+    batch. Every id handed out is below the high-water mark persisted in
+    MessageIdReservation, raised in blocks. When the counter is missing,
+    e.g. after an eviction, it is seeded from that mark or the highest id in
+    use, whichever is higher, so ids never repeat, including the ids of
+    messages not inserted yet.
+
+    Returns:
+        range: The reserved ids.
+    """
+    global _reserved_ceiling
+    try:
+        last_id = cache.incr(MESSAGE_ID_SEQUENCE_KEY, count)
+    except ValueError:
+        seed = max(current_max_message_id(), reserved_message_id_ceiling())
+        cache.add(MESSAGE_ID_SEQUENCE_KEY, seed, timeout=None)
+        last_id = cache.incr(MESSAGE_ID_SEQUENCE_KEY, count)
+    # raised half a block early, an id is covered before the sequence
+    # reaches it, even while another process is seeding an evicted sequence
+    if last_id > _reserved_ceiling - MESSAGE_ID_RESERVATION_BLOCK // 2:
+        _reserved_ceiling = reserve_message_ids(last_id)
+    return range(last_id - count + 1, last_id + 1)
+
+
+def assign_message_ids(messages):
+    """
+    Give the messages without an id one from the shared sequence, or a
+    time-ordered one when settings.MESSAGE_ID_ALLOCATION is "time".
+
+    Does nothing when settings.MESSAGE_ID_ALLOCATION is "database", the
+    insert then lets the database allocate the id.
+    """
+    if database_allocates_ids():
+        return messages
+    pending = [message for message in messages if message.id is None]
+    if pending and time_ordered_ids():
+        generator = get_id_generator()
+        for message in pending:
+            message.id = generator.next_id()
+    elif pending:
+        for message, message_id in zip(pending, allocate_message_ids(len(pending))):
+            message.id = message_id
+    return messages
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_messages
+
+
+class Command(BaseCommand):
+    """
+    Move old messages from the hot Message collection into archive segments.
+    """
+
+    help = "Archive messages older than --days into compressed per-user, per-month segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Archive messages older than this (default: MESSAGE_ARCHIVE_AFTER_DAYS).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--max-batches", type=int)
+
+    def handle(self, *args, **options):
+        archived = archive_messages(
+            options["days"], options["batch_size"], options["max_batches"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} messages."))
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from chat.exports import EXPORT_FORMATS, export_user_history
+
+
+class Command(BaseCommand):
+    """
+    Stream a user's full message history to a file or stdout.
+    """
+
+    help = "Export a user's messages (and optionally events) as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id", type=int)
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+        parser.add_argument("--events", action="store_true")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", help="Write to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        chunks = export_user_history(
+            options["user_id"],
+            options["format"],
+            include_events=options["events"],
+            compress=options["gzip"],
+        )
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
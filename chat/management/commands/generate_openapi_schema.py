@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.schema import generate_schema
+
+
+class Command(BaseCommand):
+    """
+    Precompute the OpenAPI schema served to the Swagger UI.
+    """
+
+    help = "Write the OpenAPI schema to --output (default: OPENAPI_SCHEMA_FILE)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="File to write the schema to.")
+
+    def handle(self, *args, **options):
+        path = options["output"] or settings.OPENAPI_SCHEMA_FILE
+        schema = generate_schema()
+        with open(path, "wb") as schema_file:
+            schema_file.write(schema)
+        self.stdout.write(self.style.SUCCESS(f"Wrote the OpenAPI schema to {path}."))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+from django.utils import timezone
+
+from chat.ids import (
+    current_max_message_id,
+    database_allocates_ids,
+    message_id_for_time,
+)
+from chat.models import Message
+from chat.sharding import message_shards
+
+
+class Command(BaseCommand):
+    """
+    Prepare the message collections for time-ordered ids.
+
+    Existing ids are kept: they are far below the ids generated from the
+    current time, so old messages keep sorting before new ones and the
+    pagination cursors, read marks and archive segments stay valid.
+    """
+
+    help = (
+        "Check that existing message ids sort before time-ordered ids. With "
+        "--drop-sequence, also remove the djongo auto-increment counter of the "
+        "message collections, after which the database can no longer allocate "
+        "message ids."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--drop-sequence",
+            action="store_true",
+            help="Stop djongo inserts from incrementing the shared id counter.",
+        )
+
+    def handle(self, *args, **options):
+        floor = message_id_for_time(timezone.now())
+        for alias in message_shards():
+            highest = Message.objects.using(alias).aggregate(max_id=Max("id"))["max_id"]
+            self.stdout.write(f"{alias}: highest message id {highest or 0}.")
+
+        highest = current_max_message_id()
+        if highest >= floor:
+            raise CommandError(
+                f"Message id {highest} is above the time-ordered ids generated "
+                f"now ({floor}), new messages would sort before it."
+            )
+        self.stdout.write(
+            f"Existing ids, up to {highest}, sort before time-ordered ids "
+            f"(currently from {floor})."
+        )
+
+        if options["drop_sequence"]:
+            if database_allocates_ids():
+                raise CommandError(
+                    "Set MESSAGE_ID_ALLOCATION to 'time' before dropping the "
+                    "sequence, the database allocates message ids."
+                )
+            for alias in message_shards():
+                self.drop_sequence(alias)
+
+        self.stdout.write(
+            self.style.SUCCESS("Message ids are ready for MESSAGE_ID_ALLOCATION='time'.")
+        )
+
+    def drop_sequence(self, alias):
+        connection = connections[alias]
+        if connection.vendor != "djongo":
+            self.stdout.write(
+                f"{alias}: {connection.vendor} inserts explicit ids without a counter."
+            )
+            return
+        connection.ensure_connection()
+        # djongo increments the "auto" entry of a collection on every insert,
+        # even when the id is given, which serializes concurrent inserts
+        connection.connection["__schema__"].update_one(
+            {"name": Message._meta.db_table}, {"$unset": {"auto": ""}}
+        )
+        self.stdout.write(f"{alias}: dropped the auto-increment counter.")
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from chat.sharding import reshard_messages
+
+
+class Command(BaseCommand):
+    """
+    Move messages to the shard of their conversation after MESSAGE_SHARDS changed.
+    """
+
+    help = "Move every message to the shard of its conversation, reading from --source aliases (default: MESSAGE_SHARDS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            action="append",
+            dest="sources",
+            help="Database alias to move messages from, may be repeated.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many messages would be moved.",
+        )
+
+    def handle(self, *args, **options):
+        for alias in options["sources"] or []:
+            if alias not in connections.databases:
+                raise CommandError(f"Unknown database alias {alias!r}.")
+
+        moved = reshard_messages(
+            options["sources"], options["batch_size"], options["dry_run"]
+        )
+        verb = "Would move" if options["dry_run"] else "Moved"
+        for (source, target), count in sorted(moved.items()):
+            self.stdout.write(f"{verb} {count} messages from {source} to {target}.")
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {sum(moved.values())} messages in total.")
+        )
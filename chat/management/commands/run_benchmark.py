@@ -0,0 +1,158 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from common.benchmark import (
+    SCENARIOS,
+    BenchmarkContext,
+    SyntheticDataGenerator,
+    TRANSLATION_SCENARIOS,
+    dump_results,
+    measure_query_translation,
+    run_benchmarks,
+    run_capacity_benchmarks,
+    run_startup_benchmarks,
+    simulate_db_latency,
+)
+
+
+class Command(BaseCommand):
+    """
+    Run the chat and accounts benchmark suite.
+
+    The suite runs inside a throw-away test database populated with a synthetic
+    dataset, so it never touches the configured database. Run it against the
+    local SQLite stand-in with `--settings=chat_system.bench_settings`.
+    """
+
+    help = "Run the chat and accounts benchmark suite and report latencies as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            dest="scenarios",
+            choices=sorted(SCENARIOS),
+            help="Scenario to run, can be repeated (default: all).",
+        )
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--messages-per-user", type=int, default=50)
+        parser.add_argument("--receptions", type=int, default=1000)
+        parser.add_argument("--events-per-user", type=int, default=2)
+        parser.add_argument("--recurring-messages", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=0,
+            help="Also compare WSGI and ASGI capacity with this many concurrent clients.",
+        )
+        parser.add_argument("--capacity-requests", type=int, default=500)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=4,
+            help="Threads of both the WSGI and the ASGI process in the capacity "
+            "comparison.",
+        )
+        parser.add_argument(
+            "--db-latency-ms",
+            type=float,
+            default=0,
+            help="Delay added to every query to emulate a remote database.",
+        )
+        parser.add_argument(
+            "--startup-runs",
+            type=int,
+            default=0,
+            help="Also measure web and worker startup with `python -X importtime` this many times.",
+        )
+        parser.add_argument(
+            "--worker-settings",
+            default="chat_system.worker_settings",
+            help="Settings module of the measured worker process.",
+        )
+        parser.add_argument(
+            "--translation-cache-size",
+            type=int,
+            default=0,
+            help="Also measure the djongo query translation cache of this size on the chat endpoints.",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON results to this file as well."
+        )
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1.")
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            dataset = SyntheticDataGenerator(options["seed"]).populate(
+                users=options["users"],
+                messages_per_user=options["messages_per_user"],
+                receptions=options["receptions"],
+                events_per_user=options["events_per_user"],
+                recurring_messages=options["recurring_messages"],
+            )
+            context = BenchmarkContext(dataset, options["seed"])
+            if options["db_latency_ms"]:
+                simulate_db_latency(options["db_latency_ms"])
+            results = run_benchmarks(
+                context,
+                options["scenarios"] or list(SCENARIOS),
+                options["iterations"],
+                options["warmup"],
+            )
+            if options["startup_runs"]:
+                results["startup"] = run_startup_benchmarks(
+                    settings.SETTINGS_MODULE,
+                    options["worker_settings"],
+                    options["startup_runs"],
+                )
+            if options["concurrency"]:
+                results["capacity"] = run_capacity_benchmarks(
+                    context,
+                    options["concurrency"],
+                    options["capacity_requests"],
+                    options["threads"],
+                )
+            if options["translation_cache_size"]:
+                results["query_translation"] = measure_query_translation(
+                    context,
+                    TRANSLATION_SCENARIOS,
+                    options["iterations"],
+                    options["translation_cache_size"],
+                )
+            results["parameters"] = {
+                key: options[key]
+                for key in (
+                    "iterations",
+                    "warmup",
+                    "users",
+                    "messages_per_user",
+                    "receptions",
+                    "events_per_user",
+                    "recurring_messages",
+                    "seed",
+                    "concurrency",
+                    "capacity_requests",
+                    "threads",
+                    "db_latency_ms",
+                    "startup_runs",
+                    "translation_cache_size",
+                )
+            }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(dump_results(results, options["output"]))
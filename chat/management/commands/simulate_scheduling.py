@@ -0,0 +1,80 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from common.benchmark import dump_results
+from common.schedule_simulation import SchedulingSimulation, default_start
+
+
+class Command(BaseCommand):
+    """
+    Fast-forward the event and message scheduling path on a simulated clock.
+
+    Like run_benchmark, the simulation runs inside a throw-away test database.
+    Run it with `--settings=chat_system.bench_settings`, which executes the
+    tasks eagerly on an in-memory broker.
+    """
+
+    help = "Simulate months of scheduled events and messages through celery beat and report the outcome as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument(
+            "--start",
+            help="Simulated start, ISO 8601 date or datetime in UTC (default: today).",
+        )
+        parser.add_argument(
+            "--max-interval",
+            type=int,
+            default=300,
+            help="Longest beat sleep between two ticks, in seconds (beat uses 5).",
+        )
+        parser.add_argument("--events-per-day", type=int, default=2)
+        parser.add_argument("--scheduled-messages-per-day", type=int, default=2)
+        parser.add_argument("--recurring-per-week", type=int, default=1)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--receptions", type=int, default=20)
+        parser.add_argument("--sample-days", type=int, default=30)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="Write the JSON results to this file as well."
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1 or options["max_interval"] < 1:
+            raise CommandError("--days and --max-interval must be at least 1.")
+        start = default_start()
+        if options["start"]:
+            try:
+                start = datetime.fromisoformat(options["start"])
+            except ValueError:
+                raise CommandError("Invalid --start.")
+            if start.tzinfo is None:
+                start = start.replace(tzinfo=dt_timezone.utc)
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = SchedulingSimulation(
+                start,
+                days=options["days"],
+                max_interval=options["max_interval"],
+                events_per_day=options["events_per_day"],
+                scheduled_messages_per_day=options["scheduled_messages_per_day"],
+                recurring_per_week=options["recurring_per_week"],
+                users=options["users"],
+                receptions=options["receptions"],
+                sample_days=options["sample_days"],
+                seed=options["seed"],
+            ).run()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(dump_results(results, options["output"]))
@@ -1,23 +1,174 @@
+import calendar
+import math
+from collections import defaultdict
+from datetime import timedelta
+
 from django.db import models
 from accounts.models import User
+from chat_system.db_routers import shard_for_message
 from common.models import Base
+from .ids import assign_message_ids
+
+
+class MessageQuerySet(models.QuerySet):
+    """
+    QuerySet writing new messages to the shard of their conversation.
+
+    Without an explicit `.using()`, `create()` saves through the router and
+    `bulk_create()` splits the messages into one insert per shard. Ids are
+    assigned before the insert unless the database allocates them, see
+    chat.ids.
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=shard_for_message(obj))
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = assign_message_ids(list(objs))
+        if self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+
+        shards = defaultdict(list)
+        for obj in objs:
+            shards[shard_for_message(obj)].append(obj)
+        for alias, shard_objs in shards.items():
+            self.using(alias).bulk_create(shard_objs, *args, **kwargs)
+        return objs
 
 
 class Message(Base):
+    # users live in the default database while messages may live on a shard
     sender = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="sent_messages"
+        User,
+        on_delete=models.CASCADE,
+        related_name="sent_messages",
+        db_constraint=False,
     )
     receiver = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="received_messages"
+        User,
+        on_delete=models.CASCADE,
+        related_name="received_messages",
+        db_constraint=False,
     )
     content = models.TextField(blank=True, null=True)
-    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True)
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True, db_constraint=False
+    )
     scheduled_time = models.DateTimeField(null=True, blank=True)
     is_recurring = models.BooleanField(default=False)
+    # attachments live in the default database, see attach_attachments
+    attachment = models.ForeignKey(
+        "Attachment",
+        on_delete=models.DO_NOTHING,
+        null=True,
+        blank=True,
+        related_name="messages",
+        db_constraint=False,
+    )
+
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["sender", "updated_at"]),
+            models.Index(fields=["receiver", "updated_at"]),
+        ]
 
     def __str__(self):
         return self.content
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            assign_message_ids([self])
+        super().save(*args, **kwargs)
+
+
+SCHEDULING_PENDING = "pending"
+SCHEDULING_SCHEDULED = "scheduled"
+SCHEDULING_FAILED = "failed"
+SCHEDULING_STATUS_CHOICES = (
+    (SCHEDULING_PENDING, "Pending"),
+    (SCHEDULING_SCHEDULED, "Scheduled"),
+    (SCHEDULING_FAILED, "Failed"),
+)
+
+
+class AttachmentBlob(Base):
+    """
+    Content of attachments, stored once per SHA-256 of the bytes.
+
+    Attachments uploaded with the same content share the blob, see
+    chat.attachments.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    file = models.FileField(upload_to="attachments/", max_length=255)
+
+    def __str__(self):
+        return self.sha256
+
+
+class Attachment(Base):
+    """
+    File attached by a user to their messages, uploaded in chunks.
+
+    The upload is resumable: chunks of `chunk_size` bytes are sent in order
+    and `received_chunks` counts the stored ones. Once all are received they
+    are assembled into the blob of their content, in the background.
+    """
+
+    UPLOADING = "uploading"
+    ASSEMBLING = "assembling"
+    READY = "ready"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (UPLOADING, "Uploading"),
+        (ASSEMBLING, "Assembling"),
+        (READY, "Ready"),
+        (FAILED, "Failed"),
+    )
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="attachments"
+    )
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(
+        max_length=100, default="application/octet-stream"
+    )
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_chunks = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=UPLOADING)
+    blob = models.ForeignKey(
+        AttachmentBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="attachments",
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "updated_at"])]
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def chunk_count(self):
+        return math.ceil(self.size / self.chunk_size)
+
+    def chunk_length(self, index):
+        """
+        Return the number of bytes of a chunk, the last one may be shorter
+        """
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
 
 class Event(Base):
     title = models.CharField(max_length=100, blank=True, null=True)
@@ -27,6 +178,13 @@ class Event(Base):
     schedule_on = models.DateTimeField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     is_complete = models.BooleanField(default=False)
+    # periodic task created by `chat.tasks.schedule_event` after the commit
+    scheduling_status = models.CharField(
+        max_length=20, choices=SCHEDULING_STATUS_CHOICES, default=SCHEDULING_PENDING
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["organize_by", "updated_at"])]
 
     def __str__(self):
         return self.title
@@ -38,6 +196,12 @@ class MessageSetting(Base):
     receptions = models.ManyToManyField(User, related_name="message_receptions")
     is_active = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["updated_at"]),
+            models.Index(fields=["is_active"]),
+        ]
+
 
 class RecurringMessage(Base):
     SCHEDULE_CHOICES = (
@@ -47,10 +211,134 @@ class RecurringMessage(Base):
     )
 
     message = models.ForeignKey(
-        "Message", on_delete=models.CASCADE, null=True, blank=True
+        "Message",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        db_constraint=False,
     )
     start_date = models.DateTimeField(null=True, blank=True)
     end_date = models.DateTimeField(null=True, blank=True)
     schedule = models.CharField(
         max_length=50, choices=SCHEDULE_CHOICES, default="daily"
     )
+    # periodic tasks created by `chat.tasks.schedule_recurring_message` after the commit
+    scheduling_status = models.CharField(
+        max_length=20, choices=SCHEDULING_STATUS_CHOICES, default=SCHEDULING_PENDING
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["updated_at"])]
+
+    def schedule_dates(self):
+        """
+        Return the dates the message is sent on, from start_date to end_date.
+
+        Monthly schedules keep the day of start_date, on the last day of
+        shorter months.
+        """
+        dates = []
+        current_date = self.start_date
+        while current_date <= self.end_date:
+            dates.append(current_date)
+            if self.schedule == "daily":
+                current_date = self.start_date + timedelta(days=len(dates))
+            elif self.schedule == "weekly":
+                current_date = self.start_date + timedelta(weeks=len(dates))
+            else:
+                month = self.start_date.month - 1 + len(dates)
+                year = self.start_date.year + month // 12
+                month = month % 12 + 1
+                current_date = self.start_date.replace(
+                    year=year,
+                    month=month,
+                    day=min(
+                        self.start_date.day, calendar.monthrange(year, month)[1]
+                    ),
+                )
+        return dates
+
+
+class ConversationReadState(Base):
+    """
+    Read state of a user's conversation with a peer.
+
+    Stored as a high-water mark instead of a flag per message: every message
+    from `peer` up to `last_read_message_id` is read, and `unread_count` is
+    maintained incrementally as messages arrive.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="read_states"
+    )
+    peer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    last_read_message_id = models.BigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["user", "peer"]
+
+
+class MessageArchiveSegment(Base):
+    """
+    Compressed segment of a user's archived messages for one month.
+
+    `data` holds the zlib-compressed JSON list of the archived messages, the
+    message id range is kept alongside as a small index so reads only unpack
+    the segments a cursor actually reaches.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="archive_segments"
+    )
+    month = models.DateField()
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "last_message_id"])]
+
+
+class SyncTombstone(Base):
+    """
+    Record of a deleted row, reported to syncing clients.
+
+    `user` is the user whose clients must drop the row, or null for rows
+    every user syncs. Tombstones are pruned after
+    settings.SYNC_TOMBSTONE_RETENTION_DAYS, older sync tokens are refused.
+    """
+
+    # written while a user's rows are deleted, so it may outlive the user
+    # until pruned
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        blank=True,
+        related_name="sync_tombstones",
+        db_constraint=False,
+    )
+    collection = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "updated_at"]),
+            models.Index(fields=["updated_at"]),
+        ]
+
+
+class MessageIdReservation(Base):
+    """
+    High-water mark of the message ids reserved from the shared sequence.
+
+    The sequence lives in the cache and hands out ids only below `ceiling`,
+    which is raised in blocks before it is reached. When the sequence is
+    evicted it is seeded above the ceiling, so ids reserved for messages
+    still waiting in a write-behind buffer are never reserved again. A
+    single row, see chat.ids.allocate_message_ids.
+    """
+
+    ceiling = models.BigIntegerField(default=0)
@@ -0,0 +1,121 @@
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from common.serializers import requested_fields
+from .archive import has_archived_messages, read_archived_messages
+from .ids import message_id_for_time, time_ordered_ids
+
+
+class MessageKeysetPagination(BasePagination):
+    """
+    Keyset pagination of a user's messages, newest first.
+
+    A page is requested with `?limit=` and continued with `?before=<id>`, the id
+    of the oldest message already received. When the cursor reaches beyond the
+    hot collection the page is filled from the user's archive segments, merged
+    with the hot messages by id.
+    Without either parameter the hot messages are returned unpaginated.
+    Pages are read with `page()` of chat.sharding.InboxMessages, which merges
+    the newest messages of every shard. With time-ordered ids `before` also
+    accepts an ISO 8601 datetime, listing the messages sent before it.
+
+    Attributes:
+        default_limit: Page size used when only `before` is given.
+        max_limit: Largest page size a client may request.
+    """
+
+    default_limit = 50
+    max_limit = 200
+    limit_query_param = "limit"
+    cursor_query_param = "before"
+
+    def parse_int(self, request, param, default):
+        value = request.query_params.get(param)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise NotFound(f"Invalid {param}.")
+        if value < 1:
+            raise NotFound(f"Invalid {param}.")
+        return value
+
+    def parse_cursor(self, request):
+        value = request.query_params.get(self.cursor_query_param)
+        if value is not None and time_ordered_ids() and not value.isdigit():
+            try:
+                before = parse_datetime(value)
+            except ValueError:
+                before = None
+            if before is None:
+                raise NotFound(f"Invalid {self.cursor_query_param}.")
+            if is_naive(before):
+                before = make_aware(before)
+            return message_id_for_time(before)
+        return self.parse_int(request, self.cursor_query_param, None)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            self.limit_query_param not in request.query_params
+            and self.cursor_query_param not in request.query_params
+        ):
+            return None
+
+        self.request = request
+        self.limit = min(
+            self.parse_int(request, self.limit_query_param, self.default_limit),
+            self.max_limit,
+        )
+        before = self.parse_cursor(request)
+        page = queryset.page(before=before, limit=self.limit)
+
+        # pinned hot messages keep their low ids, archived messages may be
+        # newer than the oldest of the page even when it is full
+        archived = []
+        oldest = page[-1].id if len(page) == self.limit else None
+        if has_archived_messages(request.user.id, before=before, after=oldest):
+            page_ids = {message.id for message in page}
+            archived = [
+                row
+                for row in read_archived_messages(
+                    request.user.id, before=before, limit=self.limit
+                )
+                # left in both places by an interrupted archival
+                if row["id"] not in page_ids
+            ]
+        ids = sorted(
+            [message.id for message in page] + [row["id"] for row in archived],
+            reverse=True,
+        )[: self.limit]
+        kept = set(ids)
+        page = [message for message in page if message.id in kept]
+        self.archived = [row for row in archived if row["id"] in kept]
+        self.page_ids = [message.id for message in page]
+        self.last_id = ids[-1] if ids else None
+        return page
+
+    def get_paginated_response(self, data):
+        fields = requested_fields(self.request)
+        rows = list(zip(self.page_ids, data))
+        for message in self.archived:
+            message_id = message["id"]
+            if fields is not None:
+                message = {
+                    name: value for name, value in message.items() if name in fields
+                }
+            rows.append((message_id, message))
+        rows.sort(key=lambda row: row[0], reverse=True)
+        results = [message for _, message in rows]
+        next_url = None
+        if len(results) == self.limit:
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(),
+                self.cursor_query_param,
+                self.last_id,
+            )
+        return Response({"next": next_url, "results": results})
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.utils import timezone
+
+from common.helper import create_cronjob, manage_periodic_task
+from .models import (
+    SCHEDULING_FAILED,
+    SCHEDULING_PENDING,
+    SCHEDULING_SCHEDULED,
+    Event,
+    RecurringMessage,
+)
+from .sharding import find_message
+
+
+def set_scheduling_status(model, pk, scheduling_status):
+    # update() skips post_save and auto_now, touch updated_at so syncing
+    # clients see the new status
+    model.objects.filter(pk=pk).update(
+        scheduling_status=scheduling_status, updated_at=timezone.now()
+    )
+
+
+def fail_scheduling(model, pk):
+    """
+    Mark an event or recurring message failed unless it was scheduled
+    """
+    model.objects.filter(pk=pk, scheduling_status=SCHEDULING_PENDING).update(
+        scheduling_status=SCHEDULING_FAILED, updated_at=timezone.now()
+    )
+
+
+def schedule_event(event_id):
+    """
+    Create the periodic task sending an event's message on its date.
+
+    Returns:
+        bool: False if the event is gone, already scheduled or has no date.
+    """
+    event = Event.objects.filter(id=event_id).first()
+    if event is None or event.scheduling_status == SCHEDULING_SCHEDULED:
+        return False
+    if event.schedule_on is None:
+        set_scheduling_status(Event, event.id, SCHEDULING_FAILED)
+        return False
+
+    data = {
+        "name": f"event task - {event.id}",
+        "title": f"event task - {event.title}",
+        "task": "chat.tasks.send_event_message",
+        "task_data": {"event_id": event.id},
+        "queue": "fanout_events",
+        "priority": settings.TASK_PRIORITIES["event_fanout"],
+    }
+    manage_periodic_task(data, create_cronjob(event.schedule_on))
+    set_scheduling_status(Event, event.id, SCHEDULING_SCHEDULED)
+    return True
+
+
+def schedule_recurring_message(recurring_message_id):
+    """
+    Create one periodic task per date of a recurring message.
+
+    The tasks are named after the recurring message and the date, a retry
+    after a partial run only creates the missing ones.
+
+    Returns:
+        bool: False if the recurring message is gone, already scheduled or
+              has no message or dates to send it on.
+    """
+    recurring_message = RecurringMessage.objects.filter(
+        id=recurring_message_id
+    ).first()
+    if (
+        recurring_message is None
+        or recurring_message.scheduling_status == SCHEDULING_SCHEDULED
+    ):
+        return False
+
+    message = find_message(recurring_message.message_id)
+    if (
+        message is None
+        or recurring_message.start_date is None
+        or recurring_message.end_date is None
+    ):
+        set_scheduling_status(RecurringMessage, recurring_message.id, SCHEDULING_FAILED)
+        return False
+
+    data = {
+        "title": f"Message task - {message.content}",
+        "task": "chat.tasks.create_schedule_message",
+        "task_data": {
+            "is_recurring": True,
+            "content": message.content,
+            "sender_id": message.sender_id,
+        },
+        "queue": "fanout_recurring",
+        "priority": settings.TASK_PRIORITIES["recurring_fanout"],
+    }
+    for schedule_date in recurring_message.schedule_dates():
+        data["name"] = (
+            f"recurring message task - {recurring_message.id} - "
+            f"{schedule_date.isoformat()}"
+        )
+        manage_periodic_task(data, create_cronjob(schedule_date))
+    set_scheduling_status(RecurringMessage, recurring_message.id, SCHEDULING_SCHEDULED)
+    return True
@@ -1,46 +1,172 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from .models import Message, Event, MessageSetting, RecurringMessage
+from accounts.models import User
+from common.serializers import SparseFieldsetMixin
 
+from .attachments import attachment_summary
+from .ids import is_valid_client_message_id, time_ordered_ids
+from .models import (
+    Attachment,
+    ConversationReadState,
+    Event,
+    Message,
+    MessageSetting,
+    RecurringMessage,
+    SyncTombstone,
+)
+from .sharding import find_message
 
-class MessageSerializer(serializers.ModelSerializer):
+
+class ShardedMessageField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field resolving a message on whichever shard stores it
+    """
+
+    def to_internal_value(self, data):
+        try:
+            message = find_message(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if message is None:
+            self.fail("does_not_exist", pk_value=data)
+        return message
+
+
+class AttachmentField(serializers.PrimaryKeyRelatedField):
+    """
+    Attachment of a message, written as the id of a ready attachment of the
+    requester and read as its metadata, never its content
+    """
+
+    def get_queryset(self):
+        request = self.context.get("request")
+        user_id = request.user.id if request is not None else None
+        return Attachment.objects.filter(status=Attachment.READY, user_id=user_id)
+
+    def use_pk_only_optimization(self):
+        return False
+
+    def to_representation(self, value):
+        return attachment_summary(value)
+
+
+class AttachmentSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the Attachment model.
+
+    This serializer handles the creation of chunked uploads and reports their
+    progress: the client sends `chunk_count` chunks of `chunk_size` bytes,
+    resuming from `received_chunks` after an interruption.
+    """
+
+    chunk_count = serializers.IntegerField(read_only=True)
+    size = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = Attachment
+        fields = [
+            "id",
+            "name",
+            "content_type",
+            "size",
+            "chunk_size",
+            "chunk_count",
+            "received_chunks",
+            "status",
+            "created_at",
+        ]
+        read_only_fields = ["chunk_size", "received_chunks", "status"]
+
+    def validate_size(self, value):
+        if value > settings.ATTACHMENT_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Attachments are limited to {settings.ATTACHMENT_MAX_SIZE} bytes."
+            )
+        return value
+
+
+class MessageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for the Message model.
 
     This serializer handles the serialization of Message objects, including sender and receiver names.
+    GET requests can limit the fields with `?fields=`, see SparseFieldsetMixin.
+    With time-ordered ids the client may send the id of a new message, see
+    chat.ids, and retry with the same id without duplicating the message.
 
     Attributes:
+        id: IntegerField with the message id, writable with time-ordered ids.
         sender_name: CharField representing the first name of the message sender (read-only).
         receiver_name: CharField representing the first name of the message receiver (read-only).
+        attachment: AttachmentField with the id of an uploaded attachment, read as its metadata.
     """
 
+    id = serializers.IntegerField(required=False)
     sender_name = serializers.CharField(source="sender.first_name", read_only=True)
     receiver_name = serializers.CharField(source="receiver.first_name", read_only=True)
+    attachment = AttachmentField(required=False, allow_null=True)
 
     class Meta:
         model = Message
         fields = [
+            "id",
             "sender",
             "sender_name",
             "receiver",
             "receiver_name",
             "content",
             "scheduled_time",
+            "attachment",
             "created_at",
         ]
 
+    def validate_id(self, value):
+        if not time_ordered_ids():
+            raise serializers.ValidationError("Message ids are allocated by the server.")
+        if not is_valid_client_message_id(value):
+            raise serializers.ValidationError(
+                "Invalid message id, generate a time-ordered id from the current "
+                "time, not ahead of the server clock."
+            )
+        return value
+
 
-class EventSerializer(serializers.ModelSerializer):
+class RelatedMessageSerializer(MessageSerializer):
+    """
+    Serializer for a message replying to or forwarding another message.
+
+    Attributes:
+        message_id: IntegerField with the id of the replied or forwarded message (write-only).
+    """
+
+    message_id = serializers.IntegerField(write_only=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ["message_id"]
+
+
+class EventSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for the Event model.
 
     This serializer handles the serialization of Events objects, including title and organize name,description and schedule time.
+    GET requests can limit the fields with `?fields=`, see SparseFieldsetMixin.
+    The periodic task is created after the response, `scheduling_status` tells
+    when it is.
 
     """
 
     class Meta:
         model = Event
-        fields = ["title", "organize_by", "description", "schedule_on"]
+        fields = [
+            "title",
+            "organize_by",
+            "description",
+            "schedule_on",
+            "scheduling_status",
+        ]
+        read_only_fields = ["scheduling_status"]
 
 
 class MessageSettingSerializer(serializers.ModelSerializer):
@@ -64,8 +190,103 @@ class RecurringMessageSerializer(serializers.ModelSerializer):
 
     This serializer handles the serialization of Recurring message objects.
 
+    The periodic tasks are created after the response, `scheduling_status`
+    tells when they are.
+
+    Attributes:
+        message: ShardedMessageField representing the recurring message, looked up on every shard.
     """
 
+    message = ShardedMessageField(
+        queryset=Message.objects.all(), required=False, allow_null=True
+    )
+
     class Meta:
         model = RecurringMessage
-        fields = ["start_date", "end_date", "schedule", "message"]
+        fields = ["start_date", "end_date", "schedule", "message", "scheduling_status"]
+        read_only_fields = ["scheduling_status"]
+
+
+class ConversationReadStateSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the Conversation read state model.
+
+    This serializer handles the serialization of a user's unread count and read
+    high-water mark in the conversation with a peer.
+
+    """
+
+    class Meta:
+        model = ConversationReadState
+        fields = ["peer", "last_read_message_id", "unread_count", "updated_at"]
+
+
+class MarkReadSerializer(serializers.Serializer):
+    """
+    Serializer for marking a conversation read.
+
+    Attributes:
+        peer: IntegerField representing the user on the other side of the conversation.
+        up_to: IntegerField representing the id of the last message read.
+    """
+
+    peer = serializers.IntegerField()
+    up_to = serializers.IntegerField(min_value=0)
+
+    def validate_peer(self, value):
+        if not User.objects.filter(pk=value).exists():
+            raise serializers.ValidationError("Unknown user.")
+        return value
+
+
+class SyncMessageSerializer(MessageSerializer):
+    """
+    Serializer for messages returned by the sync endpoint.
+    """
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ["updated_at"]
+
+
+class SyncEventSerializer(EventSerializer):
+    """
+    Serializer for events returned by the sync endpoint.
+    """
+
+    class Meta(EventSerializer.Meta):
+        fields = ["id"] + EventSerializer.Meta.fields + ["updated_at"]
+
+
+class SyncMessageSettingSerializer(MessageSettingSerializer):
+    """
+    Serializer for message settings returned by the sync endpoint.
+    """
+
+    class Meta(MessageSettingSerializer.Meta):
+        fields = ["id"] + MessageSettingSerializer.Meta.fields + ["updated_at"]
+
+
+class SyncRecurringMessageSerializer(RecurringMessageSerializer):
+    """
+    Serializer for recurring messages returned by the sync endpoint.
+    """
+
+    class Meta(RecurringMessageSerializer.Meta):
+        fields = ["id"] + RecurringMessageSerializer.Meta.fields + ["updated_at"]
+
+
+class SyncTombstoneSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the Sync tombstone model.
+
+    Attributes:
+        type: CharField representing the collection the deleted row belonged to.
+        id: IntegerField representing the id of the deleted row.
+    """
+
+    type = serializers.CharField(source="collection")
+    id = serializers.IntegerField(source="object_id")
+
+    class Meta:
+        model = SyncTombstone
+        fields = ["type", "id", "updated_at"]
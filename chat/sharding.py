@@ -0,0 +1,198 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import User
+from chat_system.db_routers import shard_for_conversation, shard_for_message
+from .models import Attachment, Message
+
+
+def message_shards():
+    return list(settings.MESSAGE_SHARDS)
+
+
+def find_message(message_id):
+    """
+    Return the message with the given id from whichever shard stores it.
+
+    Message ids do not encode their conversation, so every shard is asked
+    until the message is found.
+    """
+    for alias in message_shards():
+        message = Message.objects.using(alias).filter(id=message_id).first()
+        if message is not None:
+            return message
+    return None
+
+
+def conversation_messages(user_id, peer_id):
+    """
+    Return the messages exchanged between two users, read from their shard
+    """
+    return Message.objects.using(shard_for_conversation(user_id, peer_id)).filter(
+        Q(sender_id=user_id, receiver_id=peer_id)
+        | Q(sender_id=peer_id, receiver_id=user_id)
+    )
+
+
+def attach_users(messages):
+    """
+    Fill the sender and receiver of messages read without select_related.
+
+    Users live in the default database, a shard cannot join them, so they are
+    fetched with one query for the whole page.
+    """
+    pending = [
+        message
+        for message in messages
+        if not Message.sender.is_cached(message)
+        or not Message.receiver.is_cached(message)
+    ]
+    user_ids = {message.sender_id for message in pending}
+    user_ids.update(message.receiver_id for message in pending)
+    users = User.objects.in_bulk(user_ids) if user_ids else {}
+    for message in pending:
+        Message.sender.field.set_cached_value(message, users.get(message.sender_id))
+        Message.receiver.field.set_cached_value(
+            message, users.get(message.receiver_id)
+        )
+    return messages
+
+
+def attach_attachments(messages):
+    """
+    Fill the attachment of messages read without select_related.
+
+    Attachments live in the default database like the users, they are
+    fetched with one query for the whole page.
+    """
+    pending = [
+        message
+        for message in messages
+        if message.attachment_id is not None
+        and not Message.attachment.is_cached(message)
+    ]
+    attachment_ids = {message.attachment_id for message in pending}
+    attachments = (
+        Attachment.objects.in_bulk(attachment_ids) if attachment_ids else {}
+    )
+    for message in pending:
+        Message.attachment.field.set_cached_value(
+            message, attachments.get(message.attachment_id)
+        )
+    return messages
+
+
+class InboxMessages:
+    """
+    Messages sent or received by a user, gathered from every shard.
+
+    A user's conversations are spread over the shards, so the inbox is the
+    only cross-conversation view and the only one paying for a scatter-gather:
+    each shard returns its newest messages and the pages are merged by id.
+
+    Attributes:
+        user_id: The user whose messages are listed.
+        with_users: Whether the sender, receiver and attachment are loaded with the messages.
+    """
+
+    def __init__(self, user_id, with_users=True):
+        self.user_id = user_id
+        self.with_users = with_users
+
+    def attach_users(self, messages):
+        if self.with_users:
+            attach_users(messages)
+            attach_attachments(messages)
+        return messages
+
+    def shard_querysets(self, before=None):
+        shards = message_shards()
+        for alias in shards:
+            queryset = Message.objects.using(alias).filter(
+                Q(sender_id=self.user_id) | Q(receiver_id=self.user_id)
+            )
+            if self.with_users and alias == "default":
+                queryset = queryset.select_related("sender", "receiver", "attachment")
+            if before is not None:
+                queryset = queryset.filter(id__lt=before)
+            yield queryset
+
+    def page(self, before=None, limit=50):
+        """
+        Return up to `limit` messages with an id lower than `before`, newest first
+        """
+        pages = [
+            list(queryset.order_by("-id")[:limit])
+            for queryset in self.shard_querysets(before)
+        ]
+        merged = heapq.merge(*pages, key=attrgetter("id"), reverse=True)
+        return self.attach_users(list(islice(merged, limit)))
+
+    def __iter__(self):
+        messages = heapq.merge(
+            *(queryset.order_by("id") for queryset in self.shard_querysets()),
+            key=attrgetter("id"),
+        )
+        return iter(self.attach_users(list(messages)))
+
+
+def reshard_messages(sources=None, batch_size=1000, dry_run=False):
+    """
+    Move messages stored on the wrong shard to the shard of their conversation.
+
+    Run after changing settings.MESSAGE_SHARDS. A database dropped from the
+    shards can be drained by passing its alias, which must still be configured
+    in settings.DATABASES. Messages keep their id, replies and recurring
+    messages referencing them stay valid.
+
+    Args:
+        sources (list): Aliases to move messages from, defaults to every shard.
+        batch_size (int): Number of messages read and moved per transaction.
+        dry_run (bool): Only count the messages that would be moved.
+
+    Returns:
+        Counter: Number of moved messages per (source, target) pair.
+    """
+    moved = Counter()
+    for source in sources or message_shards():
+        last_id = 0
+        while True:
+            batch = list(
+                Message.objects.using(source)
+                .filter(id__gt=last_id)
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            targets = defaultdict(list)
+            for message in batch:
+                target = shard_for_message(message)
+                if target != source:
+                    targets[target].append(message)
+
+            for target, messages in targets.items():
+                moved[(source, target)] += len(messages)
+                if dry_run:
+                    continue
+                # the copy is committed before the source delete, an
+                # interrupted run leaves duplicates that the next run removes
+                with transaction.atomic(using=source), transaction.atomic(
+                    using=target
+                ):
+                    Message.objects.using(target).bulk_create(
+                        messages, ignore_conflicts=True
+                    )
+                    # a plain delete() would cascade to replies that now live
+                    # on the target shard
+                    Message.objects.using(source).filter(
+                        id__in=[message.id for message in messages]
+                    )._raw_delete(source)
+    return moved
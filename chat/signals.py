@@ -1,9 +1,14 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
-from common.helper import create_cronjob, manage_periodic_task
-from .models import Event, MessageSetting, RecurringMessage
-from datetime import timedelta
+from common.cache import MAILBOX_VERSION, bump_version
+from common.helper import increment_unread_counts
+from .attachments import delete_chunks
+from .models import Attachment, Event, Message, MessageSetting, RecurringMessage
+from .sync import record_tombstones
+from .tasks import schedule_event, schedule_recurring_message
 
 
 @receiver(post_save, sender=Event)
@@ -11,10 +16,10 @@ def event_creation(sender, created, instance, **kwargs):
     """
     Signal receiver function triggered after saving an Event object.
 
-    This function is called when an Event object is created. It creates a cron job
-    to handle event-related tasks, such as sending event messages. It utilizes
-    the `create_cronjob` function to create a cron job based on the event's schedule.
-    Then, it manages the periodic task using the `manage_periodic_task` function.
+    This function is called when an Event object is created. Once the
+    transaction commits, it dispatches the `schedule_event` task, which creates
+    the periodic task sending the event message, so the request saving the
+    event does not wait for the scheduling.
 
     Args:
         sender: The model class that sends the signal (Event in this case).
@@ -25,13 +30,7 @@ def event_creation(sender, created, instance, **kwargs):
     """
 
     if created:
-        crontab_obj = create_cronjob(instance.schedule_on)
-        data = {
-            "title": f"event task - {instance.title}",
-            "task": "chat.tasks.send_event_message",
-            "task_data": {"event_id": instance.id},
-        }
-        manage_periodic_task(data, crontab_obj)
+        transaction.on_commit(lambda: schedule_event.delay(instance.id))
 
 
 @receiver(post_save, sender=MessageSetting)
@@ -40,9 +39,9 @@ def message_setting_creation(sender, created, instance, **kwargs):
     Signal receiver function triggered after saving a MessageSetting object.
 
     This function is called when a MessageSetting object is created or updated.
-    It ensures that only the newly created or updated MessageSetting instance is
-    marked as active, while all other instances are set to inactive. This behavior
-    maintains the uniqueness of the active setting.
+    When the saved instance is active, every other active instance is set to
+    inactive. This behavior maintains the uniqueness of the active setting
+    while only writing the rows that were still active.
 
     Args:
         sender: The model class that sends the signal (MessageSetting in this case).
@@ -51,7 +50,12 @@ def message_setting_creation(sender, created, instance, **kwargs):
         **kwargs: Additional keyword arguments passed to the function.
 
     """
-    MessageSetting.objects.exclude(id=instance.id).update(is_active=False)
+    if not instance.is_active:
+        return
+    # update() skips auto_now, touch updated_at so syncing clients see the change
+    MessageSetting.objects.filter(is_active=True).exclude(id=instance.id).update(
+        is_active=False, updated_at=timezone.now()
+    )
 
 
 @receiver(post_save, sender=RecurringMessage)
@@ -59,11 +63,10 @@ def manage_recurring_msg(sender, created, instance, **kwargs):
     """
     Signal receiver function triggered after saving a RecurringMessage object.
 
-    This function is called when a RecurringMessage object is created. It generates
-    scheduled messages based on the recurrence pattern specified in the RecurringMessage
-    instance. It calculates the schedule dates between the start and end dates, and for
-    each schedule date, it creates a cron job using the `create_cronjob` function. It
-    then manages the periodic task using the `manage_periodic_task` function.
+    This function is called when a RecurringMessage object is created. Once
+    the transaction commits, it dispatches the `schedule_recurring_message`
+    task, which creates one periodic task per schedule date between the start
+    and end dates, so the request does not wait for hundreds of writes.
 
     Args:
         sender: The model class that sends the signal (RecurringMessage in this case).
@@ -74,30 +77,118 @@ def manage_recurring_msg(sender, created, instance, **kwargs):
     """
 
     if created:
-        start_date = instance.start_date
-        end_date = instance.end_date
-        schedule = instance.schedule
-        schedule_dates = []
-        current_date = start_date
-        while current_date <= end_date:
-            schedule_dates.append(current_date)
-            if schedule == "daily":
-                current_date += timedelta(days=1)
-            elif schedule == "weekly":
-                current_date += timedelta(weeks=1)
-            elif schedule == "monthly":
-                current_date = current_date.replace(day=1) + timedelta(days=31)
-
-        data = {
-            "title": f"Message task - {instance.message.content}",
-            "task": "chat.tasks.create_schedule_message",
-            "task_data": {
-                "is_recurring": True,
-                "content": instance.message.content,
-                "sender_id": instance.message.sender.id,
-            },
-        }
-
-        for schedule_date in schedule_dates:
-            crontab_obj = create_cronjob(schedule_date)
-            manage_periodic_task(data, crontab_obj)
+        transaction.on_commit(lambda: schedule_recurring_message.delay(instance.id))
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_mailbox_update(sender, instance, **kwargs):
+    """
+    Signal receiver function triggered after saving or deleting a Message object.
+
+    This function bumps the mailbox version of the sender and the receiver, so
+    their cached message lists are invalidated.
+
+    Args:
+        sender: The model class that sends the signal (Message in this case).
+        instance: The Message instance that was saved or deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    bump_version(MAILBOX_VERSION, [instance.sender_id, instance.receiver_id])
+
+
+@receiver(post_save, sender=Message)
+def message_unread_update(sender, created, instance, **kwargs):
+    """
+    Signal receiver function triggered after saving a Message object.
+
+    This function counts a newly created message as unread in the receiver's
+    conversation with the sender.
+
+    Args:
+        sender: The model class that sends the signal (Message in this case).
+        created (bool): A boolean indicating whether the Message instance was created.
+        instance: The Message instance that was saved.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    if created:
+        increment_unread_counts(instance.sender_id, [instance.receiver_id])
+
+
+@receiver(post_delete, sender=Message)
+def message_tombstone(sender, instance, **kwargs):
+    """
+    Signal receiver function triggered after deleting a Message object.
+
+    This function records the deletion for the sender and the receiver, so
+    their clients drop the message on their next sync.
+
+    Args:
+        sender: The model class that sends the signal (Message in this case).
+        instance: The Message instance that was deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    record_tombstones(
+        "messages", instance.id, [instance.sender_id, instance.receiver_id]
+    )
+
+
+@receiver(post_delete, sender=Event)
+def event_tombstone(sender, instance, **kwargs):
+    """
+    Signal receiver function triggered after deleting an Event object.
+
+    This function records the deletion for the organizer, so their clients
+    drop the event on their next sync.
+
+    Args:
+        sender: The model class that sends the signal (Event in this case).
+        instance: The Event instance that was deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    record_tombstones("events", instance.id, [instance.organize_by_id])
+
+
+@receiver(post_delete, sender=MessageSetting)
+@receiver(post_delete, sender=RecurringMessage)
+def shared_tombstone(sender, instance, **kwargs):
+    """
+    Signal receiver function triggered after deleting a MessageSetting or a
+    RecurringMessage object.
+
+    These rows are synced by every user, so the deletion is recorded for all
+    of them.
+
+    Args:
+        sender: The model class that sends the signal.
+        instance: The instance that was deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    collection = (
+        "message_settings" if sender is MessageSetting else "recurring_messages"
+    )
+    record_tombstones(collection, instance.id)
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_chunks_cleanup(sender, instance, **kwargs):
+    """
+    Signal receiver function triggered after deleting an Attachment object.
+
+    This function deletes the stored chunks of an upload that was not
+    assembled yet. The content of assembled attachments may be shared, it is
+    deleted by `prune_attachments` once unreferenced.
+
+    Args:
+        sender: The model class that sends the signal (Attachment in this case).
+        instance: The Attachment instance that was deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+
+    """
+    if instance.status != Attachment.READY:
+        delete_chunks(instance)
@@ -0,0 +1,203 @@
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Event, Message, MessageSetting, RecurringMessage, SyncTombstone
+from .sharding import attach_attachments, attach_users, message_shards
+
+SYNC_TOKEN_SALT = "chat.sync"
+SYNC_COLLECTIONS = (
+    "messages",
+    "events",
+    "message_settings",
+    "recurring_messages",
+    "deleted",
+)
+
+sync_key = attrgetter("updated_at", "id")
+
+
+class SyncTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "Sync token expired, start over with a full sync."
+    default_code = "sync_token_expired"
+
+
+def to_timestamp(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def from_timestamp(value):
+    return datetime.fromtimestamp(value / 1_000_000, tz=dt_timezone.utc)
+
+
+def encode_token(user_id, cursors):
+    """
+    Return the opaque token carrying the per-collection cursors of a user
+    """
+    return signing.dumps(
+        {
+            "u": user_id,
+            "c": {
+                name: [to_timestamp(updated_at), last_id]
+                for name, (updated_at, last_id) in cursors.items()
+            },
+        },
+        salt=SYNC_TOKEN_SALT,
+        compress=True,
+    )
+
+
+def decode_token(user_id, token):
+    try:
+        payload = signing.loads(token, salt=SYNC_TOKEN_SALT)
+    except signing.BadSignature:
+        raise ValidationError({"token": "Invalid sync token."})
+    if payload.get("u") != user_id:
+        raise ValidationError({"token": "Invalid sync token."})
+    return {
+        name: (from_timestamp(updated_at), last_id)
+        for name, (updated_at, last_id) in payload["c"].items()
+    }
+
+
+def collection_querysets(user_id):
+    """
+    Return the querysets holding each synced collection of a user.
+
+    Messages are read from every shard, the other collections from the
+    default database.
+    """
+    return {
+        "messages": [
+            Message.objects.using(alias).filter(
+                Q(sender_id=user_id) | Q(receiver_id=user_id)
+            )
+            for alias in message_shards()
+        ],
+        "events": [Event.objects.filter(organize_by_id=user_id)],
+        "message_settings": [
+            MessageSetting.objects.prefetch_related("receptions")
+        ],
+        "recurring_messages": [RecurringMessage.objects.all()],
+        "deleted": [
+            SyncTombstone.objects.filter(Q(user_id=user_id) | Q(user__isnull=True))
+        ],
+    }
+
+
+def changed_rows(queryset, cursor, until, limit):
+    """
+    Return up to `limit` rows changed after `cursor`, by (updated_at, id)
+    """
+    if cursor is not None:
+        updated_at, last_id = cursor
+        queryset = queryset.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=last_id)
+        )
+    return list(
+        queryset.filter(updated_at__lte=until).order_by("updated_at", "id")[:limit]
+    )
+
+
+def sync_changes(user_id, token=None, limit=None):
+    """
+    Return the rows of a user changed since a sync token.
+
+    Every collection is read with a keyset on (updated_at, id) served by the
+    updated_at indexes. A collection that is caught up moves its cursor to
+    settings.SYNC_OVERLAP_SECONDS before the sync started, rows committed by
+    transactions still running at that point are returned by the next sync,
+    at the cost of sending the last few rows twice.
+
+    Args:
+        user_id (int): The syncing user.
+        token (str): Token returned by the previous sync, None for a full sync.
+        limit (int): Maximum number of rows returned per collection.
+
+    Returns:
+        tuple: The changed rows per collection, the next token and whether
+               more changes are waiting.
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    cursors = decode_token(user_id, token) if token else {}
+    now = timezone.now()
+    retention = timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    if "deleted" in cursors and cursors["deleted"][0] < now - retention:
+        raise SyncTokenExpired()
+
+    floor = (now - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS), 0)
+    changes = {}
+    next_cursors = {}
+    has_more = False
+    for name, querysets in collection_querysets(user_id).items():
+        cursor = cursors.get(name)
+        rows = list(
+            islice(
+                heapq.merge(
+                    *(
+                        changed_rows(queryset, cursor, now, limit + 1)
+                        for queryset in querysets
+                    ),
+                    key=sync_key,
+                ),
+                limit + 1,
+            )
+        )
+        if len(rows) > limit:
+            rows = rows[:limit]
+            has_more = True
+            next_cursors[name] = sync_key(rows[-1])
+        else:
+            next_cursors[name] = max(cursor, floor) if cursor else floor
+        changes[name] = rows
+
+    attach_users(changes["messages"])
+    attach_attachments(changes["messages"])
+    return changes, encode_token(user_id, next_cursors), has_more
+
+
+def record_tombstones(collection, object_id, user_ids=(None,)):
+    """
+    Record the deletion of a row for the given users, None for every user
+    """
+    SyncTombstone.objects.bulk_create(
+        [
+            SyncTombstone(user_id=user_id, collection=collection, object_id=object_id)
+            for user_id in set(user_ids)
+        ]
+    )
+
+
+def record_message_tombstones(messages, exclude_user_id=None):
+    """
+    Record the deletion of (id, sender_id, receiver_id) messages for their
+    senders and receivers, except `exclude_user_id`
+    """
+    SyncTombstone.objects.bulk_create(
+        [
+            SyncTombstone(user_id=user_id, collection="messages", object_id=message_id)
+            for message_id, sender_id, receiver_id in messages
+            for user_id in {sender_id, receiver_id} - {exclude_user_id}
+        ]
+    )
+
+
+def prune_tombstones(days=None):
+    """
+    Delete tombstones older than settings.SYNC_TOMBSTONE_RETENTION_DAYS
+    """
+    if days is None:
+        days = settings.SYNC_TOMBSTONE_RETENTION_DAYS
+    deleted, _ = SyncTombstone.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()
+    return deleted
@@ -1,10 +1,65 @@
-from celery import shared_task
+import logging
 
-from chat.models import Event, Message
-from common.helper import manage_receptions_message
+from celery import Task, shared_task
+from django.conf import settings
+from django.db import DatabaseError
 
+from chat import scheduling
+from chat.archive import archive_messages
+from chat.attachments import assemble_attachment as assemble_chunks, prune_attachments
+from chat.sync import prune_tombstones
+from chat.models import Event, Message, RecurringMessage
+from common.helper import get_reception_ids, manage_receptions_message
 
-@shared_task(name="send_event_message")
+logger = logging.getLogger(__name__)
+
+
+def fan_out_message(sender_id, content):
+    """
+    Send a message to the receptions of the active message setting.
+
+    Small fan-outs are sent in-process. Larger ones are split into chunks of
+    settings.FANOUT_CHUNK_SIZE receptions, each sent by a low priority
+    `send_reception_chunk` task on the fanout_chunks queue, so a broadcast
+    never holds a worker for long.
+    """
+    receiver_ids = get_reception_ids()
+    chunk_size = settings.FANOUT_CHUNK_SIZE
+    if len(receiver_ids) <= chunk_size:
+        return manage_receptions_message(sender_id, content, receiver_ids)
+
+    for start in range(0, len(receiver_ids), chunk_size):
+        send_reception_chunk.apply_async(
+            (
+                {
+                    "sender_id": sender_id,
+                    "content": content,
+                    "receiver_ids": receiver_ids[start : start + chunk_size],
+                },
+            ),
+            priority=settings.TASK_PRIORITIES["fanout_chunk"],
+        )
+    return True
+
+
+@shared_task(name="chat.tasks.send_reception_chunk")
+def send_reception_chunk(kwargs):
+    """
+    Celery task for sending a message to a chunk of receptions.
+
+    Args:
+        kwargs (dict): A dictionary containing the keys "sender_id", "content"
+                       and "receiver_ids", the receptions of this chunk.
+
+    Returns:
+        bool: True if the task is successfully executed.
+    """
+    return manage_receptions_message(
+        kwargs["sender_id"], kwargs["content"], kwargs["receiver_ids"]
+    )
+
+
+@shared_task(name="chat.tasks.send_event_message")
 def send_event_message(kwargs):
     """
     Celery task for sending event messages.
@@ -24,15 +79,16 @@ def send_event_message(kwargs):
     event_id = kwargs["event_id"]
     event = Event.objects.filter(id=int(event_id)).first()
 
-    if not event.is_complete:
-        manage_receptions_message(event.organize_by, event.description)
+    # deleted with its organizer before the periodic task fired
+    if event is not None and not event.is_complete:
+        fan_out_message(event.organize_by_id, event.description)
         event.is_complete = True
         event.save()
 
     return True
 
 
-@shared_task(name="create_schedule_message")
+@shared_task(name="chat.tasks.create_schedule_message")
 def create_schedule_message(kwargs):
     """
     Celery task for creating scheduled messages.
@@ -42,9 +98,9 @@ def create_schedule_message(kwargs):
     it manages the reception message. Otherwise, it creates a new Message object.
 
     Args:
-        kwargs (dict): A dictionary containing keyword arguments. It should contain
-                       the key "task_data" which holds message-related data.
-                       The "task_data" dictionary should include:
+        kwargs (dict): The message-related data, as stored by
+                       `manage_periodic_task`, or wrapped in a "task_data"
+                       key as older callers pass it. It includes:
                            - "is_recurring" (bool): Indicates if the message is recurring.
                            - "sender_id" (int): ID of the message sender.
                            - "receiver_id" (int): ID of the message receiver (if applicable).
@@ -53,9 +109,9 @@ def create_schedule_message(kwargs):
     Returns:
         bool: True if the task is successfully executed.
     """
-    message_data = kwargs["task_data"]
+    message_data = kwargs.get("task_data", kwargs)
     if "is_recurring" in message_data and message_data["is_recurring"]:
-        manage_receptions_message(message_data["sender_id"], message_data["content"])
+        fan_out_message(message_data["sender_id"], message_data["content"])
     else:
         Message.objects.create(
             sender_id=message_data["sender_id"],
@@ -63,3 +119,154 @@ def create_schedule_message(kwargs):
             content=message_data["content"],
         )
     return True
+
+
+class SchedulingTask(Task):
+    """
+    Task scheduling an event or a recurring message, whose scheduling_status
+    becomes "failed" when the task gives up, after its last retry or on an
+    error it does not retry.
+
+    Attributes:
+        scheduling_model: Model of the scheduled object, its id is the first
+                          argument of the task.
+    """
+
+    scheduling_model = None
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        try:
+            scheduling.fail_scheduling(self.scheduling_model, args[0])
+        except DatabaseError:
+            logger.exception(
+                "Could not mark %s %s failed", self.scheduling_model.__name__, args[0]
+            )
+
+
+@shared_task(
+    base=SchedulingTask,
+    name="chat.tasks.schedule_event",
+    scheduling_model=Event,
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def schedule_event(event_id):
+    """
+    Celery task for scheduling the message of a new event.
+
+    This task is dispatched by the post_save signal of Event once the
+    transaction creating the event commits, and creates the periodic task
+    sending the event message. The event's scheduling_status becomes
+    "scheduled", or "failed" once the retries are exhausted.
+
+    Args:
+        event_id (int): ID of the new event.
+
+    Returns:
+        bool: True if the periodic task was created.
+    """
+    return scheduling.schedule_event(event_id)
+
+
+@shared_task(
+    base=SchedulingTask,
+    name="chat.tasks.schedule_recurring_message",
+    scheduling_model=RecurringMessage,
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def schedule_recurring_message(recurring_message_id):
+    """
+    Celery task for scheduling the runs of a new recurring message.
+
+    This task is dispatched by the post_save signal of RecurringMessage once
+    the transaction creating it commits, and creates one periodic task per
+    schedule date, which can be hundreds for a long daily recurrence. The
+    recurring message's scheduling_status becomes "scheduled", or "failed"
+    once the retries are exhausted.
+
+    Args:
+        recurring_message_id (int): ID of the new recurring message.
+
+    Returns:
+        bool: True if the periodic tasks were created.
+    """
+    return scheduling.schedule_recurring_message(recurring_message_id)
+
+
+@shared_task(name="chat.tasks.archive_old_messages")
+def archive_old_messages(days=None):
+    """
+    Celery task for archiving old messages.
+
+    This task moves messages older than `days` (settings.MESSAGE_ARCHIVE_AFTER_DAYS
+    by default) from the hot Message collection into compressed per-user,
+    per-month archive segments.
+
+    Args:
+        days (int): Age in days after which messages are archived.
+
+    Returns:
+        int: Number of archived messages.
+    """
+    return archive_messages(days)
+
+
+@shared_task(name="chat.tasks.prune_sync_tombstones")
+def prune_sync_tombstones(days=None):
+    """
+    Celery task for pruning sync tombstones.
+
+    This task deletes the tombstones of rows deleted more than `days`
+    (settings.SYNC_TOMBSTONE_RETENTION_DAYS by default) ago.
+
+    Args:
+        days (int): Age in days after which tombstones are deleted.
+
+    Returns:
+        int: Number of deleted tombstones.
+    """
+    return prune_tombstones(days)
+
+
+@shared_task(
+    name="chat.tasks.assemble_attachment",
+    autoretry_for=(DatabaseError, OSError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def assemble_attachment(attachment_id):
+    """
+    Celery task for assembling an uploaded attachment.
+
+    This task is dispatched when the last chunk of an upload is confirmed. It
+    hashes the chunks and stores their content once per SHA-256, then the
+    attachment's status becomes "ready".
+
+    Args:
+        attachment_id (int): ID of the uploaded attachment.
+
+    Returns:
+        bool: True if the attachment is ready.
+    """
+    return assemble_chunks(attachment_id)
+
+
+@shared_task(name="chat.tasks.prune_attachment_uploads")
+def prune_attachment_uploads(hours=None):
+    """
+    Celery task for pruning abandoned attachment uploads.
+
+    This task deletes the uploads without progress for `hours`
+    (settings.ATTACHMENT_UPLOAD_EXPIRY_HOURS by default) with their chunks,
+    and the stored contents no attachment references any more.
+
+    Args:
+        hours (int): Age in hours after which uploads are deleted.
+
+    Returns:
+        int: Number of deleted uploads and contents.
+    """
+    return prune_attachments(hours)
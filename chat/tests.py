@@ -1,3 +1,352 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from chat import write_behind
+from chat.archive import ARCHIVED_FIELDS, build_segments
+from chat.exports import iter_messages
+from chat.models import ConversationReadState, Message, MessageArchiveSegment
+from chat.write_behind import MessageWriteBuffer, get_write_buffer
+from common import renderers
+from common.helper import increment_unread_counts, mark_conversation_read
+
+
+@override_settings(
+    MESSAGE_ID_ALLOCATION="sequence",
+    MESSAGE_WRITE_BEHIND=True,
+    MESSAGE_WRITE_BEHIND_BATCH_SIZE=100,
+    MESSAGE_WRITE_BEHIND_DELAY_MS=60000,
+    MESSAGE_WRITE_BEHIND_MAX_PENDING=1000,
+    MESSAGE_WRITE_BEHIND_RETRIES=2,
+)
+class MessageWriteBufferTests(TestCase):
+    """
+    Durability and failure semantics of the write-behind buffer, flushed in
+    the test's thread against the local database.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create(
+            email="sender@example.com", phone_number="+19000000001"
+        )
+        cls.receiver = User.objects.create(
+            email="receiver@example.com", phone_number="+19000000002"
+        )
+
+    def setUp(self):
+        # no background thread, every flush happens in the test
+        patcher = mock.patch.object(MessageWriteBuffer, "start")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(MessageWriteBuffer, "retry_backoff", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_buffer(self, **kwargs):
+        options = {
+            "batch_size": 100,
+            "delay_ms": 60000,
+            "max_pending": 1000,
+            "retries": 2,
+        }
+        return MessageWriteBuffer(**{**options, **kwargs})
+
+    def make_message(self, content="hello"):
+        return Message(sender=self.sender, receiver=self.receiver, content=content)
+
+    def stored_ids(self):
+        return sorted(Message.objects.values_list("id", flat=True))
+
+    def test_partial_batch_failure_is_retried_without_duplicates(self):
+        buffer = self.make_buffer()
+        messages = [buffer.add(self.make_message(str(i))) for i in range(4)]
+        bulk_create = Message.objects.bulk_create
+        calls = []
+
+        def fail_after_first(batch, *args, **kwargs):
+            calls.append([message.id for message in batch])
+            if len(calls) == 1:
+                bulk_create(batch[:2])
+                raise DatabaseError("connection lost")
+            return bulk_create(batch, *args, **kwargs)
+
+        with mock.patch.object(Message.objects, "bulk_create", fail_after_first):
+            self.assertEqual(buffer.flush(), 4)
+
+        ids = [message.id for message in messages]
+        self.assertEqual(self.stored_ids(), sorted(ids))
+        # the retry only inserts what the failed attempt did not store
+        self.assertEqual(calls[1], ids[2:])
+        self.assertEqual(buffer.pending_count(), 0)
+
+    def test_persistent_failure_drops_the_batch_after_retries(self):
+        buffer = self.make_buffer(retries=2)
+        message = buffer.add(self.make_message("lost"))
+
+        with mock.patch.object(
+            Message.objects, "bulk_create", side_effect=DatabaseError("down")
+        ) as bulk_create, self.assertLogs(write_behind.logger, "ERROR") as logs:
+            self.assertEqual(buffer.flush(), 0)
+
+        self.assertEqual(bulk_create.call_count, 3)
+        self.assertIn(f"'id': {message.id}", logs.output[0])
+        self.assertIn("down", logs.output[0])
+        # message bodies never reach the logs
+        self.assertNotIn("lost", logs.output[0])
+        self.assertEqual(buffer.pending_count(), 0)
+        self.assertEqual(self.stored_ids(), [])
+
+    def test_max_pending_flushes_in_the_senders_thread(self):
+        buffer = self.make_buffer(max_pending=3)
+        buffer.add(self.make_message("1"))
+        buffer.add(self.make_message("2"))
+        self.assertEqual(self.stored_ids(), [])
+
+        last = buffer.add(self.make_message("3"))
+        self.assertEqual(buffer.pending_count(), 0)
+        self.assertEqual(len(self.stored_ids()), 3)
+        self.assertIn(last.id, self.stored_ids())
+
+    def test_interpreter_exit_flushes_the_buffer(self):
+        with mock.patch.object(write_behind, "_buffer", None), mock.patch.object(
+            write_behind.atexit, "register"
+        ) as register:
+            buffer = get_write_buffer()
+            message = buffer.add(self.make_message("at exit"))
+            register.assert_called_once_with(buffer.flush)
+            self.assertEqual(self.stored_ids(), [])
+
+            exit_handler = register.call_args[0][0]
+            exit_handler()
+
+        self.assertEqual(self.stored_ids(), [message.id])
+
+
+class ReplyMessageViewTests(TestCase):
+    """
+    A reply refers to a message of the requester's own conversations.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create(
+            email="sender@example.com", phone_number="+19000000001"
+        )
+        cls.receiver = User.objects.create(
+            email="receiver@example.com", phone_number="+19000000002"
+        )
+        cls.outsider = User.objects.create(
+            email="outsider@example.com", phone_number="+19000000003"
+        )
+        cls.message = Message.objects.create(
+            sender=cls.sender, receiver=cls.receiver, content="hello"
+        )
+
+    def reply(self, user, **data):
+        client = APIClient()
+        client.force_authenticate(user)
+        payload = {
+            "sender": user.id,
+            "receiver": self.sender.id,
+            "receiver_id": self.sender.id,
+            **data,
+        }
+        return client.post(reverse("chat:reply-message"), payload, format="json")
+
+    def test_reply_copies_the_message_of_a_participant(self):
+        response = self.reply(self.receiver, message_id=self.message.id)
+
+        self.assertEqual(response.status_code, 201)
+        reply = Message.objects.get(pk=response.data["id"])
+        self.assertEqual((reply.parent_id, reply.content), (self.message.id, "hello"))
+
+    def test_missing_message_id_is_rejected(self):
+        response = self.reply(self.receiver)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("message_id", response.data)
+
+    def test_unknown_message_is_not_found(self):
+        response = self.reply(self.receiver, message_id=self.message.id + 1000)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_message_of_another_conversation_is_not_found(self):
+        response = self.reply(self.outsider, message_id=self.message.id)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Message.objects.count(), 1)
+
+
+class UnreadCountTests(TestCase):
+    """
+    Unread counters stay exact when messages and reads interleave.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create(
+            email="sender@example.com", phone_number="+19000000001"
+        )
+        cls.readers = [
+            User.objects.create(
+                email=f"reader{i}@example.com", phone_number=f"+1900000001{i}"
+            )
+            for i in range(2)
+        ]
+
+    def unread_counts(self):
+        return dict(
+            ConversationReadState.objects.filter(peer=self.sender).values_list(
+                "user_id", "unread_count"
+            )
+        )
+
+    def test_read_state_created_concurrently_is_incremented_once(self):
+        first, second = self.readers
+        ConversationReadState.objects.create(user=first, peer=self.sender)
+        update = QuerySet.update
+        created = []
+
+        def create_concurrently(queryset, **kwargs):
+            # another message created the second reader's state after the lookup
+            if not created:
+                created.append(
+                    ConversationReadState.objects.create(
+                        user=second, peer=self.sender, unread_count=1
+                    )
+                )
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", create_concurrently):
+            increment_unread_counts(self.sender.id, [first.id, second.id], 2)
+
+        self.assertEqual(self.unread_counts(), {first.id: 2, second.id: 3})
+
+    def test_stale_mark_does_not_move_the_read_state_back(self):
+        reader = self.readers[0]
+        messages = [
+            Message.objects.create(sender=self.sender, receiver=reader, content=str(i))
+            for i in range(3)
+        ]
+
+        mark_conversation_read(reader.id, self.sender.id, messages[1].id)
+        read_state = mark_conversation_read(reader.id, self.sender.id, messages[0].id)
+
+        self.assertEqual(read_state.last_read_message_id, messages[1].id)
+        self.assertEqual(read_state.unread_count, 1)
+
+
+class MessageExportTests(TestCase):
+    """
+    The export merges archive segments and hot messages into one history.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create(
+            email="sender@example.com", phone_number="+19000000001"
+        )
+        cls.receiver = User.objects.create(
+            email="receiver@example.com", phone_number="+19000000002"
+        )
+        cls.messages = [
+            Message.objects.create(
+                sender=cls.sender, receiver=cls.receiver, content=str(i)
+            )
+            for i in range(6)
+        ]
+
+    def archive(self, *messages):
+        rows = Message.objects.filter(
+            id__in=[message.id for message in messages]
+        ).values(*ARCHIVED_FIELDS)
+        MessageArchiveSegment.objects.bulk_create(build_segments(rows))
+
+    def test_each_message_is_exported_once_in_id_order(self):
+        first, second, third, fourth, fifth, _ = self.messages
+        # segments of two shards with overlapping id ranges
+        self.archive(first, third)
+        self.archive(second, fourth)
+        # an interrupted archival left the fifth message in a segment, twice
+        # over, and on its shard
+        self.archive(fifth)
+        self.archive(fifth)
+        archived_ids = [first.id, second.id, third.id, fourth.id]
+        Message.objects.filter(id__in=archived_ids).delete()
+
+        ids = [row["id"] for row in iter_messages(self.sender.id)]
+
+        self.assertEqual(ids, [message.id for message in self.messages])
+
+
+class RendererTests(TestCase):
+    """
+    Every renderer returns the same sparse fieldset of the message list.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create(
+            email="sender@example.com", phone_number="+19000000001"
+        )
+        cls.receiver = User.objects.create(
+            email="receiver@example.com", phone_number="+19000000002"
+        )
+        cls.message = Message.objects.create(
+            sender=cls.sender, receiver=cls.receiver, content="caf\u00e9 \u2028"
+        )
+
+    def setUp(self):
+        # pages cached by an earlier test may belong to the same user id
+        cache.clear()
+
+    def get_messages(self, accept):
+        client = APIClient()
+        client.force_authenticate(self.sender)
+        return client.get(
+            reverse("chat:message-list-create"),
+            {"fields": "id,content"},
+            HTTP_ACCEPT=accept,
+        )
+
+    def assertSparseMessages(self, results):
+        self.assertEqual(
+            results, [{"id": self.message.id, "content": self.message.content}]
+        )
+
+    def test_json(self):
+        response = self.get_messages("application/json")
+
+        self.assertEqual(response["Content-Type"], "application/json")
+        # a strict javascript subset, like DRF's JSONRenderer
+        self.assertIn(b"\\u2028", response.content)
+        self.assertSparseMessages(json.loads(response.content))
+
+    def test_indented_json(self):
+        response = self.get_messages("application/json; indent=4")
+
+        self.assertIn(b'\n    {\n        "id"', response.content)
+        self.assertSparseMessages(json.loads(response.content))
+
+    def test_json_without_orjson(self):
+        with mock.patch.object(renderers, "orjson", None):
+            response = self.get_messages("application/json")
+
+        self.assertSparseMessages(json.loads(response.content))
+
+    def test_msgpack(self):
+        response = self.get_messages("application/msgpack")
+
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertSparseMessages(msgpack.unpackb(response.content))
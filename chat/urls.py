@@ -1,12 +1,21 @@
 from django.urls import path
 
 from chat.views import (
+    AttachmentChunkView,
+    AttachmentCompleteView,
+    AttachmentContentView,
+    AttachmentCreateView,
+    AttachmentDetailView,
     MessageListCreateView,
     EventListCreateView,
     MessageSettingListCreateView,
     RecurringMessageListCreateView,
     ReplyMessageView,
     ForwardMessageView,
+    MarkReadView,
+    MessageExportView,
+    UnreadCountListView,
+    SyncView,
 )
 
 app_name = "chat"
@@ -15,6 +24,31 @@ urlpatterns = [
     path("messages/", MessageListCreateView.as_view(), name="message-list-create"),
     path("forward_message/", ForwardMessageView.as_view(), name="forward-message"),
     path("reply_message/", ReplyMessageView.as_view(), name="reply-message"),
+    path("mark_read/", MarkReadView.as_view(), name="mark-read"),
+    path("export/", MessageExportView.as_view(), name="message-export"),
+    path("unread_counts/", UnreadCountListView.as_view(), name="unread-counts"),
+    path("sync/", SyncView.as_view(), name="sync"),
+    path("attachments/", AttachmentCreateView.as_view(), name="attachment-create"),
+    path(
+        "attachments/<int:pk>/",
+        AttachmentDetailView.as_view(),
+        name="attachment-detail",
+    ),
+    path(
+        "attachments/<int:pk>/chunks/<int:index>/",
+        AttachmentChunkView.as_view(),
+        name="attachment-chunk",
+    ),
+    path(
+        "attachments/<int:pk>/complete/",
+        AttachmentCompleteView.as_view(),
+        name="attachment-complete",
+    ),
+    path(
+        "attachments/<int:pk>/content/",
+        AttachmentContentView.as_view(),
+        name="attachment-content",
+    ),
     path("events/", EventListCreateView.as_view(), name="event-list-create"),
     path(
         "message_setting/",
@@ -1,26 +1,101 @@
-from django.db.models import Q
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from rest_framework import generics
+from django.utils.cache import patch_vary_headers
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from common.helper import create_cronjob, manage_periodic_task
-from .models import Message, Event, MessageSetting,RecurringMessage
+from common.cache import MAILBOX_VERSION
+from common.helper import (
+    create_cronjob,
+    manage_periodic_task,
+    mark_conversation_read,
+)
+from common.serializers import requested_fields
+from common.throttling import (
+    GlobalTokenBucketThrottle,
+    ThrottleFirstMixin,
+    UserTokenBucketThrottle,
+)
+from common.views import VersionedCacheMixin
+from .attachments import (
+    RangeNotSatisfiable,
+    can_read_attachment,
+    complete_upload,
+    iter_range,
+    parse_range,
+    save_chunk,
+)
+from .exports import EXPORT_FORMATS, export_user_history
+from .pagination import MessageKeysetPagination
+from .sharding import InboxMessages, find_message
+from .models import (
+    Attachment,
+    ConversationReadState,
+    Message,
+    Event,
+    MessageSetting,
+    RecurringMessage,
+)
 from .serializers import (
+    AttachmentSerializer,
+    ConversationReadStateSerializer,
+    MarkReadSerializer,
     MessageSerializer,
     EventSerializer,
     MessageSettingSerializer,
     RecurringMessageSerializer,
+    RelatedMessageSerializer,
+    SyncEventSerializer,
+    SyncMessageSerializer,
+    SyncMessageSettingSerializer,
+    SyncRecurringMessageSerializer,
+    SyncTombstoneSerializer,
 )
+from .sync import sync_changes
+from .tasks import assemble_attachment
+from .write_behind import save_message
+
 
+class MessageSendThrottleMixin(ThrottleFirstMixin):
+    """
+    Admission control of the message-send endpoints.
 
-class MessageListCreateView(generics.ListCreateAPIView):
+    POST requests take a token from the sender's bucket and from the global
+    bucket before authentication, a burst is rejected with 429 and Retry-After.
+    """
+
+    throttle_classes = [UserTokenBucketThrottle, GlobalTokenBucketThrottle]
+    token_bucket_scopes = {
+        "user": "message_send_user",
+        "global": "message_send_global",
+    }
+    token_bucket_methods = ("POST",)
+
+
+class MessageListCreateView(
+    MessageSendThrottleMixin, VersionedCacheMixin, generics.ListCreateAPIView
+):
     """
     API view for listing and create message.
+
+    Lists are answered from the user's mailbox version, see VersionedCacheMixin,
+    and continue into the archive once the cursor leaves the hot collection,
+    see MessageKeysetPagination.
     """
 
+    version_scope = MAILBOX_VERSION
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MessageKeysetPagination
 
     def perform_create(self, serializer):
         scheduled_time = self.request.data.get("scheduled_time", None)
@@ -37,58 +112,85 @@ class MessageListCreateView(generics.ListCreateAPIView):
                     "receiver_id": self.request.data.get("receiver", None),
                     "content": self.request.data.get("content", None),
                 },
+                "queue": "messages",
+                "priority": settings.TASK_PRIORITIES["single_send"],
             }
             manage_periodic_task(data, crontab_obj)
         else:
-            serializer.save()
+            save_message(serializer)
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        queryset = Message.objects.filter(
-            (Q(sender_id=user_id) | Q(receiver_id=user_id))
-            & (Q(sender_id=user_id) | Q(receiver_id=user_id))
-        ).select_related("sender", "receiver")
-        return queryset
+        fields = requested_fields(self.request)
+        return InboxMessages(
+            self.request.user.id,
+            with_users=fields is None
+            or bool(fields & {"sender_name", "receiver_name", "attachment"}),
+        )
+
+
+def get_related_message(serializer, user_id):
+    """
+    Return the message a reply or a forward refers to, from the validated
+    `message_id` of a RelatedMessageSerializer.
+
+    Raises:
+        NotFound: The message does not exist or is not in a conversation of
+                  the requester.
+    """
+    message = find_message(serializer.validated_data.pop("message_id"))
+    if message is None or user_id not in (message.sender_id, message.receiver_id):
+        raise NotFound()
+    return message
 
 
-class ForwardMessageView(generics.CreateAPIView):
+class ForwardMessageView(MessageSendThrottleMixin, generics.CreateAPIView):
     """
     API view for forward to a message.
     """
 
-    serializer_class = MessageSerializer
+    serializer_class = RelatedMessageSerializer
     permission_classes = [IsAuthenticated]
     queryset = Message.objects.all()
 
     def perform_create(self, serializer):
-        message_data = Message.objects.filter(
-            id=self.request.data["message_id"]
-        ).first()
-        serializer.save(
+        user_id = self.request.user.id
+        # only a message of the requester's own conversations is forwarded
+        message_data = get_related_message(serializer, user_id)
+
+        attachment_id = None
+        if message_data.attachment_id:
+            attachment = Attachment.objects.filter(
+                pk=message_data.attachment_id, status=Attachment.READY
+            ).first()
+            if attachment is not None and can_read_attachment(attachment, user_id):
+                attachment_id = attachment.id
+        save_message(
+            serializer,
             sender=self.request.user,
             receiver_id=self.request.data.get("receiver"),
             content=message_data.content,
+            attachment_id=attachment_id,
         )
 
 
-class ReplyMessageView(generics.CreateAPIView):
+class ReplyMessageView(MessageSendThrottleMixin, generics.CreateAPIView):
     """
     API view for replying to a message.
     """
 
-    serializer_class = MessageSerializer
+    serializer_class = RelatedMessageSerializer
     permission_classes = [IsAuthenticated]
     queryset = Message.objects.all()
 
     def perform_create(self, serializer):
-        message_data = Message.objects.filter(
-            id=self.request.data["message_id"]
-        ).first()
-        serializer.save(
+        # only a message of the requester's own conversations is replied to
+        message_data = get_related_message(serializer, self.request.user.id)
+        save_message(
+            serializer,
             sender=self.request.user,
             receiver_id=self.request.data.get("receiver_id"),
             content=message_data.content,
-            parent_id=self.request.data["message_id"],
+            parent_id=message_data.id,
         )
 
 
@@ -102,7 +204,7 @@ class MessageSettingListCreateView(generics.ListCreateAPIView):
     queryset = MessageSetting.objects.all()
 
     def perform_create(self, serializer):
-        serializer.save(is_acitve=True)
+        serializer.save(is_active=True)
 
 
 class EventListCreateView(generics.ListCreateAPIView):
@@ -123,3 +225,265 @@ class RecurringMessageListCreateView(generics.ListCreateAPIView):
     queryset = RecurringMessage.objects.all()
     serializer_class = RecurringMessageSerializer
     permission_classes = [IsAuthenticated]
+
+
+class MarkReadView(generics.GenericAPIView):
+    """
+    API view for marking conversations read up to a message.
+
+    Accepts a single {"peer", "up_to"} object or a list of them, so a client
+    can acknowledge all of its open conversations in one request.
+    """
+
+    serializer_class = MarkReadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        many = isinstance(request.data, list)
+        serializer = self.get_serializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+
+        items = serializer.validated_data if many else [serializer.validated_data]
+        read_states = [
+            mark_conversation_read(request.user.id, item["peer"], item["up_to"])
+            for item in items
+        ]
+        return Response(
+            ConversationReadStateSerializer(read_states, many=True).data,
+            status=status.HTTP_200_OK,
+        )
+
+
+class SyncView(APIView):
+    """
+    API view returning the changes since a client's last sync.
+
+    `?token=` is the token returned by the previous sync; without it every
+    row is returned. Each collection holds at most `?limit=` rows. When
+    `has_more` is true the client syncs again right away with the new token.
+    Deleted rows are listed in `deleted`. A token older than the tombstone
+    retention is answered with `410`, and the client then starts over with a
+    full sync.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_classes = {
+        "messages": SyncMessageSerializer,
+        "events": SyncEventSerializer,
+        "message_settings": SyncMessageSettingSerializer,
+        "recurring_messages": SyncRecurringMessageSerializer,
+        "deleted": SyncTombstoneSerializer,
+    }
+
+    def get(self, request):
+        limit = request.query_params.get("limit")
+        try:
+            limit = min(int(limit), settings.SYNC_PAGE_SIZE) if limit else None
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required."})
+        if limit is not None and limit < 1:
+            raise ValidationError({"limit": "Ensure this value is at least 1."})
+
+        changes, token, has_more = sync_changes(
+            request.user.id, request.query_params.get("token"), limit
+        )
+        context = {"request": request}
+        data = {"token": token, "has_more": has_more}
+        for name, serializer_class in self.serializer_classes.items():
+            data[name] = serializer_class(
+                changes[name], many=True, context=context
+            ).data
+        return Response(data)
+
+
+class UnreadCountListView(generics.ListAPIView):
+    """
+    API view for listing the unread counts of the user's conversations.
+    """
+
+    serializer_class = ConversationReadStateSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ConversationReadState.objects.filter(
+            user_id=self.request.user.id, unread_count__gt=0
+        )
+
+
+class MessageExportView(APIView):
+    """
+    API view streaming a user's full message history.
+
+    Query parameters:
+        output: "ndjson" (default) or "csv".
+        events: "1" to also export the events organised by the user.
+        user: id of the exported user, staff only (defaults to the requester).
+
+    The export is streamed from a server-side iterator and gzip-compressed when
+    the client accepts it, so memory use stays constant for any history size.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        export_format = request.query_params.get("output", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"output": f"Choose one of {', '.join(EXPORT_FORMATS)}."}
+            )
+
+        user_id = request.user.id
+        if "user" in request.query_params:
+            if not request.user.is_staff:
+                raise PermissionDenied("Only staff can export other users.")
+            try:
+                user_id = int(request.query_params["user"])
+            except ValueError:
+                raise ValidationError({"user": "A valid integer is required."})
+
+        compress = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+        content_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(
+            export_user_history(
+                user_id,
+                export_format,
+                include_events=request.query_params.get("events") == "1",
+                compress=compress,
+            ),
+            content_type=content_type,
+        )
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ["Accept-Encoding"])
+        response["Content-Disposition"] = (
+            f'attachment; filename="messages-{user_id}.{export_format}"'
+        )
+        return response
+
+
+class AttachmentCreateView(generics.CreateAPIView):
+    """
+    API view for starting a chunked attachment upload.
+
+    The response tells the chunk size and count, the chunks are then sent
+    with AttachmentChunkView and confirmed with AttachmentCompleteView.
+    """
+
+    serializer_class = AttachmentSerializer
+    permission_classes = [IsAuthenticated]
+
+    def perform_create(self, serializer):
+        serializer.save(
+            user=self.request.user, chunk_size=settings.ATTACHMENT_CHUNK_SIZE
+        )
+
+
+class AttachmentDetailView(generics.RetrieveAPIView):
+    """
+    API view for the progress of an attachment upload, to resume it from
+    `received_chunks`.
+    """
+
+    serializer_class = AttachmentSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            # the schema generator inspects the view without a request
+            return Attachment.objects.none()
+        return Attachment.objects.filter(user_id=self.request.user.id)
+
+
+class AttachmentChunkView(APIView):
+    """
+    API view receiving one chunk of an attachment upload.
+
+    The raw request body is the chunk, it is streamed to the storage and never
+    parsed or buffered whole.
+    """
+
+    permission_classes = [IsAuthenticated]
+    parser_classes = []
+
+    def put(self, request, pk, index):
+        attachment = get_object_or_404(Attachment, pk=pk, user_id=request.user.id)
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = -1
+        attachment = save_chunk(attachment, index, request.stream, length)
+        return Response(AttachmentSerializer(attachment).data)
+
+
+class AttachmentCompleteView(APIView):
+    """
+    API view confirming the last chunk of an upload.
+
+    The chunks are assembled by the `assemble_attachment` task, the
+    attachment can be sent with a message once its status is "ready".
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        attachment = get_object_or_404(Attachment, pk=pk, user_id=request.user.id)
+        if complete_upload(attachment):
+            transaction.on_commit(lambda: assemble_attachment.delay(attachment.id))
+        attachment.refresh_from_db()
+        return Response(
+            AttachmentSerializer(attachment).data, status=status.HTTP_202_ACCEPTED
+        )
+
+
+class AttachmentContentView(APIView):
+    """
+    API view streaming the content of an attachment.
+
+    Single `Range` requests are answered with 206 and the requested bytes,
+    `If-Range` is matched against the ETag, the SHA-256 of the content. Only
+    the uploader and the users the attachment was exchanged with can read it.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # the content is not rendered, any Accept header is served
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, pk):
+        attachment = get_object_or_404(
+            Attachment.objects.select_related("blob"), pk=pk, status=Attachment.READY
+        )
+        if not can_read_attachment(attachment, request.user.id):
+            raise NotFound()
+
+        blob = attachment.blob
+        etag = f'"{blob.sha256}"'
+        byte_range = None
+        if request.META.get("HTTP_IF_RANGE", etag) == etag:
+            try:
+                byte_range = parse_range(request.META.get("HTTP_RANGE"), blob.size)
+            except RangeNotSatisfiable:
+                return Response(
+                    status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    headers={"Content-Range": f"bytes */{blob.size}"},
+                )
+        first, last = byte_range or (0, blob.size - 1)
+
+        response = StreamingHttpResponse(
+            iter_range(blob.file.open("rb"), first, last),
+            status=(
+                status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+            ),
+            content_type=attachment.content_type,
+        )
+        response["Content-Length"] = last - first + 1
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = etag
+        if byte_range:
+            response["Content-Range"] = f"bytes {first}-{last}/{blob.size}"
+        response["Content-Disposition"] = (
+            f"attachment; filename*=UTF-8''{quote(attachment.name)}"
+        )
+        return response
+
@@ -0,0 +1,262 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from common.cache import MAILBOX_VERSION, bump_version
+from common.helper import increment_unread_counts
+from .ids import assign_message_ids
+from .models import Message
+from chat_system.db_routers import shard_for_message
+from .sharding import message_shards
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+class MessageWriteBuffer:
+    """
+    Process-local write-behind buffer of new messages.
+
+    Messages get their id from the shared sequence when they are added and are
+    inserted with one `bulk_create` per shard by a background thread, once
+    `batch_size` messages are waiting or `delay_ms` after the previous flush.
+
+    Guarantees and failure semantics:
+
+    * A message is acknowledged, with its final id, before it is durable. A
+      process killed before the flush loses up to `max_pending` acknowledged
+      messages. A normal interpreter exit flushes the buffer.
+    * Until the flush a message is invisible to reads, including the
+      sender's own inbox, for at most `delay_ms` plus the flush time.
+    * Ids are reserved on acknowledgement, so the inbox order is the
+      acknowledgement order even when batches are inserted late. They stay
+      reserved if the sequence is evicted, see chat.ids.allocate_message_ids.
+    * A failed insert is retried `retries` times with exponential backoff.
+      Retries skip messages already stored, a retry never duplicates a
+      message. After the last retry the batch is logged at ERROR level with
+      the id, sender and receiver of every message, never its content, and
+      then dropped.
+    * When the database is slower than the send rate and `max_pending`
+      messages are waiting, `add()` flushes in the caller's thread, which
+      slows the senders down instead of growing the buffer.
+    * `created_at` is stored as the insert time, the acknowledgement shows
+      the time the message was accepted.
+    * Mailbox versions and unread counts are updated after the insert, the
+      post_save receivers of Message do not run for buffered messages.
+    * A message added again with the id of a waiting message, i.e. a client
+      retry, is not buffered twice, the waiting message is returned.
+
+    Attributes:
+        batch_size: Number of waiting messages triggering a flush.
+        delay_ms: Maximum time between two flushes, in milliseconds.
+        max_pending: Number of waiting messages making `add()` flush inline.
+        retries: Number of retries of a failed insert.
+    """
+
+    retry_backoff = 0.05
+
+    def __init__(self, batch_size, delay_ms, max_pending, retries):
+        self.batch_size = batch_size
+        self.delay_ms = delay_ms
+        self.max_pending = max_pending
+        self.retries = retries
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, message):
+        """
+        Buffer a new message and return it with its id assigned
+        """
+        retried = message.id is not None
+        assign_message_ids([message])
+        with self._lock:
+            if retried:
+                for pending in self._pending:
+                    if pending.id == message.id:
+                        return pending
+            self._pending.append(message)
+            pending = len(self._pending)
+            self.start()
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+        return message
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self.run, name="message-write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def run(self):
+        while True:
+            self._wakeup.wait(self.delay_ms / 1000)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing the message write-behind buffer failed")
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Insert every buffered message, return the number of inserted messages
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            return self.write(batch)
+
+    def write(self, messages):
+        batch = messages
+        for attempt in range(self.retries + 1):
+            try:
+                if attempt:
+                    batch = self.unsaved(messages)
+                Message.objects.bulk_create(batch)
+                break
+            except DatabaseError:
+                close_old_connections()
+                if attempt == self.retries:
+                    logger.exception(
+                        "Dropped %d buffered messages after %d retries: %r",
+                        len(batch),
+                        self.retries,
+                        [
+                            {
+                                "id": message.id,
+                                "sender_id": message.sender_id,
+                                "receiver_id": message.receiver_id,
+                            }
+                            for message in batch
+                        ],
+                    )
+                    return 0
+                time.sleep(self.retry_backoff * 2**attempt)
+
+        self.update_mailboxes(messages)
+        return len(messages)
+
+    def unsaved(self, batch):
+        """
+        Return the messages of a batch not stored by an earlier attempt
+        """
+        stored = set()
+        ids = [message.id for message in batch]
+        for alias in message_shards():
+            stored.update(
+                Message.objects.using(alias)
+                .filter(id__in=ids)
+                .values_list("id", flat=True)
+            )
+        return [message for message in batch if message.id not in stored]
+
+    def update_mailboxes(self, batch):
+        user_ids = {message.sender_id for message in batch}
+        user_ids.update(message.receiver_id for message in batch)
+        bump_version(MAILBOX_VERSION, user_ids)
+
+        receivers = defaultdict(list)
+        counts = Counter((message.sender_id, message.receiver_id) for message in batch)
+        for (sender_id, receiver_id), count in counts.items():
+            receivers[(sender_id, count)].append(receiver_id)
+        for (sender_id, count), receiver_ids in receivers.items():
+            increment_unread_counts(sender_id, receiver_ids, count)
+
+
+def get_write_buffer():
+    """
+    Return the write-behind buffer of this process, configured from settings
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = MessageWriteBuffer(
+                batch_size=settings.MESSAGE_WRITE_BEHIND_BATCH_SIZE,
+                delay_ms=settings.MESSAGE_WRITE_BEHIND_DELAY_MS,
+                max_pending=settings.MESSAGE_WRITE_BEHIND_MAX_PENDING,
+                retries=settings.MESSAGE_WRITE_BEHIND_RETRIES,
+            )
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def find_retried_message(message):
+    """
+    Return the stored message having the id of a message sent again.
+
+    Raises:
+        ValidationError: The id belongs to a message of another conversation.
+    """
+    stored = (
+        Message.objects.using(shard_for_message(message)).filter(id=message.id).first()
+    )
+    if stored is not None and (stored.sender_id, stored.receiver_id) != (
+        message.sender_id,
+        message.receiver_id,
+    ):
+        raise ValidationError({"id": "This id is used by another message."})
+    return stored
+
+
+def save_message(serializer, **kwargs):
+    """
+    Save a validated MessageSerializer, through the write-behind buffer when
+    settings.MESSAGE_WRITE_BEHIND is on.
+
+    A message sent with the id of a stored message, i.e. a client retry, is
+    not saved again, the stored message is returned. That includes a retry
+    racing its first attempt, whose insert hits the unique id.
+
+    Args:
+        serializer (MessageSerializer): The validated serializer.
+        **kwargs: Extra attributes of the message, like `serializer.save()`.
+
+    Returns:
+        Message: The saved or buffered message.
+    """
+    # shown in the response, the insert stores its own time
+    now = timezone.now()
+    message = Message(
+        **{**serializer.validated_data, **kwargs}, created_at=now, updated_at=now
+    )
+    if message.id is not None:
+        stored = find_retried_message(message)
+        if stored is not None:
+            serializer.instance = stored
+            return stored
+
+    if not settings.MESSAGE_WRITE_BEHIND:
+        if message.id is None:
+            return serializer.save(**kwargs)
+        try:
+            with transaction.atomic(using=shard_for_message(message)):
+                return serializer.save(**kwargs)
+        except IntegrityError:
+            # the first attempt of the retry was stored meanwhile
+            stored = find_retried_message(message)
+            if stored is None:
+                raise
+            serializer.instance = stored
+            return stored
+    serializer.instance = get_write_buffer().add(message)
+    return serializer.instance
@@ -0,0 +1,61 @@
+"""
+Benchmark settings for chat_system project.
+
+Runs the project against a local SQLite stand-in instead of the MongoDB
+deployment so the benchmark suite can be executed on any machine:
+
+    python manage.py run_benchmark --settings=chat_system.bench_settings
+"""
+from .settings import *  # noqa: F401,F403
+
+SECRET_KEY = os.getenv('SECRET_KEY') or 'benchmark-secret-key-not-for-production-use'
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'bench.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'bench.sqlite3',
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+DATABASE_REPLICAS = ['replica']
+
+# BENCH_MESSAGE_SHARDS=N partitions messages across N local databases
+MESSAGE_SHARDS = ['default']
+if int(os.getenv('BENCH_MESSAGE_SHARDS', '1')) > 1:
+    MESSAGE_SHARDS = []
+    for index in range(int(os.getenv('BENCH_MESSAGE_SHARDS'))):
+        DATABASES[f'messages_{index}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'bench_messages_{index}.sqlite3',
+        }
+        MESSAGE_SHARDS.append(f'messages_{index}')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# The scenarios replay bursts on purpose, keep admission control out of the way
+TOKEN_BUCKETS = {
+    scope: {'rate': '1000000/s', 'burst': 1000000} for scope in TOKEN_BUCKETS
+}
+
+# Celery tasks are executed in-process by the benchmark scenarios.
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+
+# OTPs are kept in accounts.sms.outbox, where the scenarios read them
+OTP_SMS_GATEWAY = 'accounts.sms.LocMemSMSGateway'
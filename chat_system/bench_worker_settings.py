@@ -0,0 +1,9 @@
+"""
+Celery worker variant of the benchmark settings, used to measure the worker
+startup against the local SQLite stand-in:
+
+    python manage.py run_benchmark --settings=chat_system.bench_settings \
+        --startup-runs 5 --worker-settings=chat_system.bench_worker_settings
+"""
+from .bench_settings import *  # noqa: F401,F403
+from .worker_settings import INSTALLED_APPS, MIDDLEWARE, ROOT_URLCONF, TEMPLATES  # noqa: F401
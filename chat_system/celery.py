@@ -12,5 +12,8 @@ app = Celery('celery_app',
              backend='redis://localhost:6379/0'
              )
 
+# Read the CELERY_* settings (queues, routes, priorities) from Django settings.
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
\ No newline at end of file
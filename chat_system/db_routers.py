@@ -0,0 +1,118 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from zlib import crc32
+
+from django.conf import settings
+
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Allow (or forbid) reads from the replicas within the block
+    """
+    token = _read_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def conversation_key(user_id, peer_id):
+    """
+    Return the key of the conversation between two users, in either direction
+    """
+    low, high = sorted((int(user_id), int(peer_id)))
+    return f"{low}:{high}"
+
+
+def shard_for_conversation(user_id, peer_id, shards=None):
+    """
+    Return the database alias storing the messages between two users.
+
+    The shard is a stable hash of the conversation key, so both directions of
+    a conversation always live on the same shard.
+    """
+    shards = shards or settings.MESSAGE_SHARDS
+    if len(shards) == 1:
+        return shards[0]
+    return shards[crc32(conversation_key(user_id, peer_id).encode()) % len(shards)]
+
+
+def shard_for_message(message, shards=None):
+    return shard_for_conversation(message.sender_id, message.receiver_id, shards)
+
+
+def is_message_model(model):
+    return model._meta.label == "chat.Message"
+
+
+class MessageShardRouter:
+    """
+    Database router partitioning messages across settings.MESSAGE_SHARDS.
+
+    Saving a message writes it to the shard of its conversation. Queries
+    without an instance cannot be routed by the conversation and must pick
+    their shard with `.using()`, see chat.sharding. Other models, and messages
+    kept in the default database, fall through to the next router.
+    """
+
+    def db_for_read(self, model, **hints):
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if (
+            settings.MESSAGE_SHARDS == ["default"]
+            or not is_message_model(model)
+            or not isinstance(instance, model)
+        ):
+            return None
+        if not instance._state.adding and instance._state.db:
+            # updates and deletes stay where the row was loaded from
+            return instance._state.db
+        if instance.sender_id is not None and instance.receiver_id is not None:
+            return shard_for_message(instance)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # messages reference users and each other across shards
+        if is_message_model(type(obj1)) or is_message_model(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db != "default" and db in settings.MESSAGE_SHARDS:
+            return app_label == "chat" and model_name == "message"
+        return None
+
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending read-only querysets to the replicas.
+
+    Reads only go to a replica inside `replica_reads()`, which the
+    ReplicaReadMiddleware enables for safe requests of clients that did not
+    write recently. Everything else, including writes, the reads of write
+    requests and celery tasks, uses the primary so it never sees stale rows.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and _read_from_replica.get():
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
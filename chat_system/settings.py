@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 from dotenv import load_dotenv
+from kombu import Queue
 import os
 
 load_dotenv()
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'common.middleware.ReplicaReadMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -76,6 +78,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'chat_system.wsgi.application'
+ASGI_APPLICATION = 'chat_system.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -90,6 +93,64 @@ DATABASES = {
     }
 }
 
+# Read replicas, a comma separated list of hosts in DB_REPLICA_HOSTS
+DB_REPLICA_HOSTS = [host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host]
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(DB_REPLICA_HOSTS):
+    DATABASES[f'replica_{index}'] = {
+        'ENGINE': 'djongo',
+        'NAME': os.getenv('DB_NAME'),
+        'CLIENT': {
+            'host': replica_host,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+# Message shards, a comma separated list of hosts in DB_MESSAGE_SHARD_HOSTS.
+# Messages are partitioned by conversation, without shards they live in the
+# default database. Run `manage.py reshard_messages` after changing the list.
+DB_MESSAGE_SHARD_HOSTS = [host for host in os.getenv('DB_MESSAGE_SHARD_HOSTS', '').split(',') if host]
+MESSAGE_SHARDS = ['default']
+if DB_MESSAGE_SHARD_HOSTS:
+    MESSAGE_SHARDS = []
+for index, shard_host in enumerate(DB_MESSAGE_SHARD_HOSTS):
+    DATABASES[f'messages_{index}'] = {
+        'ENGINE': 'djongo',
+        'NAME': os.getenv('DB_NAME'),
+        'CLIENT': {
+            'host': shard_host,
+        },
+    }
+    MESSAGE_SHARDS.append(f'messages_{index}')
+
+# Parsed SQL statements kept per process by the djongo query translation
+# cache, see common.query_cache. 0 disables the cache.
+DJONGO_QUERY_CACHE_SIZE = int(os.getenv('DJONGO_QUERY_CACHE_SIZE', 2048))
+
+DATABASE_ROUTERS = [
+    'chat_system.db_routers.MessageShardRouter',
+    'chat_system.db_routers.PrimaryReplicaRouter',
+]
+
+# Clients keep reading from the primary for this long after a write
+REPLICA_STICKINESS_SECONDS = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://localhost:6379/1'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    }
+}
+
+# Lifetime of the serialized pages cached by the mailbox and profile versions
+VERSIONED_PAGE_CACHE_TIMEOUT = 300
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -97,6 +158,20 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'common.renderers.ORJSONRenderer',
+        'common.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Token buckets used by the admission control throttles of common.throttling,
+# `rate` is the refill rate and `burst` the bucket capacity
+TOKEN_BUCKETS = {
+    'otp_phone': {'rate': '5/m', 'burst': 3},
+    'otp_global': {'rate': '200/s', 'burst': 400},
+    'message_send_user': {'rate': '10/s', 'burst': 20},
+    'message_send_global': {'rate': '2000/s', 'burst': 4000},
 }
 
 SIMPLE_JWT = {
@@ -125,16 +200,139 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-# save Celery task results in Django's database
-CELERY_RESULT_BACKEND = "django-db"
+# save Celery task results in Redis, as configured in chat_system/celery.py
+CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 
 # This configures Redis as the datastore between Django + Celery
-CELERY_BROKER_URL = 'redis://localhost:6379'
+CELERY_BROKER_URL = 'redis://localhost:6379/0'
 
 # this allows you to schedule items in the Django admin.
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers.DatabaseScheduler'
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Separate queues keep a large fan-out from delaying one-to-one messages, see
+# docker-compose.yaml for the workers consuming each queue.
+CELERY_TASK_DEFAULT_QUEUE = 'messages'
+CELERY_TASK_QUEUES = (
+    Queue('messages', routing_key='messages'),
+    Queue('fanout_events', routing_key='fanout_events'),
+    Queue('fanout_recurring', routing_key='fanout_recurring'),
+    Queue('fanout_chunks', routing_key='fanout_chunks'),
+    Queue('maintenance', routing_key='maintenance'),
+    Queue('attachments', routing_key='attachments'),
+    Queue('otp', routing_key='otp'),
+)
+CELERY_TASK_ROUTES = {
+    'chat.tasks.create_schedule_message': {'queue': 'messages'},
+    'chat.tasks.schedule_event': {'queue': 'messages'},
+    'chat.tasks.schedule_recurring_message': {'queue': 'messages'},
+    'chat.tasks.send_event_message': {'queue': 'fanout_events'},
+    'chat.tasks.send_reception_chunk': {'queue': 'fanout_chunks'},
+    'chat.tasks.archive_old_messages': {'queue': 'maintenance'},
+    'chat.tasks.prune_sync_tombstones': {'queue': 'maintenance'},
+    'chat.tasks.assemble_attachment': {'queue': 'attachments'},
+    'chat.tasks.prune_attachment_uploads': {'queue': 'maintenance'},
+    'accounts.tasks.delete_user_data': {'queue': 'maintenance'},
+    'accounts.tasks.resume_user_deletions': {'queue': 'maintenance'},
+    'accounts.tasks.deliver_otps': {'queue': 'otp'},
+}
+
+# With the redis broker priority 0 is consumed first
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+TASK_PRIORITIES = {
+    'single_send': 0,
+    'event_fanout': 3,
+    'recurring_fanout': 6,
+    'fanout_chunk': 9,
+}
+CELERY_TASK_DEFAULT_PRIORITY = TASK_PRIORITIES['single_send']
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+
+# Fan-outs to more receptions than this are split into low priority chunks
+FANOUT_CHUNK_SIZE = int(os.getenv('FANOUT_CHUNK_SIZE', 500))
+
+# Messages older than this are moved into compressed archive segments
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv('MESSAGE_ARCHIVE_AFTER_DAYS', 365))
+
+# How new message ids are allocated: 'database' lets every insert allocate
+# it, 'sequence' reserves ids from a shared counter in the cache before the
+# insert, across all shards, 'time' generates time-ordered 63 bit ids in the
+# process and accepts ids generated by clients (see chat.ids). Run
+# `manage.py migrate_message_ids` before switching to 'time'.
+MESSAGE_ID_ALLOCATION = os.getenv('MESSAGE_ID_ALLOCATION', 'database')
+
+# Node of this process in time-ordered ids, 0-1023, random when unset
+MESSAGE_ID_NODE = int(os.environ['MESSAGE_ID_NODE']) if os.getenv('MESSAGE_ID_NODE') else None
+
+# How far the time of a client generated message id may be behind the server
+# clock, ids ahead of it are rejected
+MESSAGE_ID_CLIENT_SKEW_SECONDS = int(os.getenv('MESSAGE_ID_CLIENT_SKEW_SECONDS', 300))
+
+# Write-behind buffering of sent messages, see chat.write_behind for the
+# durability guarantees. Requires MESSAGE_ID_ALLOCATION other than 'database'.
+MESSAGE_WRITE_BEHIND = os.getenv('MESSAGE_WRITE_BEHIND', '0') == '1'
+MESSAGE_WRITE_BEHIND_BATCH_SIZE = int(os.getenv('MESSAGE_WRITE_BEHIND_BATCH_SIZE', 200))
+MESSAGE_WRITE_BEHIND_DELAY_MS = int(os.getenv('MESSAGE_WRITE_BEHIND_DELAY_MS', 50))
+MESSAGE_WRITE_BEHIND_MAX_PENDING = int(os.getenv('MESSAGE_WRITE_BEHIND_MAX_PENDING', 5000))
+MESSAGE_WRITE_BEHIND_RETRIES = int(os.getenv('MESSAGE_WRITE_BEHIND_RETRIES', 3))
+
+# Delta sync: rows per collection and page, how far back each sync re-reads
+# to catch rows of transactions that were still running, and how long
+# deletions are remembered (older sync tokens require a full sync)
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', 5))
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+# Message attachments are uploaded in chunks of this many bytes, up to the
+# maximum size. Uploads without progress are deleted after the expiry, see
+# chat.attachments.
+ATTACHMENT_CHUNK_SIZE = int(os.getenv('ATTACHMENT_CHUNK_SIZE', 5 * 1024 * 1024))
+ATTACHMENT_MAX_SIZE = int(os.getenv('ATTACHMENT_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+ATTACHMENT_UPLOAD_EXPIRY_HOURS = int(os.getenv('ATTACHMENT_UPLOAD_EXPIRY_HOURS', 24))
+
+# Deleted users are deactivated at once and their rows deleted in the
+# background: rows per batch, batches per task before it enqueues itself
+# again, and the time without progress after which `resume_user_deletions`
+# restarts a deletion
+USER_DELETION_BATCH_SIZE = int(os.getenv('USER_DELETION_BATCH_SIZE', 500))
+USER_DELETION_BATCHES_PER_TASK = int(os.getenv('USER_DELETION_BATCHES_PER_TASK', 20))
+USER_DELETION_STALL_MINUTES = int(os.getenv('USER_DELETION_STALL_MINUTES', 15))
+
+# Periodic tasks of the deployment, installed by the DatabaseScheduler when
+# beat starts and editable in the admin afterwards
+CELERY_BEAT_SCHEDULE = {
+    'resume-user-deletions': {
+        'task': 'accounts.tasks.resume_user_deletions',
+        'schedule': USER_DELETION_STALL_MINUTES * 60,
+    },
+}
+
+# OTPs are sent by SMS in the background, see accounts.sms for the gateways.
+# Logins within the delay are sent in one batch. A batch is retried with
+# backoff while the gateway is unavailable, up to the maximum attempts, and
+# OTPs not sent within the expiry are dropped.
+SMS_GATEWAY_URL = os.getenv('SMS_GATEWAY_URL', '')
+SMS_GATEWAY_TOKEN = os.getenv('SMS_GATEWAY_TOKEN', '')
+SMS_GATEWAY_BATCH_SIZE = int(os.getenv('SMS_GATEWAY_BATCH_SIZE', 100))
+SMS_GATEWAY_TIMEOUT = int(os.getenv('SMS_GATEWAY_TIMEOUT', 10))
+OTP_SMS_GATEWAY = os.getenv(
+    'OTP_SMS_GATEWAY',
+    'accounts.sms.HTTPSMSGateway' if SMS_GATEWAY_URL else 'accounts.sms.ConsoleSMSGateway',
+)
+OTP_DELIVERY_DELAY_MS = int(os.getenv('OTP_DELIVERY_DELAY_MS', 200))
+OTP_DELIVERY_MAX_ATTEMPTS = int(os.getenv('OTP_DELIVERY_MAX_ATTEMPTS', 5))
+OTP_DELIVERY_EXPIRY_SECONDS = int(os.getenv('OTP_DELIVERY_EXPIRY_SECONDS', 300))
+
+# Precomputed OpenAPI schema served to the Swagger UI, written by
+# `manage.py generate_openapi_schema`. Without it the schema is generated on
+# the first request for it.
+OPENAPI_SCHEMA_FILE = os.getenv('OPENAPI_SCHEMA_FILE', BASE_DIR / 'openapi.json')
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
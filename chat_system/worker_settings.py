@@ -0,0 +1,25 @@
+"""
+Celery worker settings for chat_system project.
+
+Workers never serve HTTP, so the admin, the API docs and the other web-only
+apps and middleware are left out and never imported at startup:
+
+    DJANGO_SETTINGS_MODULE=chat_system.worker_settings celery -A chat_system worker
+"""
+from .settings import *  # noqa: F401,F403
+
+WEB_ONLY_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'drf_yasg',
+]
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WEB_ONLY_APPS]
+
+MIDDLEWARE = []
+
+ROOT_URLCONF = 'chat_system.worker_urls'
+
+TEMPLATES = []
@@ -0,0 +1,8 @@
+"""
+Empty URL configuration of Celery workers.
+
+The Django checks run by the worker at startup resolve ROOT_URLCONF, this
+keeps them from importing the admin and every API view.
+"""
+
+urlpatterns = []
@@ -0,0 +1,129 @@
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+CURSOR_VAR = "before"
+# filtered changelists count their rows up to this many
+COUNT_LIMIT = 1000
+
+
+def estimated_count(model, using="default"):
+    """
+    Return the number of rows of a model's table from the database statistics.
+
+    MongoDB keeps the document count of a collection in its metadata and
+    PostgreSQL estimates it in pg_class, neither scans the table. Other
+    databases are counted exactly.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == "djongo":
+        connection.ensure_connection()
+        return connection.connection[table].estimated_document_count()
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table]
+            )
+            row = cursor.fetchone()
+        # -1 until the table is first analyzed
+        if row is not None and row[0] >= 0:
+            return row[0]
+    return model._base_manager.using(using).count()
+
+
+def bounded_count(queryset, limit=COUNT_LIMIT):
+    """
+    Return the number of rows of a queryset, estimated when it is unfiltered
+    and counted up to `limit` otherwise
+    """
+    if not queryset.query.has_filters():
+        return estimated_count(queryset.model, queryset.db)
+    return len(queryset.values_list("pk", flat=True)[:limit])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting with `bounded_count` instead of `COUNT(*)`.
+
+    Used by the autocomplete views, which only need to know whether there is
+    another page.
+    """
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return bounded_count(self.object_list)
+        return len(self.object_list)
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist paging by primary key instead of by offset.
+
+    Rows are listed newest first, the next page is the rows below the last
+    primary key shown, passed as `?before=`. Every page is an indexed range
+    read, however deep, and the total is estimated instead of counted.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        # not a lookup, hide it from the filters of the changelist
+        request.GET = request.GET.copy()
+        cursor = request.GET.pop(CURSOR_VAR, [""])[-1]
+        self.cursor = int(cursor) if cursor.isdigit() else None
+        super().__init__(request, *args, **kwargs)
+
+    def get_ordering(self, request, queryset):
+        return ["-pk"]
+
+    def get_results(self, request):
+        queryset = self.queryset
+        if self.cursor is not None:
+            queryset = queryset.filter(pk__lt=self.cursor)
+        results = self.model_admin.get_keyset_page(queryset, self.list_per_page + 1)
+
+        self.result_list = results[: self.list_per_page]
+        self.next_cursor = (
+            self.result_list[-1].pk if len(results) > self.list_per_page else None
+        )
+        self.result_count = self.model_admin.get_result_count(self.queryset)
+        filtered = bool(self.queryset.query.has_filters())
+        self.result_count_estimated = not filtered
+        self.result_count_bounded = filtered and self.result_count >= COUNT_LIMIT
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = bool(self.result_list)
+        self.can_show_all = False
+        self.multi_page = self.cursor is not None or self.next_cursor is not None
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR])
+        self.next_page_url = self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class KeysetAdminMixin:
+    """
+    ModelAdmin mixin for tables too large for the default changelist.
+
+    The changelist is paged with `KeysetChangeList`, sorting by column is
+    disabled since it would order the whole table without an index, and no
+    count scans the table.
+    """
+
+    change_list_template = "admin/keyset_change_list.html"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    sortable_by = ()
+    date_hierarchy = None
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_keyset_page(self, queryset, limit):
+        """
+        Return the first `limit` rows of the ordered changelist queryset
+        """
+        return list(queryset[:limit])
+
+    def get_result_count(self, queryset):
+        return bounded_count(queryset)
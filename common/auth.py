@@ -0,0 +1,24 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+authentication = JWTAuthentication()
+
+
+def get_token_user_id(request):
+    """
+    Return the user id claimed by the request's JWT access token.
+
+    The token signature and expiry are verified but the user is not loaded, so
+    this costs no database query. Returns None without a valid token.
+    """
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token)[
+            jwt_settings.USER_ID_CLAIM
+        ]
+    except (InvalidToken, KeyError):
+        return None
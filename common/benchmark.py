@@ -0,0 +1,888 @@
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import sms
+from accounts.models import User, UserProfile
+from chat.models import Event, Message, MessageSetting, RecurringMessage
+from chat.sharding import find_message
+from chat.tasks import create_schedule_message, send_event_message
+from chat.write_behind import get_write_buffer
+from common.query_cache import djongo_sql, make_cached_parse
+
+BATCH_SIZE = 500
+
+
+def percentile(samples, pct):
+    """
+    Return the nearest-rank percentile of an already sorted list of samples
+    """
+    if not samples:
+        return 0.0
+    rank = int(round(pct / 100.0 * len(samples)))
+    index = max(0, min(len(samples) - 1, rank - 1))
+    return samples[index]
+
+
+def current_commit():
+    """
+    Return the git commit the benchmark is run against, if available
+    """
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class SyntheticDataGenerator:
+    """
+    Generator for reproducible benchmark datasets.
+
+    All rows are created through `bulk_create`, so the post_save signals that
+    schedule celery beat tasks are not triggered while populating the database.
+
+    Attributes:
+        random: Seeded random generator used for every generated value.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def text(self, length=40):
+        return "".join(
+            self.random.choice(string.ascii_letters + " ") for _ in range(length)
+        )
+
+    def create_users(self, count):
+        offset = User.objects.count()
+        phone_numbers = [f"+1{9000000000 + offset + i}" for i in range(count)]
+        User.objects.bulk_create(
+            [
+                User(
+                    first_name=f"bench{offset + i}",
+                    last_name="user",
+                    email=f"bench{offset + i}@example.com",
+                    phone_number=phone_number,
+                )
+                for i, phone_number in enumerate(phone_numbers)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        users = list(User.objects.filter(phone_number__in=phone_numbers))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, address=self.text(20)) for user in users],
+            batch_size=BATCH_SIZE,
+        )
+        return users
+
+    def create_messages(self, users, per_user):
+        now = timezone.now()
+        messages = []
+        for user in users:
+            for i in range(per_user):
+                messages.append(
+                    Message(
+                        sender=user,
+                        receiver=self.random.choice(users),
+                        content=self.text(),
+                        scheduled_time=now - timedelta(minutes=i),
+                    )
+                )
+        Message.objects.bulk_create(messages, batch_size=BATCH_SIZE)
+        return sorted(
+            (
+                message_id
+                for alias in settings.MESSAGE_SHARDS
+                for message_id in Message.objects.using(alias).values_list(
+                    "id", flat=True
+                )
+            ),
+            reverse=True,
+        )
+
+    def create_message_setting(self, receptions):
+        message_setting = MessageSetting.objects.create(
+            is_auto_sending_on=True, is_recurring_on=True, is_active=True
+        )
+        message_setting.receptions.set(receptions)
+        return message_setting
+
+    def create_events(self, users, per_user):
+        now = timezone.now()
+        Event.objects.bulk_create(
+            [
+                Event(
+                    title=self.text(20),
+                    organize_by=user,
+                    schedule_on=now + timedelta(days=self.random.randint(1, 365)),
+                    description=self.text(),
+                )
+                for user in users
+                for _ in range(per_user)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    def create_recurring_messages(self, message_ids, count):
+        now = timezone.now()
+        RecurringMessage.objects.bulk_create(
+            [
+                RecurringMessage(
+                    message_id=self.random.choice(message_ids),
+                    start_date=now,
+                    end_date=now + timedelta(days=365),
+                    schedule=self.random.choice(["daily", "weekly", "monthly"]),
+                )
+                for _ in range(count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    def populate(
+        self,
+        users=100,
+        messages_per_user=50,
+        receptions=1000,
+        events_per_user=2,
+        recurring_messages=50,
+    ):
+        """
+        Populate the database and return the generated dataset.
+
+        Args:
+            users (int): Number of users (with profiles) taking part in conversations.
+            messages_per_user (int): Number of messages sent by every user.
+            receptions (int): Size of the active message setting's reception list.
+            events_per_user (int): Number of events organised by every user.
+            recurring_messages (int): Number of recurring message schedules.
+
+        Returns:
+            dict: The generated users, message ids and active message setting.
+        """
+        chat_users = self.create_users(users)
+        reception_users = chat_users + self.create_users(max(0, receptions - users))
+        message_ids = self.create_messages(chat_users, messages_per_user)
+        message_setting = self.create_message_setting(reception_users[:receptions])
+        self.create_events(chat_users, events_per_user)
+        self.create_recurring_messages(message_ids, recurring_messages)
+        return {
+            "users": chat_users,
+            "message_ids": message_ids,
+            "message_setting": message_setting,
+        }
+
+
+class BenchmarkContext:
+    """
+    Shared state handed to every benchmark scenario.
+
+    Attributes:
+        dataset: The dataset returned by `SyntheticDataGenerator.populate`.
+        random: Seeded random generator used to pick users and messages.
+    """
+
+    def __init__(self, dataset, seed=0):
+        self.dataset = dataset
+        self.random = random.Random(seed)
+        self._clients = {}
+
+    def user(self):
+        return self.random.choice(self.dataset["users"])
+
+    def message_id(self):
+        return self.random.choice(self.dataset["message_ids"])
+
+    def client_for(self, user):
+        """
+        Return an API client authenticated with a real JWT access token
+        """
+        if user.id not in self._clients:
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user=user)}"
+            )
+            self._clients[user.id] = client
+        return self._clients[user.id]
+
+
+class Scenario:
+    """
+    A single benchmarked operation.
+
+    Attributes:
+        name: Name used to select the scenario and to report its results.
+        run: Callable executing the timed operation, receives the context and
+             the value returned by `prepare`. It may return the size of the
+             response body in bytes to have its mean reported.
+        prepare: Optional callable executed before every iteration, outside of
+                 the timed section.
+    """
+
+    def __init__(self, name, run, prepare=None):
+        self.name = name
+        self.run = run
+        self.prepare = prepare
+
+    def measure(self, context, iterations, warmup=0):
+        """
+        Execute the scenario and return its throughput and latency percentiles
+        """
+        for _ in range(warmup):
+            self.run(context, self.prepare(context) if self.prepare else None)
+
+        samples = []
+        sizes = []
+        for _ in range(iterations):
+            prepared = self.prepare(context) if self.prepare else None
+            start = time.perf_counter()
+            size = self.run(context, prepared)
+            samples.append(time.perf_counter() - start)
+            if isinstance(size, int):
+                sizes.append(size)
+
+        samples.sort()
+        total = sum(samples)
+        result = {
+            "scenario": self.name,
+            "iterations": iterations,
+            "throughput_rps": round(iterations / total, 2) if total else 0.0,
+            "mean_ms": round(total / iterations * 1000, 3) if iterations else 0.0,
+            "p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p95_ms": round(percentile(samples, 95) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        }
+        if sizes:
+            result["mean_response_bytes"] = round(sum(sizes) / len(sizes))
+        return result
+
+
+SCENARIOS = {}
+
+
+def scenario(name, prepare=None):
+    """
+    Register a benchmark scenario
+    """
+
+    def decorator(func):
+        SCENARIOS[name] = Scenario(name, func, prepare)
+        return func
+
+    return decorator
+
+
+def check_response(response, expected_status):
+    if response.status_code != expected_status:
+        raise AssertionError(
+            f"Expected HTTP {expected_status}, got {response.status_code}: "
+            f"{getattr(response, 'data', response.content)}"
+        )
+    return response
+
+
+@scenario("message_list")
+def message_list(context, _):
+    user = context.user()
+    response = check_response(
+        context.client_for(user).get(reverse("chat:message-list-create")), 200
+    )
+    return len(response.content)
+
+
+@scenario("message_list_msgpack")
+def message_list_msgpack(context, _):
+    user = context.user()
+    response = check_response(
+        context.client_for(user).get(
+            reverse("chat:message-list-create"), HTTP_ACCEPT="application/msgpack"
+        ),
+        200,
+    )
+    return len(response.content)
+
+
+@scenario("message_list_sparse")
+def message_list_sparse(context, _):
+    user = context.user()
+    response = check_response(
+        context.client_for(user).get(
+            reverse("chat:message-list-create"),
+            {"fields": "id,sender,content,created_at"},
+        ),
+        200,
+    )
+    return len(response.content)
+
+
+def prepare_conditional_get(context):
+    user = context.user()
+    response = check_response(
+        context.client_for(user).get(reverse("chat:message-list-create")), 200
+    )
+    return user, response["ETag"]
+
+
+@scenario("message_list_not_modified", prepare=prepare_conditional_get)
+def message_list_not_modified(context, prepared):
+    user, etag = prepared
+    check_response(
+        context.client_for(user).get(
+            reverse("chat:message-list-create"), HTTP_IF_NONE_MATCH=etag
+        ),
+        304,
+    )
+
+
+@scenario("user_retrieve")
+def user_retrieve(context, _):
+    user = context.user()
+    check_response(
+        context.client_for(user).get(
+            reverse("accounts:user_update_api", kwargs={"pk": user.id})
+        ),
+        200,
+    )
+
+
+@scenario("unread_counts")
+def unread_counts(context, _):
+    check_response(
+        context.client_for(context.user()).get(reverse("chat:unread-counts")), 200
+    )
+
+
+@scenario("message_create")
+def message_create(context, _):
+    user = context.user()
+    check_response(
+        context.client_for(user).post(
+            reverse("chat:message-list-create"),
+            {"sender": user.id, "receiver": context.user().id, "content": "bench"},
+            format="json",
+        ),
+        201,
+    )
+
+
+def prepare_write_behind(context):
+    get_write_buffer().flush()
+
+
+@scenario("message_create_write_behind", prepare=prepare_write_behind)
+def message_create_write_behind(context, prepared):
+    with override_settings(
+        MESSAGE_WRITE_BEHIND=True, MESSAGE_ID_ALLOCATION="sequence"
+    ):
+        message_create(context, prepared)
+
+
+def prepare_own_message(context):
+    # only the sender or the receiver of a message may reply to or forward it
+    message = find_message(context.message_id())
+    users = {user.id: user for user in context.dataset["users"]}
+    return users[message.sender_id], message.id
+
+
+@scenario("message_reply", prepare=prepare_own_message)
+def message_reply(context, prepared):
+    user, message_id = prepared
+    receiver_id = context.user().id
+    check_response(
+        context.client_for(user).post(
+            reverse("chat:reply-message"),
+            {
+                "message_id": message_id,
+                "sender": user.id,
+                "receiver": receiver_id,
+                "receiver_id": receiver_id,
+            },
+            format="json",
+        ),
+        201,
+    )
+
+
+@scenario("message_forward", prepare=prepare_own_message)
+def message_forward(context, prepared):
+    user, message_id = prepared
+    check_response(
+        context.client_for(user).post(
+            reverse("chat:forward-message"),
+            {
+                "message_id": message_id,
+                "sender": user.id,
+                "receiver": context.user().id,
+            },
+            format="json",
+        ),
+        201,
+    )
+
+
+@scenario("event_list")
+def event_list(context, _):
+    check_response(
+        context.client_for(context.user()).get(reverse("chat:event-list-create")),
+        200,
+    )
+
+
+@scenario("otp_login")
+def otp_login(context, _):
+    check_response(
+        APIClient().post(
+            reverse("accounts:user_login_api"),
+            {"phone_number": context.user().phone_number},
+            format="json",
+        ),
+        200,
+    )
+
+
+def prepare_otp_verify(context):
+    phone_number = context.user().phone_number
+    sms.outbox.clear()
+    response = check_response(
+        APIClient().post(
+            reverse("accounts:user_login_api"),
+            {"phone_number": phone_number},
+            format="json",
+        ),
+        200,
+    )
+    # bench_settings keeps the sent SMS in the local outbox
+    message = [m for m in sms.outbox if m.phone_number == phone_number][-1]
+    otp = message.body.rstrip(".").rsplit(" ", 1)[-1]
+    return {**response.data, "otp": otp}
+
+
+@scenario("otp_verify", prepare=prepare_otp_verify)
+def otp_verify(context, login_data):
+    check_response(
+        APIClient().post(
+            login_data["otp_verify_link"], {"otp": login_data["otp"]}, format="json"
+        ),
+        200,
+    )
+
+
+def prepare_event_fanout(context):
+    # bulk_create skips the post_save signal, no beat task is scheduled
+    Event.objects.bulk_create(
+        [
+            Event(
+                title="bench fan-out",
+                organize_by=context.user(),
+                description="bench fan-out",
+            )
+        ]
+    )
+    return Event.objects.latest("id").id
+
+
+@scenario("event_fanout_task", prepare=prepare_event_fanout)
+def event_fanout_task(context, event_id):
+    send_event_message({"event_id": event_id})
+
+
+@scenario("recurring_fanout_task")
+def recurring_fanout_task(context, _):
+    create_schedule_message(
+        {
+            "is_recurring": True,
+            "sender_id": context.user().id,
+            "content": "bench recurring",
+        }
+    )
+
+
+def simulate_db_latency(latency_ms):
+    """
+    Delay every query by `latency_ms`, emulating a remote database round trip.
+
+    The delay is installed on the connections of the current thread and on
+    every connection opened afterwards, including those of worker threads.
+    """
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency_ms / 1000.0)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+    for connection in connections.all():
+        install(connection)
+
+
+async def asgi_get(application, path, headers):
+    """
+    Issue a GET request straight to an ASGI application and return its status
+    """
+    done = asyncio.Event()
+    request = [{"type": "http.request", "body": b"", "more_body": False}]
+    status = []
+
+    async def receive():
+        if request:
+            return request.pop()
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif not message.get("more_body"):
+            done.set()
+
+    await application(
+        {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        },
+        receive,
+        send,
+    )
+    return status[0]
+
+
+def capacity_result(mode, path, concurrency, threads, samples, elapsed):
+    samples.sort()
+    return {
+        "mode": mode,
+        "path": path,
+        "concurrency": concurrency,
+        "threads": threads,
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def measure_wsgi_capacity(context, path, concurrency, requests, threads):
+    """
+    Measure a single WSGI process serving `concurrency` concurrent clients
+    with `threads` worker threads
+    """
+    token = f"Bearer {AccessToken.for_user(user=context.user())}"
+    local = threading.local()
+
+    def call():
+        if not hasattr(local, "client"):
+            local.client = Client(HTTP_AUTHORIZATION=token)
+        start = time.perf_counter()
+        check_response(local.client.get(path), 200)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(threads, concurrency)) as executor:
+        samples = list(executor.map(lambda _: call(), range(requests)))
+    return capacity_result(
+        "wsgi", path, concurrency, threads, samples, time.perf_counter() - start
+    )
+
+
+def measure_asgi_capacity(context, path, concurrency, requests, threads):
+    """
+    Measure a single ASGI process serving `concurrency` concurrent clients.
+
+    Django runs every request's sync view in a thread of its own, so at most
+    `threads` requests are let in at once to give it as many threads as the
+    WSGI process.
+    """
+    application = ASGIHandler()
+    token = f"Bearer {AccessToken.for_user(user=context.user())}"
+    headers = [(b"authorization", token.encode())]
+
+    async def run():
+        semaphore = asyncio.Semaphore(min(threads, concurrency))
+
+        async def call():
+            async with semaphore:
+                start = time.perf_counter()
+                status = await asgi_get(application, path, headers)
+                if status != 200:
+                    raise AssertionError(f"Expected HTTP 200, got {status}")
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*(call() for _ in range(requests)))
+
+    start = time.perf_counter()
+    samples = list(asyncio.run(run()))
+    return capacity_result(
+        "asgi", path, concurrency, threads, samples, time.perf_counter() - start
+    )
+
+
+def run_capacity_benchmarks(context, concurrency, requests, threads):
+    """
+    Compare concurrent-request capacity per process of the chat views served
+    under WSGI and under ASGI.
+
+    The views are synchronous, DRF and the database driver block, so under
+    ASGI Django runs each request in a thread holding a database connection
+    just like a WSGI worker thread. With the same number of threads ASGI
+    cannot serve more requests, the comparison measures its overhead: a new
+    thread and database connection per request.
+
+    Args:
+        context (BenchmarkContext): The shared benchmark state.
+        concurrency (int): Number of concurrent clients.
+        requests (int): Number of requests issued per measurement.
+        threads (int): Threads of each serving mode.
+
+    Returns:
+        list: One result per view and serving mode.
+    """
+    results = []
+    for name in ("chat:message-list-create", "chat:event-list-create"):
+        path = reverse(name)
+        results.append(
+            measure_wsgi_capacity(context, path, concurrency, requests, threads)
+        )
+        results.append(
+            measure_asgi_capacity(context, path, concurrency, requests, threads)
+        )
+    return results
+
+
+# Code importing what a process loads before it can serve its first request
+STARTUP_TARGETS = {
+    "web": (
+        "from chat_system.wsgi import application\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+    "worker": (
+        "from chat_system.celery import app\n"
+        "app.loader.import_default_modules()\n"
+    ),
+}
+
+
+def parse_importtime(output):
+    """
+    Sum the self time of `python -X importtime` output per top-level package
+    """
+    packages = defaultdict(int)
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        packages[name.strip().split(".")[0]] += int(self_us)
+    return packages
+
+
+def measure_startup(target, settings_module, runs=5, top=15):
+    """
+    Measure the startup of a web or worker process in a fresh interpreter.
+
+    Args:
+        target (str): Name of the process in STARTUP_TARGETS.
+        settings_module (str): DJANGO_SETTINGS_MODULE of the process.
+        runs (int): Number of timed interpreter starts, after one warm-up.
+        top (int): Number of slowest packages reported in the breakdown.
+
+    Returns:
+        dict: Median wall and import times in milliseconds, and the mean
+              import time of the slowest top-level packages.
+    """
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings_module}
+    command = [sys.executable, "-X", "importtime", "-c", STARTUP_TARGETS[target]]
+    wall_times = []
+    import_times = []
+    packages = defaultdict(int)
+    for run in range(runs + 1):
+        start = time.perf_counter()
+        process = subprocess.run(
+            command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        elapsed = time.perf_counter() - start
+        if process.returncode:
+            raise RuntimeError(
+                f"{target} startup failed:\n{process.stderr[-2000:]}"
+            )
+        if not run:
+            # the warm-up run compiles the bytecode caches
+            continue
+        run_packages = parse_importtime(process.stderr)
+        wall_times.append(elapsed * 1000)
+        import_times.append(sum(run_packages.values()) / 1000)
+        for name, self_us in run_packages.items():
+            packages[name] += self_us
+
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "target": target,
+        "settings": settings_module,
+        "runs": runs,
+        "wall_ms": round(statistics.median(wall_times), 3),
+        "imports_ms": round(statistics.median(import_times), 3),
+        "packages_ms": {
+            name: round(self_us / runs / 1000, 3) for name, self_us in slowest[:top]
+        },
+    }
+
+
+def run_startup_benchmarks(web_settings, worker_settings, runs):
+    """
+    Measure the startup of a web and of a Celery worker process
+    """
+    return [
+        measure_startup("web", web_settings, runs),
+        measure_startup("worker", worker_settings, runs),
+    ]
+
+
+# Chat endpoints whose queries are parsed through the translation cache
+TRANSLATION_SCENARIOS = [
+    "message_list",
+    "message_create",
+    "message_reply",
+    "message_forward",
+    "unread_counts",
+    "event_list",
+]
+
+
+def capture_queries(context, scenario, iterations):
+    """
+    Run a scenario and return the SQL of every query it executed, in order
+    """
+    queries = []
+
+    def capture(execute, sql, params, many, execute_context):
+        queries.append(sql)
+        return execute(sql, params, many, execute_context)
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(capture))
+        for _ in range(iterations):
+            scenario.run(context, scenario.prepare(context) if scenario.prepare else None)
+    return queries
+
+
+def measure_query_translation(context, names, iterations, maxsize):
+    """
+    Measure the djongo query translation cache on the chat endpoints.
+
+    The SQL executed by each scenario is captured, on whichever database the
+    benchmark runs, and parsed as djongo parses it before converting it to
+    MongoDB, once with plain sqlparse and once through a cold cache of
+    `maxsize` statements.
+
+    Returns:
+        list: Per scenario, the queries and distinct shapes per request, the
+              parse time per request with and without the cache, and the
+              hits and misses of the cache.
+    """
+    import sqlparse
+
+    results = []
+    for name in names:
+        statements = [
+            djongo_sql(sql)
+            for sql in capture_queries(context, SCENARIOS[name], iterations)
+        ]
+        cached_parse = make_cached_parse(maxsize)
+        timings = []
+        for parse in (sqlparse.parse, cached_parse):
+            start = time.perf_counter()
+            for statement in statements:
+                parse(statement)
+            timings.append((time.perf_counter() - start) / iterations * 1000)
+        info = cached_parse.cache_info()
+        results.append(
+            {
+                "scenario": name,
+                "queries_per_request": round(len(statements) / iterations, 2),
+                "shapes": len(set(statements)),
+                "uncached_parse_ms": round(timings[0], 3),
+                "cached_parse_ms": round(timings[1], 3),
+                "hits": info.hits,
+                "misses": info.misses,
+                "hit_rate": round(info.hits / len(statements), 4)
+                if statements
+                else 0.0,
+            }
+        )
+    return results
+
+
+def run_benchmarks(context, names, iterations, warmup=0):
+    """
+    Run the selected scenarios and return machine-readable results.
+
+    Args:
+        context (BenchmarkContext): The shared benchmark state.
+        names (list): Names of the scenarios to run, in order.
+        iterations (int): Number of timed iterations per scenario.
+        warmup (int): Number of untimed iterations per scenario.
+
+    Returns:
+        dict: Run metadata and the results of every scenario.
+    """
+    return {
+        "commit": current_commit(),
+        "timestamp": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "results": [
+            SCENARIOS[name].measure(context, iterations, warmup) for name in names
+        ],
+    }
+
+
+def dump_results(results, path=None):
+    """
+    Serialise benchmark results as JSON, to `path` when given
+    """
+    output = json.dumps(results, indent=2, default=str)
+    if path:
+        with open(path, "w") as results_file:
+            results_file.write(output + "\n")
+    return output
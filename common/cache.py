@@ -0,0 +1,52 @@
+import time
+from itertools import count
+
+from django.conf import settings
+from django.core.cache import cache
+
+MAILBOX_VERSION = "mailbox"
+PROFILE_VERSION = "profile"
+
+_sequence = count()
+
+
+def version_key(scope, owner_id):
+    return f"version:{scope}:{owner_id}"
+
+
+def new_version():
+    """
+    Return a fresh version token.
+
+    Versions only need to differ from every previous value, so a timestamp is
+    used instead of incrementing a counter: an evicted counter can never come
+    back with a value a client has already seen.
+    """
+    return f"{time.time_ns():x}{next(_sequence) % 1000:03d}"
+
+
+def get_version(scope, owner_id):
+    """
+    Return the current version of `scope` for the given owner
+    """
+    key = version_key(scope, owner_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(scope, owner_ids):
+    """
+    Invalidate `scope` for every given owner with a single cache round trip
+    """
+    version = new_version()
+    cache.set_many(
+        {version_key(scope, owner_id): version for owner_id in set(owner_ids)},
+        timeout=None,
+    )
+
+
+def page_cache_timeout():
+    return getattr(settings, "VERSIONED_PAGE_CACHE_TIMEOUT", 300)
@@ -1,8 +1,16 @@
 from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 from django_celery_beat.models import CrontabSchedule, PeriodicTask
-import random, string
+from zoneinfo import ZoneInfo
+import json, random, string
 
-from chat.models import MessageSetting, Message
+from chat.models import ConversationReadState, MessageSetting, Message
+from chat.sharding import conversation_messages
+from common.cache import MAILBOX_VERSION, bump_version
+
+CRONJOB_TIMEZONE = "Asia/Kolkata"
 
 
 def save_user_img(user_data, img_data):
@@ -19,14 +27,18 @@ def save_user_img(user_data, img_data):
 def create_cronjob(schedule_time):
     """
     Create a crontab objects
+
+    Naive times are read in CRONJOB_TIMEZONE, aware times are converted to it.
     """
+    if timezone.is_aware(schedule_time):
+        schedule_time = timezone.localtime(schedule_time, ZoneInfo(CRONJOB_TIMEZONE))
     crontab_obj, _ = CrontabSchedule.objects.get_or_create(
         minute=schedule_time.minute,
         hour=schedule_time.hour,
         day_of_month=schedule_time.day,
         month_of_year=schedule_time.month,
         day_of_week="*",
-        timezone="Asia/Kolkata",
+        timezone=CRONJOB_TIMEZONE,
     )
     return crontab_obj
 
@@ -34,34 +46,141 @@ def create_cronjob(schedule_time):
 def manage_periodic_task(data, crontab_obj):
     """
     Create a periodic task
+
+    The tasks take their data as one positional dict, beat stores it as JSON.
+    last_run_at is stored as well: beat would otherwise count from the time
+    it reloads the schedule, and a reload right after the task is due, caused
+    by any other task changing, would skip the run.
+
+    With data["name"] the task is only created once under that name, so a
+    retried scheduling task does not schedule a run twice.
     """
-    periodic_task_obj = PeriodicTask.objects.create(
-        name=f"event task - {data['title']} - {''.join(random.choice(string.ascii_lowercase) for i in range(10))}",
-        task=data["task"],
-        crontab=crontab_obj,
-        kwargs=data["task_data"],
-        one_off=True,
+    name = data.get("name") or (
+        f"event task - {data['title']} - "
+        f"{''.join(random.choice(string.ascii_lowercase) for i in range(10))}"
+    )
+    periodic_task_obj, _ = PeriodicTask.objects.get_or_create(
+        name=name,
+        defaults={
+            "task": data["task"],
+            "crontab": crontab_obj,
+            "args": json.dumps([data["task_data"]]),
+            "last_run_at": timezone.now(),
+            "one_off": True,
+            "queue": data.get("queue"),
+            "priority": data.get("priority"),
+        },
     )
     return periodic_task_obj
 
 
-def manage_receptions_message(sender_id, content):
+def manage_receptions_message(sender_id, content, receiver_ids=None):
     """
     sent to multiple messages to receptions
+
+    When receiver_ids is given only that chunk of the receptions is sent to.
+    """
+    if receiver_ids is None:
+        receiver_ids = get_reception_ids()
+
+    messages = [
+        Message(sender_id=sender_id, receiver_id=receiver_id, content=content)
+        for receiver_id in receiver_ids
+    ]
+    if messages:
+        Message.objects.bulk_create(messages)
+        # bulk_create skips post_save, update the mailboxes here
+        bump_version(MAILBOX_VERSION, [sender_id] + list(receiver_ids))
+        increment_unread_counts(sender_id, receiver_ids)
+
+    return True
+
+
+def get_reception_ids():
+    """
+    Return the receptions of the active message setting, if sending is on
     """
     message_setting = MessageSetting.objects.filter(is_active=True).first()
-    messages = []
-    if message_setting.is_recurring_on or message_setting.is_auto_sending_on:
-        for user in message_setting.receptions.all():
-            messages.append(
-                Message(
-                    sender_id=sender_id,
-                    receiver=user.id,
-                    content=content,
-                )
+    if message_setting and (
+        message_setting.is_recurring_on or message_setting.is_auto_sending_on
+    ):
+        return list(message_setting.receptions.values_list("id", flat=True))
+    return []
+
+
+def increment_unread_counts(sender_id, receiver_ids, count=1):
+    """
+    Count `count` new messages from sender as unread for every receiver.
+
+    Existing read states are incremented in the database, so concurrent
+    increments and reads never overwrite each other. A read state created by
+    a concurrent message after the lookup is incremented instead of inserted.
+    """
+    receiver_ids = set(receiver_ids) - {sender_id}
+    if not receiver_ids:
+        return
+
+    existing_ids = set(
+        ConversationReadState.objects.filter(
+            user_id__in=receiver_ids, peer_id=sender_id
+        ).values_list("user_id", flat=True)
+    )
+    if existing_ids:
+        ConversationReadState.objects.filter(
+            user_id__in=existing_ids, peer_id=sender_id
+        ).update(unread_count=F("unread_count") + count)
+
+    missing_ids = receiver_ids - existing_ids
+    if not missing_ids:
+        return
+    try:
+        with transaction.atomic():
+            ConversationReadState.objects.bulk_create(
+                [
+                    ConversationReadState(
+                        user_id=user_id, peer_id=sender_id, unread_count=count
+                    )
+                    for user_id in missing_ids
+                ]
+            )
+    except IntegrityError:
+        # some were created concurrently, the whole insert was rolled back
+        for user_id in missing_ids:
+            read_states = ConversationReadState.objects.filter(
+                user_id=user_id, peer_id=sender_id
             )
+            if read_states.update(unread_count=F("unread_count") + count):
+                continue
+            try:
+                with transaction.atomic():
+                    ConversationReadState.objects.create(
+                        user_id=user_id, peer_id=sender_id, unread_count=count
+                    )
+            except IntegrityError:
+                read_states.update(unread_count=F("unread_count") + count)
 
-        if messages:
-            Message.objects.bulk_create(messages)
 
-    return True
+def mark_conversation_read(user_id, peer_id, up_to):
+    """
+    Move the read high-water mark of a conversation up to a message id.
+
+    The mark and the recounted unread messages after it are written in one
+    update conditioned on the stored mark being lower, so a stale or
+    concurrent request never moves the mark backwards or overwrites the
+    count of a newer mark.
+    """
+    ConversationReadState.objects.get_or_create(user_id=user_id, peer_id=peer_id)
+    unread_count = (
+        conversation_messages(user_id, peer_id)
+        .filter(sender_id=peer_id, id__gt=up_to)
+        .count()
+    )
+    read_states = ConversationReadState.objects.filter(
+        user_id=user_id, peer_id=peer_id
+    )
+    read_states.filter(last_read_message_id__lt=up_to).update(
+        last_read_message_id=up_to,
+        unread_count=unread_count,
+        updated_at=timezone.now(),
+    )
+    return read_states.get()
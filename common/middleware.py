@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from chat_system.db_routers import replica_reads
+from common.auth import get_token_user_id
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaReadMiddleware:
+    """
+    Middleware letting safe requests read from the database replicas.
+
+    A client that wrote within the last REPLICA_STICKINESS_SECONDS keeps reading
+    from the primary, so it always reads its own writes even while the
+    replicas lag. Clients are identified by their JWT user id, or by IP.
+    Other users' writes are not sticky, views caching pages by version read
+    them from the primary, see common.views.VersionedCacheMixin.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_sticky_key(self, request):
+        user_id = get_token_user_id(request)
+        if user_id is not None:
+            return f"db-sticky:user-{user_id}"
+        return f"db-sticky:ip-{request.META.get('REMOTE_ADDR')}"
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        sticky_key = self.get_sticky_key(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if response.status_code < 400:
+                cache.set(sticky_key, True, settings.REPLICA_STICKINESS_SECONDS)
+            return response
+
+        with replica_reads(not cache.get(sticky_key)):
+            return self.get_response(request)
@@ -0,0 +1,83 @@
+import importlib
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+# djongo modules parsing SQL with `from sqlparse import parse as sqlparse`
+DJONGO_PARSER_MODULES = [
+    "djongo.sql2mongo.query",
+    "djongo.sql2mongo.sql_tokens",
+    "djongo.sql2mongo.converters",
+]
+PLACEHOLDER_RE = re.compile(r"%s")
+
+_cached_parse = None
+
+
+def make_cached_parse(maxsize):
+    """
+    Return `sqlparse.parse` behind an LRU cache of `maxsize` statements
+    """
+    import sqlparse
+
+    return lru_cache(maxsize=maxsize)(sqlparse.parse)
+
+
+def djongo_sql(sql):
+    """
+    Return SQL as djongo parses it, with the `%s` placeholders numbered
+    """
+    counter = iter(range(sql.count("%s")))
+    return PLACEHOLDER_RE.sub(lambda _: f"%({next(counter)})s", sql)
+
+
+def install_translation_cache(maxsize=None):
+    """
+    Cache the SQL parsed by djongo to translate queries to MongoDB.
+
+    djongo parses the SQL of every query with sqlparse before converting it,
+    although the ORM renders the same few shapes over and over. The SQL it
+    parses has numbered placeholders instead of the parameters, so a parsed
+    statement is reused by every query of the same shape, and its converters
+    still read the parameters of each execution. They only read the parsed
+    tokens, which are shared between threads.
+
+    Args:
+        maxsize (int): Statements kept, the least recently used are evicted.
+                       settings.DJONGO_QUERY_CACHE_SIZE by default, 0 disables
+                       the cache.
+
+    Returns:
+        bool: Whether the cache is installed, False without a djongo database.
+    """
+    global _cached_parse
+    if maxsize is None:
+        maxsize = settings.DJONGO_QUERY_CACHE_SIZE
+    if not maxsize or not any(
+        database["ENGINE"] == "djongo" for database in settings.DATABASES.values()
+    ):
+        return False
+    if _cached_parse is None:
+        _cached_parse = make_cached_parse(maxsize)
+        for name in DJONGO_PARSER_MODULES:
+            importlib.import_module(name).sqlparse = _cached_parse
+    return True
+
+
+def translation_cache_info():
+    """
+    Return the hits, misses and size of the translation cache of this process,
+    or None if it is not installed
+    """
+    if _cached_parse is None:
+        return None
+    info = _cached_parse.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,71 @@
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+# optional at runtime, JSON falls back to DRF's encoder without orjson
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+LINE_SEPARATORS = (
+    ("\u2028".encode(), b"\\u2028"),
+    ("\u2029".encode(), b"\\u2029"),
+)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer encoding with orjson.
+
+    Produces the same compact JSON as DRF's JSONRenderer in a fraction of the
+    CPU time. Pretty printed responses, e.g. `Accept: application/json;
+    indent=4` or the browsable API, still go through the standard encoder, and
+    so does everything when orjson is not installed.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        if (
+            orjson is None
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+        # keep the output a strict javascript subset, like JSONRenderer
+        for separator, escaped in LINE_SEPARATORS:
+            ret = ret.replace(separator, escaped)
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer serializing to MessagePack, requested with
+    `Accept: application/msgpack` or `?format=msgpack`.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if msgpack is None:
+            raise ImproperlyConfigured("MessagePackRenderer requires msgpack.")
+        return msgpack.packb(
+            data, default=encoders.JSONEncoder().default, use_bin_type=True
+        )
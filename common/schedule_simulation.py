@@ -0,0 +1,451 @@
+import random
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.db import connections
+from django.urls import reverse
+from django_celery_beat.models import CrontabSchedule, PeriodicTask
+from django_celery_beat.schedulers import DatabaseScheduler
+from rest_framework.test import APIClient
+
+from chat.models import Event, Message, RecurringMessage
+from chat.sharding import message_shards
+from chat_system.celery import app
+from common.benchmark import SyntheticDataGenerator, percentile
+from common.helper import CRONJOB_TIMEZONE
+
+EVENT_TASK = "chat.tasks.send_event_message"
+MESSAGE_TASK = "chat.tasks.create_schedule_message"
+
+
+class SimulatedClock:
+    """
+    Controllable clock standing in for the time sources of the scheduling path.
+
+    While installed, `django.utils.timezone.now`, the celery app and celery
+    beat, including its periodic sync, and django_celery_beat read the
+    simulated time, so a beat tick and the tasks it runs see the clock as if
+    that much time had passed.
+
+    Attributes:
+        current: The simulated time, an aware UTC datetime.
+    """
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def monotonic(self):
+        return self.current.timestamp()
+
+    def advance_to(self, value):
+        self.current = max(self.current, value)
+
+    def spend(self, seconds):
+        """
+        Let the real time spent on some work pass on the simulated clock
+        """
+        self.current += timedelta(seconds=seconds)
+
+    @contextmanager
+    def installed(self):
+        clock = self
+
+        class ClockDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                if tz is None:
+                    return clock.current.replace(tzinfo=None)
+                return clock.current.astimezone(tz)
+
+            @classmethod
+            def utcnow(cls):
+                return clock.current.replace(tzinfo=None)
+
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch("django.utils.timezone.now", self.now))
+            stack.enter_context(
+                mock.patch(
+                    "django_celery_beat.schedulers.datetime",
+                    SimpleNamespace(datetime=ClockDatetime, timedelta=timedelta),
+                )
+            )
+            stack.enter_context(
+                mock.patch("django_celery_beat.tzcrontab.datetime", ClockDatetime)
+            )
+            stack.enter_context(
+                mock.patch(
+                    "celery.beat.time",
+                    SimpleNamespace(monotonic=self.monotonic, sleep=time.sleep),
+                )
+            )
+            stack.enter_context(
+                mock.patch.object(
+                    app, "now", lambda: self.current.astimezone(app.timezone)
+                )
+            )
+            yield self
+
+
+class RecordingScheduler(DatabaseScheduler):
+    """
+    DatabaseScheduler recording every task it applies and the time spent in it
+    """
+
+    def __init__(self, *args, clock, **kwargs):
+        self.clock = clock
+        self.fired = []
+        self.failed = 0
+        self.task_seconds = 0.0
+        super().__init__(*args, **kwargs)
+
+    def apply_async(self, entry, producer=None, advance=True, **kwargs):
+        self.fired.append((entry.task, entry.args, entry.kwargs, self.clock.now()))
+        started = time.perf_counter()
+        try:
+            return super().apply_async(entry, producer, advance, **kwargs)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.task_seconds += time.perf_counter() - started
+
+
+def task_key(task, args, kwargs):
+    """
+    Return what identifies the scheduled item a task was fired for
+    """
+    data = args[0] if args else kwargs
+    data = data.get("task_data", data) if isinstance(data, dict) else {}
+    return task, data.get("event_id") or data.get("content")
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class SchedulingSimulation:
+    """
+    Fast-forward the signal -> beat -> task scheduling path over months.
+
+    Events, scheduled messages and recurring messages are created at their
+    simulated time through the same code paths as the API: the scheduling
+    tasks dispatched by the post_save signals, run eagerly here, and the
+    message view create the crontabs and periodic tasks. A
+    DatabaseScheduler is then ticked on a simulated clock, skipping straight
+    to its next wake up, and runs the due tasks eagerly. The real time taken
+    by a tick or by creating an item passes on the simulated clock as well. The tasks fired are
+    compared with the times the items were scheduled for.
+
+    Run it inside a throw-away database with `CELERY_TASK_ALWAYS_EAGER` and an
+    in-memory broker, as `manage.py simulate_scheduling` does with
+    chat_system.bench_settings.
+
+    Attributes:
+        days: Simulated duration.
+        max_interval: Longest sleep of beat between two ticks, in seconds.
+        events_per_day: Events created per day.
+        scheduled_messages_per_day: Scheduled messages sent per day.
+        recurring_per_week: Recurring messages created per week.
+        sample_days: Interval between two samples of the table sizes.
+        random: Seeded random generator used for the generated load.
+    """
+
+    def __init__(
+        self,
+        start,
+        days=365,
+        max_interval=300,
+        events_per_day=2,
+        scheduled_messages_per_day=2,
+        recurring_per_week=1,
+        users=20,
+        receptions=20,
+        sample_days=30,
+        seed=0,
+    ):
+        self.start = start
+        self.days = days
+        self.max_interval = max_interval
+        self.events_per_day = events_per_day
+        self.scheduled_messages_per_day = scheduled_messages_per_day
+        self.recurring_per_week = recurring_per_week
+        self.users = users
+        self.receptions = receptions
+        self.sample_days = sample_days
+        self.random = random.Random(seed)
+        self.generator = SyntheticDataGenerator(seed)
+        self.cron_timezone = ZoneInfo(CRONJOB_TIMEZONE)
+        self.expected = defaultdict(list)
+
+    def random_time(self, day_start):
+        return day_start + timedelta(minutes=self.random.randrange(24 * 60))
+
+    def load_plan(self):
+        """
+        Return the (time, kind) items created during the simulation, in order
+        """
+        plan = []
+        for day in range(self.days):
+            day_start = self.start + timedelta(days=day)
+            plan.extend(
+                (self.random_time(day_start), "event")
+                for _ in range(self.events_per_day)
+            )
+            plan.extend(
+                (self.random_time(day_start), "scheduled_message")
+                for _ in range(self.scheduled_messages_per_day)
+            )
+            if day % 7 == 0:
+                plan.extend(
+                    (self.random_time(day_start), "recurring")
+                    for _ in range(self.recurring_per_week)
+                )
+        return sorted(plan)
+
+    def lead_time(self):
+        # whole minutes, crontabs have a one minute resolution
+        return timedelta(minutes=self.random.randrange(60, 60 * 24 * 60))
+
+    def create_event(self, now, index):
+        schedule_on = now + self.lead_time()
+        event = Event.objects.create(
+            title=f"simulated event {index}",
+            organize_by=self.random.choice(self.chat_users),
+            schedule_on=schedule_on,
+            description=f"simulated event {index}",
+        )
+        self.expected[(EVENT_TASK, event.id)].append(schedule_on)
+
+    def send_scheduled_message(self, now, index):
+        sender = self.random.choice(self.chat_users)
+        scheduled_time = (now + self.lead_time()).astimezone(self.cron_timezone)
+        content = f"simulated scheduled message {index}"
+        self.client.force_authenticate(sender)
+        self.client.post(
+            reverse("chat:message-list-create"),
+            {
+                "sender": sender.id,
+                "receiver": self.random.choice(self.chat_users).id,
+                "content": content,
+                "scheduled_time": scheduled_time.strftime("%Y-%m-%dT%H:%M"),
+            },
+            format="json",
+        )
+        self.expected[(MESSAGE_TASK, content)].append(scheduled_time)
+
+    def create_recurring_message(self, now, index):
+        sender = self.random.choice(self.chat_users)
+        message = Message.objects.create(
+            sender=sender,
+            receiver=self.random.choice(self.chat_users),
+            content=f"simulated recurring message {index}",
+        )
+        start_date = now + self.lead_time()
+        recurring_message = RecurringMessage.objects.create(
+            message=message,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=self.random.randint(7, 180)),
+            schedule=self.random.choice(["daily", "weekly", "monthly"]),
+        )
+        self.expected[(MESSAGE_TASK, message.content)].extend(
+            recurring_message.schedule_dates()
+        )
+
+    def sample_rows(self, now):
+        return {
+            "at": now.isoformat(),
+            "periodic_tasks": PeriodicTask.objects.count(),
+            "enabled_periodic_tasks": PeriodicTask.objects.filter(
+                enabled=True
+            ).count(),
+            "crontab_schedules": CrontabSchedule.objects.count(),
+            "messages": sum(
+                Message.objects.using(alias).count() for alias in message_shards()
+            ),
+            "events": Event.objects.count(),
+            "recurring_messages": RecurringMessage.objects.count(),
+        }
+
+    def run(self):
+        """
+        Run the simulation and return its report.
+
+        Returns:
+            dict: Tasks fired, missed, duplicated and fired at an unexpected
+                  time, the cost of the beat ticks and the table sizes over
+                  time.
+        """
+        self.chat_users = self.generator.create_users(self.users)
+        reception_users = self.chat_users + self.generator.create_users(
+            max(0, self.receptions - self.users)
+        )
+        self.generator.create_message_setting(reception_users[: self.receptions])
+        self.client = APIClient()
+
+        end = self.start + timedelta(days=self.days)
+        plan = self.load_plan()
+        creators = {
+            "event": self.create_event,
+            "scheduled_message": self.send_scheduled_message,
+            "recurring": self.create_recurring_message,
+        }
+        clock = SimulatedClock(self.start)
+        counter = QueryCounter()
+        tick_samples = []
+        period_ticks = defaultdict(list)
+        samples = []
+        next_sample = self.start
+        position = 0
+
+        with clock.installed(), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            scheduler = RecordingScheduler(
+                app=app, max_interval=self.max_interval, clock=clock
+            )
+            while clock.now() < end:
+                while position < len(plan) and plan[position][0] <= clock.now():
+                    started = time.perf_counter()
+                    creators[plan[position][1]](clock.now(), position)
+                    clock.spend(time.perf_counter() - started)
+                    position += 1
+                now = clock.now()
+                if now >= next_sample:
+                    samples.append(self.sample_rows(now))
+                    next_sample += timedelta(days=self.sample_days)
+
+                task_seconds = scheduler.task_seconds
+                queries = counter.count
+                fired = len(scheduler.fired)
+                started = time.perf_counter()
+                delay = scheduler.tick()
+                clock.spend(time.perf_counter() - started)
+                elapsed = (
+                    time.perf_counter() - started - scheduler.task_seconds + task_seconds
+                )
+                tick_samples.append((elapsed * 1000, counter.count - queries))
+                period = (now - self.start).days // self.sample_days
+                period_ticks[period].append(elapsed * 1000)
+
+                if len(scheduler.fired) == fired:
+                    # beat wakes up 10ms early and busy-waits the rest
+                    delay = max(delay, 0.01)
+                wake_up = clock.now() + timedelta(seconds=delay)
+                if position < len(plan):
+                    wake_up = min(wake_up, plan[position][0])
+                clock.advance_to(min(wake_up, next_sample, end))
+            samples.append(self.sample_rows(clock.now()))
+
+        return {
+            "parameters": {
+                "start": self.start.isoformat(),
+                "days": self.days,
+                "max_interval": self.max_interval,
+                "events_per_day": self.events_per_day,
+                "scheduled_messages_per_day": self.scheduled_messages_per_day,
+                "recurring_per_week": self.recurring_per_week,
+                "users": self.users,
+                "receptions": self.receptions,
+            },
+            "tasks": self.match_fired(scheduler, end),
+            "ticks": self.tick_report(tick_samples, period_ticks),
+            "rows": samples,
+        }
+
+    def match_fired(self, scheduler, end):
+        """
+        Compare the fired tasks with the times their items were scheduled for.
+
+        A fire counts for a scheduled time when it happens within one beat
+        interval and a minute after it. Scheduled times left without a fire
+        are missed, extra fires for the same time are duplicates, and fires
+        matching no scheduled time, e.g. in the wrong timezone, are
+        unexpected.
+        """
+        tolerance = timedelta(seconds=self.max_interval + 60)
+        fired = defaultdict(list)
+        other = defaultdict(int)
+        for task, args, kwargs, at in scheduler.fired:
+            key = task_key(task, args, kwargs)
+            if key in self.expected:
+                fired[key].append(at)
+            else:
+                other[task] += 1
+
+        counts = defaultdict(int)
+        lateness = []
+        for key, scheduled in self.expected.items():
+            fires = sorted(fired[key])
+            used = set()
+            for at in sorted(scheduled):
+                if at + tolerance > end:
+                    counts["pending"] += 1
+                    continue
+                first = bisect_left(fires, at)
+                matches = [
+                    index
+                    for index in range(first, len(fires))
+                    if fires[index] < at + tolerance
+                ]
+                if not matches:
+                    counts["missed"] += 1
+                    continue
+                counts["fired"] += 1
+                counts["duplicated"] += len(matches) - 1
+                lateness.append((fires[matches[0]] - at).total_seconds())
+                used.update(matches)
+            counts["unexpected"] += len(fires) - len(used)
+
+        lateness.sort()
+        return {
+            "scheduled": sum(len(times) for times in self.expected.values()),
+            "fired": counts["fired"],
+            "missed": counts["missed"],
+            "duplicated": counts["duplicated"],
+            "unexpected": counts["unexpected"],
+            "pending": counts["pending"],
+            "failed": scheduler.failed,
+            "lateness_p50_s": percentile(lateness, 50),
+            "lateness_max_s": lateness[-1] if lateness else 0.0,
+            "other_tasks": dict(other),
+        }
+
+    def tick_report(self, tick_samples, period_ticks):
+        durations = sorted(duration for duration, _ in tick_samples)
+        queries = [count for _, count in tick_samples]
+        return {
+            "count": len(tick_samples),
+            "mean_ms": sum(durations) / len(durations) if durations else 0.0,
+            "p50_ms": percentile(durations, 50),
+            "p99_ms": percentile(durations, 99),
+            "max_ms": durations[-1] if durations else 0.0,
+            "mean_queries": sum(queries) / len(queries) if queries else 0.0,
+            "max_queries": max(queries, default=0),
+            "mean_ms_per_period": [
+                sum(period_ticks[period]) / len(period_ticks[period])
+                for period in sorted(period_ticks)
+            ],
+        }
+
+
+def default_start():
+    """
+    Return midnight UTC of the current day, the default simulation start
+    """
+    return datetime.now(dt_timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
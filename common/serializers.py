@@ -0,0 +1,31 @@
+FIELDS_QUERY_PARAM = "fields"
+
+
+def requested_fields(request):
+    """
+    Return the field names listed in `?fields=`, or None when not given
+    """
+    if request is None or request.method != "GET":
+        return None
+    fields = request.query_params.get(FIELDS_QUERY_PARAM)
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(",") if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin limiting the representation to the `?fields=` parameter.
+
+    Only serializers built with the request in their context are pruned, i.e.
+    the view's serializer and, for lists, its child. The other fields are
+    dropped before anything is serialized, so their attribute and related
+    lookups never run. Unknown names are ignored.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get("request"))
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
@@ -0,0 +1,195 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from common.auth import get_token_user_id
+
+# Refill and consume a bucket in one atomic step on the redis server.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a DRF style rate such as "10/s" or "5/min" into tokens per second
+    """
+    num, period = rate.split("/")
+    return int(num) / PERIODS[period[0]]
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every process through the cache.
+
+    With a django-redis cache the refill and the consumption run atomically in
+    a redis script, costing a single round trip. Other cache backends fall back
+    to a read-modify-write under a process-local lock, which is only atomic
+    within one process and is meant for development and tests.
+
+    Attributes:
+        rate: Tokens added to the bucket per second.
+        capacity: Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    _lock = threading.Lock()
+    _scripts = {}
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+
+    @classmethod
+    def get_script(cls):
+        if "script" not in cls._scripts:
+            try:
+                from django_redis import get_redis_connection
+
+                cls._scripts["script"] = get_redis_connection(
+                    "default"
+                ).register_script(TOKEN_BUCKET_SCRIPT)
+            except (ImportError, NotImplementedError):
+                cls._scripts["script"] = None
+        return cls._scripts["script"]
+
+    def consume(self, key, cost=1):
+        """
+        Take `cost` tokens, return the seconds to wait or 0 when admitted
+        """
+        now = time.time()
+        script = self.get_script()
+        if script is not None:
+            return float(
+                script(keys=[key], args=[self.rate, self.capacity, now, cost])
+            )
+
+        with self._lock:
+            tokens, ts = cache.get(key) or (self.capacity, now)
+            tokens = min(self.capacity, tokens + max(0, now - ts) * self.rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate
+            cache.set(key, (tokens, now), int(self.capacity / self.rate) + 1)
+        return wait
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base DRF throttle admitting requests through a shared token bucket.
+
+    Views opt in by mapping the throttle's `kind` to a bucket configured in
+    settings.TOKEN_BUCKETS, e.g. `token_bucket_scopes = {"user": "message_send"}`,
+    and can limit throttling to some methods with `token_bucket_methods`.
+    Identities are derived without touching the database.
+    """
+
+    kind = None
+
+    def get_bucket_ident(self, request):
+        raise NotImplementedError(".get_bucket_ident() must be overridden")
+
+    def get_bucket(self, view):
+        scope = getattr(view, "token_bucket_scopes", {}).get(self.kind)
+        if scope is None:
+            return None, None
+        config = settings.TOKEN_BUCKETS[scope]
+        rate = parse_rate(config["rate"])
+        return scope, TokenBucket(rate, config.get("burst", max(1, rate)))
+
+    def allow_request(self, request, view):
+        self.wait_time = 0
+        methods = getattr(view, "token_bucket_methods", None)
+        if methods is not None and request.method not in methods:
+            return True
+
+        scope, bucket = self.get_bucket(view)
+        ident = self.get_bucket_ident(request)
+        if bucket is None or ident is None:
+            return True
+
+        self.wait_time = bucket.consume(f"throttle:{scope}:{ident}")
+        return self.wait_time == 0
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Bucket per authenticated user, read from the JWT claims, or per client IP
+    """
+
+    kind = "user"
+
+    def get_bucket_ident(self, request):
+        user_id = get_token_user_id(request)
+        if user_id is not None:
+            return f"user-{user_id}"
+        return f"ip-{self.get_ident(request)}"
+
+
+class PhoneNumberTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Bucket per phone number submitted in the request body
+    """
+
+    kind = "phone"
+
+    def get_bucket_ident(self, request):
+        if not isinstance(request.data, dict):
+            # a JSON list or scalar body, rejected by the view's serializer
+            return None
+        phone_number = request.data.get("phone_number")
+        return phone_number and f"phone-{phone_number}"
+
+
+class GlobalTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Single bucket shared by every request to the view
+    """
+
+    kind = "global"
+
+    def get_bucket_ident(self, request):
+        return "global"
+
+
+class ThrottleFirstMixin:
+    """
+    Mixin running the view's throttles before authentication.
+
+    Authentication costs a user lookup, checking the throttles first rejects a
+    burst with `429` and `Retry-After` before any database work happens.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self.check_throttles(request)
+        self.throttles_checked = True
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        if not getattr(self, "throttles_checked", False):
+            super().check_throttles(request)
@@ -0,0 +1,69 @@
+import hashlib
+
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from chat_system.db_routers import replica_reads
+from common.cache import get_version, page_cache_timeout
+
+
+class VersionedCacheMixin:
+    """
+    Mixin answering GET requests from a cheap per-owner version counter.
+
+    The version of `version_scope` is bumped on every write affecting the
+    owner's data, so a matching `If-None-Match` is answered with `304` after a
+    single cache lookup, and serialized pages are cached keyed by the version.
+    A page missing from the cache is read from the primary database, it is
+    stored under the version read before it and must include every write
+    counted in that version.
+
+    Attributes:
+        version_scope: Name of the version counter guarding the view's data.
+    """
+
+    version_scope = None
+
+    def get_version_owner(self):
+        return self.request.user.id
+
+    def get_etag(self, owner_id, version):
+        representation = "|".join(
+            (
+                self.request.get_full_path(),
+                self.request.META.get("HTTP_ACCEPT", ""),
+            )
+        )
+        digest = hashlib.md5(representation.encode()).hexdigest()[:16]
+        return f'W/"{owner_id}-{version}-{digest}"'
+
+    def get(self, request, *args, **kwargs):
+        owner_id = self.get_version_owner()
+        if owner_id is None:
+            return super().get(request, *args, **kwargs)
+
+        etag = self.get_etag(owner_id, get_version(self.version_scope, owner_id))
+        client_etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if "*" in client_etags or etag.removeprefix("W/") in {
+            client_etag.removeprefix("W/") for client_etag in client_etags
+        }:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache_key = f"page:{self.version_scope}:{etag}"
+            data = cache.get(cache_key)
+            if data is None:
+                # a lagging replica could store a stale page under the new version
+                with replica_reads(False):
+                    response = super().get(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(cache_key, response.data, page_cache_timeout())
+            else:
+                response = Response(data)
+
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Accept", "Authorization"))
+        return response